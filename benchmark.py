@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+import tempfile
+from time import perf_counter
+import numpy as np
+import pandas as pd
+import cache
+import util
+import rounds
+import synthetic
+import merge_demo_files as merger
+import cursor_movement
+import player_similarity
+import heatmaps
+import trajectory
+import spectral
+import kernels
+
+BASELINE_FILE = './benchmarks/baseline.json'
+
+default_sizes = [10_000, 1_000_000, 10_000_000]
+
+merge_props = ['X', 'Y', 'Z', 'velocity', 'pitch', 'yaw', 'ducking', 'is_airborne']
+
+def split_first_player(ticks: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # The first player plays the new player, compared against everyone else, like `player_similarity.evaluate_players`
+    is_first = ticks['name'] == ticks['name'].iloc[0]
+    return ticks[is_first], ticks[~is_first]
+
+def bench_merge_demo_files(ticks: pd.DataFrame, folder: str):
+    synthetic.write_parsed_demos(ticks, folder, merge_props)
+    return lambda: merger.merge_demo_files(folder, merge_props, save=False)
+
+def bench_split_list_columns(ticks: pd.DataFrame, folder: str):
+    return lambda: util.split_list_columns(ticks)
+
+def bench_compute_derivatives(ticks: pd.DataFrame, folder: str):
+    columns = ticks[['name', 'pitch', 'yaw']]
+    return lambda: cursor_movement.compute_derivatives(columns.copy(), ['yaw', 'pitch'])
+
+def bench_location_wasserstein(ticks: pd.DataFrame, folder: str):
+    new, known = split_first_player(ticks)
+    return lambda: player_similarity.compute_location_similarity_wasserstein(new, known)
+
+def bench_cursor_wasserstein(ticks: pd.DataFrame, folder: str):
+    new, known = split_first_player(ticks[['name', 'pitch', 'yaw']])
+    return lambda: player_similarity.compute_cursor_similarity_wasserstein(new.copy(), known.copy())
+
+def bench_cursor_jensenshannon(ticks: pd.DataFrame, folder: str):
+    new, known = split_first_player(ticks[['name', 'pitch', 'yaw']])
+    return lambda: player_similarity.compute_cursor_similarity_jensenshannon(new.copy(), known.copy())
+
+def bench_location_sketch(ticks: pd.DataFrame, folder: str):
+    def run():
+        sketches = {}
+        player_similarity.accumulate_location_sketches(sketches, ticks)
+        new = ticks['name'].iloc[0]
+        return [player_similarity.compute_location_similarity_sketch(sketches[new], sketch) for sketch in sketches.values()]
+    return run
+
+def bench_trajectory_dtw(ticks: pd.DataFrame, folder: str):
+    ticks = pd.concat([rounds.assign_phases(match_ticks, synthetic.generate_events(match_ticks['tick'].max() + 1)) for _, match_ticks in ticks.groupby('match', sort=False)])
+    new, known = split_first_player(ticks)
+    return lambda: [trajectory.compute_trajectory_similarity(new, player_ticks) for _, player_ticks in known.groupby('name')]
+
+def bench_spectral_features(ticks: pd.DataFrame, folder: str):
+    return lambda: [spectral.compute_spectra(match_ticks) for _, match_ticks in ticks.groupby('match', sort=False)]
+
+def bench_occupancy_grid(ticks: pd.DataFrame, folder: str):
+    return lambda: heatmaps.accumulate_occupancy({}, ticks)
+
+def bench_generate_heatmap(ticks: pd.DataFrame, folder: str):
+    new, _ = split_first_player(ticks)
+    # Without a save path the figure is only computed, not written
+    return lambda: heatmaps.generate_heatmap(new, new['map'].iloc[0], "Benchmark", None, None)
+
+# Name -> (setup returning the function to time, largest number of rows it is run on)
+benchmarks = {
+    'merge_demo_files': (bench_merge_demo_files, None),
+    'split_list_columns': (bench_split_list_columns, None),
+    'compute_derivatives': (bench_compute_derivatives, None),
+    'location_wasserstein': (bench_location_wasserstein, None),
+    'cursor_wasserstein': (bench_cursor_wasserstein, None),
+    'cursor_jensenshannon': (bench_cursor_jensenshannon, None),
+    'location_sketch': (bench_location_sketch, None),
+    'trajectory_dtw': (bench_trajectory_dtw, None),
+    'spectral_features': (bench_spectral_features, None),
+    'occupancy_grid': (bench_occupancy_grid, None),
+    # The KDE scales with the number of points times the grid size, so it is not run on the largest frames
+    'generate_heatmap': (bench_generate_heatmap, 1_000_000),
+}
+
+# Entry points whose startup time is benchmarked
+cli_modules = ['heatmaps', 'boxplots', 'scatterplots', 'distributions', 'cursor_movement', 'player_similarity', 'parser_log']
+
+def time_function(function, repeat: int) -> float:
+    """
+    Best wall time of `repeat` runs, in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return min(times)
+
+def run_benchmarks(sizes: list, names: list, repeat: int = 3, seed: int = 0) -> dict:
+    """
+    Runs the benchmarks `names` on synthetic ticks of every size in `sizes`.
+
+    :return: {benchmark name: {size: seconds}}
+    """
+    # Load the dependencies the hot paths import lazily, so their import time is not counted in the first run
+    import scipy.stats, scipy.spatial.distance, seaborn, matplotlib.pyplot
+
+    results = {name: {} for name in names}
+    for size in sizes:
+        print(f"Generating {size} synthetic ticks")
+        ticks = synthetic.generate_ticks(size, seed=seed)
+
+        with tempfile.TemporaryDirectory() as folder:
+            # Keep benchmark entries out of the real cache
+            cache.configure(directory=os.path.join(folder, 'cache'))
+            for name in names:
+                setup, max_rows = benchmarks[name]
+                if max_rows is not None and size > max_rows:
+                    continue
+                seconds = time_function(setup(ticks, os.path.join(folder, name)), repeat)
+                results[name][str(size)] = seconds
+                print(f"{name} ({size} rows): {seconds:.4f}s")
+
+    return results
+
+def run_startup_benchmarks(modules: list, repeat: int = 3) -> dict:
+    """
+    Times a fresh interpreter importing every module in `modules`. This is what every run of its CLI pays before
+    doing any work, including runs that are served from the cache and `--help`.
+
+    :return: {'startup_<module>': {'import': seconds}}
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in modules:
+        seconds = time_function(lambda: subprocess.run([sys.executable, '-c', f'import {module}'], cwd=directory, check=True), repeat)
+        results[f'startup_{module}'] = {'import': seconds}
+        print(f"{module} startup: {seconds:.4f}s")
+
+    return results
+
+def check_kernels(ticks: pd.DataFrame) -> dict:
+    """
+    Runs every kernel with the selected backend and with the numpy versions, on the same ticks.
+
+    :return: {kernel name: largest absolute difference between the two}
+    """
+    codes, players = pd.factorize(ticks['name'])
+    positions = ticks[['X', 'Y']].to_numpy().T
+    new, known = split_first_player(ticks)
+    runs = {
+        'derivatives': lambda: kernels.derivatives(ticks['yaw'].to_numpy(), codes),
+        'histograms': lambda: kernels.histograms(positions, 50),
+        'wasserstein': lambda: kernels.wasserstein(new[['X', 'Y']].to_numpy().T, known[['X', 'Y']].to_numpy().T),
+        'binned_counts': lambda: kernels.binned_counts(positions, codes, len(players), kernels.location_edges),
+        'grid_counts': lambda: kernels.grid_counts(positions[0], positions[1], codes, len(players), kernels.location_edges),
+    }
+
+    selected = kernels.get_backend()
+    differences = {}
+    for name, run in runs.items():
+        result = run()
+        kernels.use_backend('numpy')
+        expected = run()
+        kernels.use_backend(selected)
+        differences[name] = float(np.nanmax(np.abs(result - expected))) if result.size else 0.0
+    return differences
+
+def compare(results: dict, baseline: dict):
+    print(f"\n{'benchmark':<24}{'rows':>12}{'baseline':>12}{'current':>12}{'speedup':>10}")
+    for name, sizes in results.items():
+        for size, seconds in sizes.items():
+            reference = baseline['results'].get(name, {}).get(size)
+            if reference is None:
+                print(f"{name:<24}{size:>12}{'-':>12}{seconds:>11.4f}s{'-':>10}")
+            else:
+                print(f"{name:<24}{size:>12}{reference:>11.4f}s{seconds:>11.4f}s{reference / seconds:>9.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis hot paths on synthetic ticks, and compare them to a recorded baseline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help='Numbers of ticks to benchmark on')
+    parser.add_argument('--only', type=str, nargs='+', default=list(benchmarks.keys()), choices=list(benchmarks.keys()), help='Benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark, the fastest one is reported')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data')
+    parser.add_argument('--baseline', type=str, default=BASELINE_FILE, help='Baseline file to compare to, or to record')
+    parser.add_argument('--record', action='store_true', help='Record the results in the baseline, replacing earlier results of the same benchmarks')
+    parser.add_argument('--startup', action='store_true', help='Benchmark the import time of the CLIs instead of the hot paths')
+    parser.add_argument('--kernels', type=str, default=None, choices=kernels.backends, help='Backend of the kernels, defaults to numba if installed, otherwise numpy')
+    parser.add_argument('--check', action='store_true', help='Check the kernels of the selected backend against the numpy versions on the smallest size, instead of benchmarking')
+    args = parser.parse_args()
+    kernels.use_backend(args.kernels)
+
+    if args.check:
+        print(f"Checking the {kernels.get_backend()} kernels on {min(args.sizes)} synthetic ticks")
+        differences = check_kernels(synthetic.generate_ticks(min(args.sizes), seed=args.seed))
+        for name, difference in differences.items():
+            print(f"{name:<24}{difference:>12.3g}")
+        if max(differences.values()) > 1e-6:
+            sys.exit("Kernels differ from the numpy versions")
+        return
+
+    if args.startup:
+        results = run_startup_benchmarks(cli_modules, args.repeat)
+    else:
+        results = run_benchmarks(args.sizes, args.only, args.repeat, args.seed)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+
+    if args.record:
+        baseline = baseline or {'results': {}}
+        baseline.update({'machine': platform.platform(), 'python': platform.python_version(), 'kernels': kernels.get_backend()})
+        for name, sizes in results.items():
+            baseline['results'].setdefault(name, {}).update(sizes)
+
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=2)
+        print(f"Recorded baseline to {args.baseline}")
+    elif baseline is not None:
+        compare(results, baseline)
+
+if __name__ == '__main__':
+    main()
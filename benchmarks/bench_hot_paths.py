@@ -0,0 +1,31 @@
+# The hot paths of `benchmark.py` as a pytest-benchmark suite, on the same synthetic ticks. Not collected by a plain
+# `pytest` run, the 10M row frames take minutes. Record a baseline and compare to it with
+#   python -m pytest benchmarks/bench_hot_paths.py --benchmark-autosave
+#   python -m pytest benchmarks/bench_hot_paths.py --benchmark-compare --benchmark-compare-fail=min:20%
+# and pick the sizes with e.g. `--sizes 10000 1000000`
+import pytest
+import cache
+import synthetic
+import benchmark as hot_paths
+
+pytest.importorskip('pytest_benchmark')
+
+
+@pytest.fixture(scope='module')
+def ticks(size):
+    # Load the dependencies the hot paths import lazily, so their import time is not counted in the first round
+    import scipy.stats, scipy.spatial.distance, seaborn, matplotlib.pyplot
+    return synthetic.generate_ticks(size, seed=0)
+
+
+@pytest.mark.parametrize('name', list(hot_paths.benchmarks))
+def test_hot_path(benchmark, name, size, ticks, tmp_path, monkeypatch):
+    setup, max_rows = hot_paths.benchmarks[name]
+    if max_rows is not None and size > max_rows:
+        pytest.skip(f"{name} is not run on more than {max_rows} rows")
+
+    # Keep benchmark entries out of the real cache
+    monkeypatch.setattr(cache, 'cache_dir', str(tmp_path / 'cache'))
+    benchmark.group = f"{size} rows"
+    benchmark.extra_info['rows'] = size
+    benchmark(setup(ticks, str(tmp_path / name)))
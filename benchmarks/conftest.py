@@ -0,0 +1,17 @@
+import os
+import sys
+
+# The modules live in the repository root, next to the CLIs that import them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+
+
+def pytest_addoption(parser):
+    parser.addoption('--sizes', type=int, nargs='+', default=benchmark.default_sizes, help='Numbers of synthetic ticks to benchmark the hot paths on')
+
+
+def pytest_generate_tests(metafunc):
+    # Module scoped, so the synthetic ticks of a size are generated once for all hot paths
+    if 'size' in metafunc.fixturenames:
+        metafunc.parametrize('size', metafunc.config.getoption('sizes'), scope='module')
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+import profiling
+import downsampling
+import kernels
+import spectral
+import trajectory
+
+# Number of bootstrap resamples, and the coverage of the reported intervals
+resamples = 1000
+confidence = 0.95
+# Length of the tick blocks that are resampled when the ticks have no round annotations, in ticks
+block_ticks = 5 * downsampling.TICKRATE
+
+
+def resample_units(ticks: pd.DataFrame) -> tuple[np.ndarray, int]:
+    """
+    Assigns every row to the unit that is resampled as a whole, so the autocorrelation within a unit is kept:
+    its (match, round) if the ticks have round annotations, otherwise its (match, block of `block_ticks` ticks).
+
+    :return: (unit of every row, number of units)
+    """
+    block = ticks['round'] if 'round' in ticks.columns else ticks['tick'] // block_ticks
+    codes, uniques = pd.MultiIndex.from_arrays([ticks['match'], block]).factorize()
+    return codes, len(uniques)
+
+
+def resample_weights(units: int, rng: np.random.Generator, count: int = None) -> np.ndarray:
+    """
+    Draws all resamples at once as one index matrix, and counts how often every unit is drawn in each resample.
+
+    :return: Matrix of shape (resamples, units), every row summing to `units`
+    """
+    count = count or resamples
+    drawn = rng.integers(0, units, (count, units)) + np.arange(count)[:, None] * units
+    return np.bincount(drawn.ravel(), minlength=count * units).reshape(count, units).astype('float64')
+
+
+def interval(estimate: float, deviations: np.ndarray) -> tuple[float, float]:
+    """
+    Basic (pivot) confidence interval of `estimate` from the deviations of the resampled estimates around the
+    full-sample estimate, clipped to the [0, 1] range of the similarities. The deviations are mirrored around the
+    estimate, so a score at its bound, e.g. a player compared with themselves, stays inside its own interval.
+
+    :return: (low, high), NaN if no resample has a value
+    """
+    deviations = deviations[~np.isnan(deviations)]
+    if len(deviations) == 0:
+        return np.nan, np.nan
+    low, high = np.percentile(deviations, [50 * (1 - confidence), 50 * (1 + confidence)])
+    return float(np.clip(estimate - high, 0, 1)), float(np.clip(estimate - low, 0, 1))
+
+
+def _unit_histograms(values: np.ndarray, units: np.ndarray, count: int) -> np.ndarray:
+    # The bins of the location sketches
+    bins = len(kernels.location_edges) - 1
+    position = np.searchsorted(kernels.location_edges, values, side='right') - 1
+    # Same closed last bin as np.histogram, values outside the edges are dropped
+    position[values == kernels.location_edges[-1]] = bins - 1
+    inside = (position >= 0) & (position < bins)
+    return np.bincount(units[inside] * bins + position[inside], minlength=count * bins).reshape(count, bins).astype('float64')
+
+
+def _histogram_distance(new_counts: np.ndarray, known_counts: np.ndarray) -> np.ndarray:
+    # Normalized distance of `player_similarity.compute_location_similarity_sketch` for a single axis, batched over rows of counts
+    bin_width = kernels.location_edges[1] - kernels.location_edges[0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        new_cdf = np.cumsum(new_counts, axis=-1) / new_counts.sum(axis=-1, keepdims=True)
+        known_cdf = np.cumsum(known_counts, axis=-1) / known_counts.sum(axis=-1, keepdims=True)
+    distance = np.abs(new_cdf - known_cdf).sum(axis=-1) * bin_width
+    return np.minimum(distance / kernels.max_location_distance, 1.0)
+
+
+def location_bootstrap(new_features: pd.DataFrame, known_features: pd.DataFrame, rng: np.random.Generator) -> tuple[float, np.ndarray]:
+    """
+    Location similarity, and its resampled values around it, resampling the units of both players. Both are computed
+    on location histograms, like `player_similarity.compute_location_similarity_sketch`, where every resample is a
+    weighted sum of the histograms of its units.
+    """
+    distances, full_distances = [], []
+    new_units, new_count = resample_units(new_features)
+    known_units, known_count = resample_units(known_features)
+    new_weights = resample_weights(new_count, rng)
+    known_weights = resample_weights(known_count, rng)
+    for axis in ['X', 'Y']:
+        new_histograms = _unit_histograms(new_features[axis].to_numpy(), new_units, new_count)
+        known_histograms = _unit_histograms(known_features[axis].to_numpy(), known_units, known_count)
+        full = _histogram_distance(new_histograms.sum(axis=0), known_histograms.sum(axis=0))
+        full_distances.append(full)
+        distances.append(_histogram_distance(new_weights @ new_histograms, known_weights @ known_histograms) - full)
+
+    # The similarity is one minus the mean normalized distance of both axes
+    return 1 - float(np.mean(full_distances)), -np.mean(distances, axis=0)
+
+
+def trajectory_bootstrap(new_features: pd.DataFrame, known_features: pd.DataFrame, rng: np.random.Generator) -> tuple[float, np.ndarray]:
+    """
+    Trajectory similarity, and its resampled values around it. The rounds of the new player are resampled, reusing
+    the nearest neighbour distance of every round, so no resample runs the DTW again.
+    """
+    distances = trajectory.round_distances(new_features, known_features)
+    if len(distances) == 0:
+        return 0, np.full(resamples, np.nan)
+    estimate = trajectory.distance_similarity(distances.mean())
+    weights = resample_weights(len(distances), rng)
+    return estimate, trajectory.distance_similarity(weights @ distances / len(distances)) - estimate
+
+
+def spectral_bootstrap(new_features: pd.DataFrame, known_vector: np.ndarray, rng: np.random.Generator) -> tuple[float, np.ndarray]:
+    """
+    Spectral similarity of the new player's ticks to a known band vector, and its resampled values around it.
+    Welch windows are resampled in blocks of `block_ticks` ticks, since overlapping windows are correlated.
+    """
+    powers, blocks = [], []
+    for match, match_ticks in new_features.groupby('match', sort=False):
+        match_powers, starts = spectral.window_band_powers(match_ticks.sort_values('tick', kind='stable'))
+        powers.append(match_powers)
+        blocks.append(pd.DataFrame({'match': match, 'tick': starts}))
+    powers = np.concatenate(powers) if powers else np.empty((0, len(spectral.feature_columns())))
+    if len(powers) == 0:
+        return 0, np.full(resamples, np.nan)
+
+    units, count = resample_units(pd.concat(blocks, ignore_index=True))
+    unit_powers = np.zeros((count, powers.shape[1]))
+    np.add.at(unit_powers, units, powers)
+
+    estimate = spectral.compute_spectral_similarity(spectral.band_fractions(unit_powers.sum(axis=0))[0], known_vector)
+    resampled = spectral.band_fractions(resample_weights(count, rng) @ unit_powers)
+    # Batched `spectral.compute_spectral_similarity`
+    difference = np.abs(resampled - known_vector).reshape(len(resampled), len(spectral.spectral_props), len(spectral.bands))
+    return estimate, 1 - difference.sum(axis=-1).mean(axis=-1) / 2 - estimate
+
+
+def similarity_intervals(estimates: dict, deviations: dict, weights: dict) -> dict:
+    """
+    Confidence intervals of every metric and of their weighted combination. Resamples of different metrics are
+    paired by index, so the combined interval is that of the weighted mean of the resampled metrics. A resample
+    without a value for one of the metrics has no combined value either, so a metric without any resamples, e.g.
+    spectra of downsampled ticks, leaves the combined interval NaN rather than narrower.
+
+    :param estimates: {metric: full-sample similarity}
+    :param deviations: {metric: resampled similarities minus the full-sample similarity}
+    :return: {metric or 'combined': (estimate, low, high)}
+    """
+    with profiling.stage('bootstrap'):
+        intervals = {metric: (estimates[metric],) + interval(estimates[metric], deviations[metric]) for metric in estimates}
+        total = sum(weights[metric] for metric in estimates)
+        combined = sum(weights[metric] * estimates[metric] for metric in estimates) / total
+        combined_deviations = sum(weights[metric] * deviations[metric] for metric in estimates) / total
+        intervals['combined'] = (combined,) + interval(combined, combined_deviations)
+        return intervals
@@ -1,13 +1,15 @@
 import os
 import merge_demo_files as merger
+import profiling
+import downsampling
+import rounds
 import argparse
 import util
 import matplotlib
 matplotlib.use('Agg')
 matplotlib.rcParams['figure.max_open_warning'] = 0  # Prevents max figure warnings
-import matplotlib.pyplot as plt
-import seaborn as sns
 import pandas as pd
+from typing import List
 
 players_of_interest = [
     "ZywOo",
@@ -17,6 +19,90 @@ players_of_interest = [
     "apEX",
 ]
 
+# Velocity bands (in units/s) turned into boolean fields, e.g. `velocity_walking`
+velocity_bands = {
+    "standing": (0, 10),
+    "walking": (10, 150),
+    "running": (150, float("inf")),
+}
+
+percentiles = [0.25, 0.5, 0.75]
+
+# Demo props used to split the summary further than (name, match).
+# Rounds come from the round events of the demo instead, and the side from the team_num at the start of the round,
+# see `rounds.assign_phases`
+split_props = {
+    "round": None,
+    "side": "team_num",
+}
+
+def add_velocity_bands(ticks: pd.DataFrame, field: str = 'velocity') -> List[str]:
+    """
+    Adds one boolean column per entry in `velocity_bands`, named `<field>_<band>`.
+
+    :param ticks: DataFrame containing the velocity field
+    :param field: The velocity field to split into bands
+    :return: The names of the added columns
+    """
+    if field not in ticks.columns:
+        raise ValueError(f"Field '{field}' not found in DataFrame")
+
+    band_fields = []
+    for band, (low, high) in velocity_bands.items():
+        ticks[f'{field}_{band}'] = (ticks[field] >= low) & (ticks[field] < high)
+        band_fields.append(f'{field}_{band}')
+
+    return band_fields
+
+def compute_summary_table(ticks: pd.DataFrame, fields: List[str], group_by: List[str] = None) -> pd.DataFrame:
+    """
+    Computes count, sum, mean and percentiles for many boolean/numeric fields in one grouped pass.
+    For boolean fields the mean is the fraction of time the player spends in that state.
+
+    :param ticks: DataFrame containing the `group_by` columns and the specified fields
+    :param fields: The boolean/numeric fields to summarize
+    :param group_by: The columns to group by, e.g. ['name', 'match', 'round', 'side']. Defaults to ['name', 'match']
+    :return: Tidy DataFrame with one row per group and field, and columns
+             `group_by + ['field', 'kind', 'count', 'sum', 'mean', 'p25', 'p50', 'p75']`
+    """
+    group_by = ['name', 'match'] if group_by is None else list(group_by)
+    if ticks.empty:
+        # No demos, or all of them filtered out, the loaders then return a frame without columns
+        return pd.DataFrame(columns=group_by + ['field', 'kind', 'count', 'sum', 'mean'] + [f'p{round(q * 100)}' for q in percentiles])
+
+    missing_fields = [field for field in fields + group_by if field not in ticks.columns]
+    if missing_fields:
+        raise ValueError(f"Fields {missing_fields} not found in DataFrame")
+
+    kinds = {field: 'boolean' if pd.api.types.is_bool_dtype(ticks[field]) else 'numeric' for field in fields}
+
+    with profiling.stage('summary'):
+        profiling.count(len(ticks))
+        values = ticks[fields].astype('float64')
+        grouped = values.groupby([ticks[column] for column in group_by], sort=True, observed=True)
+
+        counts = grouped.count()
+        sums = grouped.sum()
+        means = sums / counts.where(counts > 0)
+        quantiles = grouped.quantile(percentiles)
+
+        frames = []
+        for field in fields:
+            frame = pd.DataFrame({
+                'count': counts[field],
+                'sum': sums[field],
+                'mean': means[field],
+            })
+            field_quantiles = quantiles[field].unstack(-1)
+            for q in percentiles:
+                frame[f'p{round(q * 100)}'] = field_quantiles[q]
+
+            frame.insert(0, 'kind', kinds[field])
+            frame.insert(0, 'field', field)
+            frames.append(frame)
+
+        return pd.concat(frames).reset_index()
+
 def compute_boolean_fractions(ticks: pd.DataFrame, field: str) -> pd.DataFrame:
     """
     Computes the fraction of time each player spends in a specific boolean state (e.g., ducked, jumping).
@@ -25,67 +111,142 @@ def compute_boolean_fractions(ticks: pd.DataFrame, field: str) -> pd.DataFrame:
     :param field: The boolean field to analyze
     :return: DataFrame with 'name', 'match', and 'fraction_active' for the given field
     """
-    if field not in ticks.columns:
-        raise ValueError(f"Field '{field}' not found in DataFrame")
-
-    # Group by player and match, then calculate fraction of time active
-    stats = ticks.groupby(['name', 'match']).agg(
-        total_ticks=(field, 'count'),  # Total recorded ticks
-        active_ticks=(field, 'sum')    # Sum of active ticks (assuming 1 = active, 0 = not)
-    ).reset_index()
+    stats = compute_summary_table(ticks, [field])
 
-    # Compute fraction of time spent active
-    stats['fraction_active'] = stats.apply(
-        lambda row: row['active_ticks'] / row['total_ticks'] if row['total_ticks'] > 0 else 0, axis=1
-    )
-    
-    return stats
+    return pd.DataFrame({
+        'name': stats['name'],
+        'match': stats['match'],
+        'total_ticks': stats['count'],
+        'active_ticks': stats['sum'].astype('int64'),
+        'fraction_active': stats['mean'].fillna(0),
+    })
 
-def plot_boolean_boxplot(data, field):
+def plot_boolean_boxplot(data: pd.DataFrame, field: str, stat: str = 'mean'):
     """
-    Creates a boxplot showing the fraction of time spent in a given boolean state (e.g., ducking, jumping).
+    Creates a boxplot showing the fraction of time spent in a given boolean state (e.g., ducking, jumping),
+    or the distribution of a per-match statistic for numeric fields.
     
-    :param data: DataFrame with 'name', 'match', and 'fraction_active'
-    :param field: The boolean field being analyzed
+    :param data: Summary table as returned by `compute_summary_table`
+    :param field: The field being analyzed
+    :param stat: The column of the summary table to plot
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    data = data[data['field'] == field]
+    if data.empty:
+        print(f"No summary data for {field}")
+        return
+
     plt.figure(figsize=(12, 6))
-    sns.boxplot(x='name', y='fraction_active', data=data, color='#ff7f0e')
+    sns.boxplot(x='name', y=stat, data=data, color='#ff7f0e')
     
     # Labels and title
     plt.xlabel("Player Name")
-    plt.ylabel(f"Fraction of Time Spent {field.capitalize()}")
-    plt.title(f"{field.capitalize()} Fraction Across Matches")
+    if stat == 'mean' and data['kind'].iloc[0] == 'boolean':
+        plt.ylabel(f"Fraction of Time Spent {field.capitalize()}")
+        plt.title(f"{field.capitalize()} Fraction Across Matches")
+    else:
+        plt.ylabel(f"{stat} of {field}")
+        plt.title(f"{field.capitalize()} {stat} Across Matches")
     
     plt.tight_layout()
     
     # Save the figure
-    output_file = f'./figures/{field}_boxplot.png'
-    plt.savefig(output_file)
+    output_file = f'./figures/{field}_boxplot.png' if stat == 'mean' else f'./figures/{field}_{stat}_boxplot.png'
+    with profiling.stage('savefig'):
+        plt.savefig(output_file)
     plt.close()
     print(f"Saved plot to {output_file}")
 
+def prepare_ticks(ticks: pd.DataFrame, args: argparse.Namespace):
+    """
+    Adds the side of every player in the round, if split by side, and the velocity band fields.
+
+    :return: The prepared ticks and the fields to summarize
+    """
+    # Ticks annotated by `rounds.assign_phases` already have it, other loaders only load the team_num.
+    # Copied either way, as the velocity bands are added in place
+    if 'team_num' in ticks.columns and 'side' not in ticks.columns:
+        ticks = rounds.assign_sides(ticks)
+    else:
+        ticks = ticks.copy()
+
+    fields = list(args.fields)
+    if args.velocity_bands:
+        fields += add_velocity_bands(ticks)
+
+    return ticks, fields
+
 def main():
     parser = argparse.ArgumentParser(description='Analyze player behavior based on boolean fields')
     parser.add_argument('folder', type=util.dir_path, help='Path to the folder containing .dem files')
-    parser.add_argument('field', type=str, help='Boolean field to analyze (e.g., ducking, jumping)')
+    parser.add_argument('fields', type=str, nargs='+', help='Boolean/numeric fields to analyze (e.g., ducking is_airborne duck_amount)')
     parser.add_argument('--limit', type=int, default=None, help='Limit the number of demo files to process')
+    parser.add_argument('--velocity_bands', action='store_true', help='Also analyze the fraction of time spent in each velocity band')
+    parser.add_argument('--split', type=str, nargs='*', default=[], choices=list(split_props.keys()), help='Split the summary further, by round and/or side')
+    parser.add_argument('--stat', type=str, default='mean', help='Column of the summary table to plot (mean, p25, p50, p75, ...)')
+    parser.add_argument('--stream', action='store_true', help='Process one demo at a time instead of merging all demos in memory')
+    parser.add_argument('--live_only', action='store_true', help='Ignore warmup, freeze time, halftime and post-round ticks')
+    parser.add_argument('--downsample', type=downsampling.downsample_spec, default=None, help=f'Ticks to keep, {downsampling.usage}. Defaults to every tick, hz:16 is much faster with similar fractions')
+    parser.add_argument('--backend', type=str, default='pandas', choices=['pandas', 'polars'], help='Load and filter the ticks with pandas, or as one lazy multi-threaded Polars query (ignored with --stream)')
+    parser.add_argument('--server', type=str, nargs='?', const='http://127.0.0.1:8765', default=None, help='Query the summary from a running tick_server.py instead of loading the demos, which uses the live_only and downsample settings of the server')
     
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.start(args)
+
+    group_by = ['name', 'match'] + args.split
+    cache_args = [args.folder, args.limit, args.fields, args.velocity_bands, group_by, args.live_only, args.downsample, 'summary']
+
+    if args.server:
+        # The server already has the ticks in memory, only the summary table is transferred
+        import tick_server
+        summary = pd.DataFrame(tick_server.query(args.server, 'fractions', fields=args.fields, velocity_bands=args.velocity_bands, split=args.split, players=players_of_interest)['table'])
+    else:
+        # The summary table is all the boxplots need, so the raw ticks are only loaded on a cache miss
+        summary = util.load_cache(cache_args, [args.folder])
+
+    if summary is None:
+        tick_props = args.fields + [split_props[split] for split in args.split if split_props[split] is not None]
+        if args.velocity_bands:
+            tick_props.append('velocity')
+
+        merge_args = dict(
+          folder_path=args.folder, 
+          tick_props=tick_props + ['match', 'name'], 
+          players_of_interest=players_of_interest,
+          limit=args.limit,
+          # The side of a player is the side they start the round on
+          annotate_rounds='round' in args.split or 'side' in args.split,
+          live_only=args.live_only,
+          downsample=args.downsample,
+        )
+
+        if args.stream:
+            # Groups never span demos, so summarizing one demo at a time gives the same table
+            tables = [compute_summary_table(*prepare_ticks(ticks, args), group_by) for _, ticks, _ in merger.iter_demo_ticks(**merge_args)]
+            summary = pd.concat(tables, ignore_index=True) if tables else compute_summary_table(pd.DataFrame(), args.fields, group_by)
+        elif args.backend == 'polars':
+            import lazy_backend
+            # Only the requested props are read from the parsed stores, and the filters run in the scan
+            ticks = lazy_backend.to_pandas(lazy_backend.scan_demo_files(**merge_args))
+            summary = compute_summary_table(*prepare_ticks(ticks, args), group_by)
+        else:
+            # Merge demo files and extract required data
+            ticks, _ = merger.merge_demo_files(save=True, **merge_args)
+
+            # Compute all fields in one grouped pass
+            summary = compute_summary_table(*prepare_ticks(ticks, args), group_by)
 
-    # Merge demo files and extract required data
-    ticks, _ = merger.merge_demo_files(
-      folder_path=args.folder, 
-      tick_props=[args.field, 'match', 'name'], 
-      save=True, 
-      players_of_interest=players_of_interest,
-      limit=args.limit
-    )
+        util.store_cache(summary, cache_args, [args.folder])
 
-    # Compute fractions for the given field
-    boolean_data = compute_boolean_fractions(ticks, args.field)
+    os.makedirs('./figures', exist_ok=True)
+    summary.to_csv('./figures/boxplot_summary.csv', index=False)
 
-    # Plot boxplot
-    plot_boolean_boxplot(boolean_data, args.field)
+    # Plot one boxplot per field
+    for field in summary['field'].unique():
+        plot_boolean_boxplot(summary, field, args.stat)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import pickle
+from time import time
+from typing import List
+import pandas as pd
+import pyarrow as pa
+import profiling
+
+# Bump when the layout of cached data changes, so stale entries are never loaded
+CACHE_VERSION = 2
+
+cache_dir = './cache'
+# Size budget of the cache folder, least recently used entries are evicted above it
+max_bytes = int(os.environ.get('CACHE_MAX_BYTES', 50 * 1024 ** 3))
+
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'stores': 0,
+    'evictions': 0,
+}
+
+
+def configure(directory: str = None, size_budget: int = None):
+    """
+    Changes the cache folder and/or its size budget in bytes.
+    """
+    global cache_dir, max_bytes
+    if directory is not None:
+        cache_dir = directory
+    if size_budget is not None:
+        max_bytes = size_budget
+
+
+def stats() -> dict:
+    return dict(_stats)
+
+
+def _is_demo_file(root: str, file: str) -> bool:
+    # .dem files, and the keys of a parsed store, which are only written when the store is created.
+    # Props added to a store later don't change the ticks loaded for the other props, so they keep merged entries valid
+    return file.endswith('.dem') or (root.endswith('.dem.parsed') and file == 'keys')
+
+
+def fingerprint(path: str) -> list:
+    """
+    Cheap fingerprint of a file, or of the demos in a folder, based on their path, size and modification time.
+    Any change to the demos in a folder therefore changes the cache keys that depend on it.
+    """
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [[os.path.normpath(path), stat.st_size, stat.st_mtime_ns]]
+
+    entries = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            if not _is_demo_file(root, file):
+                continue
+            file_path = os.path.join(root, file)
+            stat = os.stat(file_path)
+            entries.append([os.path.normpath(file_path), stat.st_size, stat.st_mtime_ns])
+    return entries
+
+
+def make_key(args, files: List[str] = ()) -> str:
+    description = [CACHE_VERSION, str(args)] + [fingerprint(file) for file in files]
+    return hashlib.sha1(str(description).encode('utf-8')).hexdigest()
+
+
+def _is_feather_frame(data) -> bool:
+    # Feather only stores frames with a default index, anything else is pickled to keep the index intact
+    return (
+        isinstance(data, pd.DataFrame)
+        and isinstance(data.index, pd.RangeIndex)
+        and data.index.start == 0
+        and data.index.step == 1
+        and data.index.name is None
+        and all(isinstance(column, str) for column in data.columns)
+    )
+
+
+def write_frame(data: pd.DataFrame, path: str):
+    """
+    Writes a frame as uncompressed Arrow IPC (feather) in a single chunk, so `read_frame` can map it without copying.
+    """
+    data.to_feather(path, compression='uncompressed', chunksize=max(len(data), 1))
+
+
+def read_table(path: str, columns: List[str] = None) -> pa.Table:
+    """
+    Memory-maps an Arrow IPC (feather) file. Nothing is read until the columns are accessed,
+    and concurrent processes share the pages through the OS cache.
+    """
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+def read_frame(path: str, columns: List[str] = None) -> pd.DataFrame:
+    """
+    Loads a file written by `write_frame`. Numeric columns without missing values are zero-copy,
+    read-only views on the mapped file; string columns are converted to Python objects.
+    """
+    return read_table(path, columns).to_pandas(split_blocks=True)
+
+
+def _entry_paths(key: str) -> List[str]:
+    return [f'{cache_dir}/{key}.feather', f'{cache_dir}/{key}.pkl']
+
+
+def load(args, files: List[str] = ()):
+    """
+    Loads the data stored for `args` and the current state of `files`, or returns None on a miss.
+    """
+    key = make_key(args, files)
+    for path in _entry_paths(key):
+        if not os.path.exists(path):
+            continue
+
+        try:
+            with profiling.stage('cache_load'):
+                if path.endswith('.feather'):
+                    data = read_frame(path)
+                else:
+                    with open(path, 'rb') as file:
+                        data = pickle.load(file)
+        except Exception as e:
+            print(f"Removing unreadable cache entry {key}: {e}")
+            os.remove(path)
+            break
+
+        # Mark as recently used for the LRU eviction
+        os.utime(path)
+        _stats['hits'] += 1
+        print(f"Found stored data in cache {key}, for args {str(args)}")
+        return data
+
+    _stats['misses'] += 1
+    return None
+
+
+def store(data, args, files: List[str] = ()):
+    """
+    Stores `data` for `args` and the current state of `files`.
+    The entry is written to a temporary file first and then renamed, so a crash never leaves a truncated entry behind.
+    """
+    key = make_key(args, files)
+    path = _entry_paths(key)[0 if _is_feather_frame(data) else 1]
+    print(f"Storing to cache {key}, with args {str(args)}")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with profiling.stage('cache_store'):
+            if path.endswith('.feather'):
+                write_frame(data, temporary_path)
+            else:
+                with open(temporary_path, 'wb') as file:
+                    pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+    _stats['stores'] += 1
+    evict()
+
+
+def evict(size_budget: int = None):
+    """
+    Removes the least recently used entries until the cache fits in its size budget.
+    """
+    size_budget = max_bytes if size_budget is None else size_budget
+    if not os.path.isdir(cache_dir):
+        return
+
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        # Leftovers of crashed writes are removed once they are clearly not being written anymore
+        if entry.name.endswith('.tmp'):
+            if time() - stat.st_mtime > 24 * 60 * 60:
+                os.remove(entry.path)
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= size_budget:
+            break
+        os.remove(path)
+        total -= size
+        _stats['evictions'] += 1
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import profiling
+
+# Minimum number of overlapping ticks for a lagged correlation to be reported
+min_overlap = 64
+
+signals = ['value', 'speed']
+
+
+def align_match(ticks: pd.DataFrame, prop: str, players: list, signal: str = 'value') -> tuple[np.ndarray, int]:
+    """
+    Aligns the `prop` signal of every player in the ticks of a single match on a common tick grid.
+    Every row is placed at the offset of its tick on the grid, so players missing from some ticks leave gaps instead
+    of shifting the signal.
+
+    :param players: Column order of the result, players not in `players` are ignored
+    :param signal: 'value' for the prop itself, 'speed' for its change per grid step, with yaw wrapped around ±180
+    :return: (grid, step): array of shape (grid ticks, players) with NaN gaps, and the ticks between grid rows
+    """
+    tick = ticks['tick'].to_numpy(dtype='int64')
+    grid_ticks = np.unique(tick)
+    step = int(np.gcd.reduce(np.diff(grid_ticks))) if len(grid_ticks) > 1 else 1
+    row = (tick - grid_ticks[0]) // step
+    names = ticks['name']
+    column = pd.Categorical(names.where(names.isin(players)), categories=players).codes
+
+    grid = np.full((row.max() + 1 if len(row) else 0, len(players)), np.nan)
+    known = column >= 0
+    grid[row[known], column[known]] = ticks[prop].to_numpy(dtype='float64')[known]
+
+    if signal == 'speed':
+        grid = np.diff(grid, axis=0, prepend=np.nan)
+        if prop == 'yaw':
+            grid = (grid + 180) % 360 - 180
+    return grid, step
+
+
+def lagged_products(grid: np.ndarray, max_lag: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Sums of products of the standardized signals of all player pairs at every lag from -`max_lag` to `max_lag`
+    grid rows, and the number of rows both players are present at each lag, computed for all pairs at once with FFTs.
+
+    Entry [a, b, max_lag + k] pairs player a at row t with player b at row t + k.
+
+    :return: (products, overlaps), both of shape (players, players, 2 * max_lag + 1)
+    """
+    present = ~np.isnan(grid)
+    counts = present.sum(axis=0)
+    mean = np.where(counts > 0, np.nansum(grid, axis=0) / np.maximum(counts, 1), 0)
+    std = np.sqrt(np.nansum((grid - mean) ** 2, axis=0) / np.maximum(counts, 1))
+    standardized = np.where(present, (grid - mean) / np.where(std > 0, std, 1), 0)
+
+    size = 1 << int(np.ceil(np.log2(2 * len(grid) + 1)))
+    lags = np.r_[size - max_lag:size, 0:max_lag + 1]
+
+    def correlate(values):
+        spectrum = np.fft.rfft(values, size, axis=0)
+        result = np.empty((values.shape[1], values.shape[1], len(lags)))
+        # One player against all others at a time, keeping memory linear in the number of players
+        for a in range(values.shape[1]):
+            cross = np.fft.irfft(np.conj(spectrum[:, [a]]) * spectrum, size, axis=0)
+            result[a] = cross[lags].T
+        return result
+
+    return correlate(standardized), np.rint(correlate(present.astype('float64')))
+
+
+def cross_correlations(ticks: pd.DataFrame, props: list, max_lag: int, signal: str = 'value') -> dict:
+    """
+    Lagged cross-correlations of every pair of players per map, from merged ticks. Each match is aligned on its own
+    ticks, and the products of all matches on a map are summed before normalizing, so pairs that played several
+    matches together get one correlation per lag.
+
+    :param max_lag: Largest lag in ticks
+    :return: {(map, prop): (players, lags in ticks, correlations of shape (players, players, lags))},
+             with NaN where a pair overlaps for fewer than `min_overlap` ticks
+    """
+    results = {}
+    with profiling.stage('cross_correlation'):
+        profiling.count(len(ticks))
+        for map_name, map_ticks in ticks.groupby('map', sort=False):
+            players = sorted(map_ticks['name'].unique())
+            lags = np.arange(-max_lag, max_lag + 1)
+            for prop in props:
+                products = np.zeros((len(players), len(players), len(lags)))
+                overlaps = np.zeros_like(products)
+                for _, match_ticks in map_ticks.groupby('match', sort=False):
+                    match_players = sorted(match_ticks['name'].unique())
+                    grid, step = align_match(match_ticks.sort_values('tick', kind='stable'), prop, match_players, signal)
+                    match_products, match_overlaps = lagged_products(grid, max_lag // step)
+
+                    # Only lags that are whole grid steps are measured in downsampled matches
+                    index = np.ix_(np.searchsorted(players, match_players), np.searchsorted(players, match_players), max_lag + np.arange(-(max_lag // step), max_lag // step + 1) * step)
+                    products[index] += match_products
+                    overlaps[index] += match_overlaps
+
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    # Signals are standardized per match rather than per overlap, which can push the ratio just past ±1
+                    correlations = np.where(overlaps >= min_overlap, np.clip(products / overlaps, -1, 1), np.nan)
+                results[(map_name, prop)] = (players, lags, correlations)
+
+    return results
+
+
+def peak_correlations(players: list, lags: np.ndarray, correlations: np.ndarray) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Reduces lagged correlations to the strongest correlation of every pair, and the lag at which it occurs.
+
+    :return: (peak correlation matrix, lag matrix in ticks), indexed by player on both axes
+    """
+    magnitude = np.nan_to_num(np.abs(correlations), nan=-1)
+    peak = magnitude.argmax(axis=-1)
+    values = np.take_along_axis(correlations, peak[..., None], axis=-1)[..., 0]
+    peak_lags = np.where(np.isnan(values), np.nan, lags[peak])
+    return pd.DataFrame(values, index=players, columns=players), pd.DataFrame(peak_lags, index=players, columns=players)
@@ -1,16 +1,18 @@
+import os
 import argparse
 from typing import List
 import pandas as pd
 import matplotlib
-matplotlib.use('wxAgg')
-import matplotlib.pyplot as plt
-import seaborn as sns
+matplotlib.use('Agg')
 import numpy as np
 from tqdm import tqdm
 
 import util
 import merge_demo_files as merger
-from scipy.stats import zscore
+import profiling
+import correlation
+import downsampling
+import kernels
 
 players_of_interest = [
     "ZywOo",
@@ -34,23 +36,19 @@ def compute_derivatives(df: pd.DataFrame, props: List[str]) -> pd.DataFrame:
     :param props: List of properties (like 'yaw', 'pitch') to calculate derivatives for.
     :return: DataFrame with speed, acceleration, and smoothness columns.
     """
-    # Split by player to compute derivatives independently
-    player_groups = df.groupby('name')
-    
-    for player, player_data in tqdm(player_groups, desc="Computing Derivatives", total=len(player_groups), leave=False):
-        for prop in props:
-            player_data[f'{prop}_speed'] = player_data[prop].diff()  # First derivative - speed
-            player_data[f'{prop}_acceleration'] = player_data[f'{prop}_speed'].diff()  # Second derivative - acceleration
-            player_data[f'{prop}_smoothness'] = player_data[f'{prop}_acceleration'].diff()  # Third derivative - jerk
-
-            player_data.fillna({f'{prop}_speed': 0, f'{prop}_acceleration': 0, f'{prop}_smoothness': 0}, inplace=True)
+    with profiling.stage('derivatives'):
+        profiling.count(len(df))
+        # Players are differenced independently, all of them in a single pass per prop
+        codes, _ = pd.factorize(df['name'])
 
-        # Reassign back to the original dataframe
-        df.loc[player_data.index, [f'{prop}_speed' for prop in props]] = player_data[[f'{prop}_speed' for prop in props]]
-        df.loc[player_data.index, [f'{prop}_acceleration' for prop in props]] = player_data[[f'{prop}_acceleration' for prop in props]]
-        df.loc[player_data.index, [f'{prop}_smoothness' for prop in props]] = player_data[[f'{prop}_smoothness' for prop in props]]
+        for prop in props:
+            # Speed (first derivative), acceleration (second derivative) and smoothness (jerk, third derivative)
+            speed, acceleration, smoothness = kernels.derivatives(df[prop].to_numpy(dtype='float64'), codes)
+            df[f'{prop}_speed'] = speed
+            df[f'{prop}_acceleration'] = acceleration
+            df[f'{prop}_smoothness'] = smoothness
     
-    return df
+        return df
 
 
 def plot_distribution(df: pd.DataFrame, player_name: str, prop: str, map_name: str, metric: str, bins: int = 30):
@@ -64,6 +62,8 @@ def plot_distribution(df: pd.DataFrame, player_name: str, prop: str, map_name: s
     :param metric: 'speed', 'acceleration', or 'smoothness'.
     :param bins: Number of bins for the histogram.
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
     # Filter the data for the specific player and map
     player_data : pd.DataFrame = df[(df['name'] == player_name) & (df['map'] == map_name)]
@@ -83,11 +83,86 @@ def plot_distribution(df: pd.DataFrame, player_name: str, prop: str, map_name: s
     plt.xlabel(f'{metric.capitalize()}')
     plt.ylabel('Density')
     plt.grid(True)
-    plt.savefig(f"./figures/cursor_movement/{player_name}_{map_name}_{prop}_{metric}_distribution.png")
+    with profiling.stage('savefig'):
+        plt.savefig(f"./figures/cursor_movement/{player_name}_{map_name}_{prop}_{metric}_distribution.png")
     # plt.show()
     plt.close()
 
 
+metrics = ['speed', 'acceleration', 'smoothness']
+
+# Fixed histogram edges per prop, so derivative histograms can be summed across demos
+histogram_edges = {
+    'yaw': np.linspace(-300, 300, 121),
+    'pitch': np.linspace(-40, 40, 81),
+}
+
+def accumulate_derivative_histograms(histograms: dict, ticks: pd.DataFrame, props: List[str] = ['yaw', 'pitch']):
+    """
+    Adds the derivative histograms of every (player, map) in `ticks` to `histograms`,
+    keyed by (player, map, prop, metric).
+    """
+    ticks = compute_derivatives(ticks.copy(), props)
+
+    for (player_name, map_name), player_data in ticks.groupby(['name', 'map']):
+        for prop in props:
+            for metric in metrics:
+                counts, _ = np.histogram(player_data[f'{prop}_{metric}'], bins=histogram_edges[prop])
+                key = (player_name, map_name, prop, metric)
+                histograms[key] = histograms[key] + counts if key in histograms else counts
+
+def plot_histogram_distribution(counts: np.ndarray, player_name: str, prop: str, map_name: str, metric: str):
+    """
+    Plots a distribution of speed, acceleration, or smoothness for a player from accumulated histogram counts,
+    with the same value filters as `plot_distribution`.
+    """
+    import matplotlib.pyplot as plt
+
+    edges = histogram_edges[prop]
+    centers = np.abs((edges[:-1] + edges[1:]) / 2)
+    if prop == 'yaw':
+        counts = np.where((centers > 50) & (centers < 300), counts, 0)
+    elif prop == 'pitch':
+        counts = np.where((centers > 5) & (centers < 40), counts, 0)
+
+    if counts.sum() == 0:
+        return
+
+    plt.figure(figsize=(10, 6))
+    plt.stairs(counts / (counts.sum() * np.diff(edges)), edges, fill=True, color='blue', alpha=0.6)
+    plt.title(f'{metric.capitalize()} Distribution for {player_name} on {map_name} ({prop})')
+    plt.xlabel(f'{metric.capitalize()}')
+    plt.ylabel('Density')
+    plt.grid(True)
+    with profiling.stage('savefig'):
+        plt.savefig(f"./figures/cursor_movement/{player_name}_{map_name}_{prop}_{metric}_distribution.png")
+    plt.close()
+
+
+def save_correlation_matrix(peaks: pd.DataFrame, peak_lags: pd.DataFrame, map_name: str, prop: str, signal: str):
+    """
+    Saves the peak correlation and lag matrices of a map as CSV, and plots the peak correlations.
+    """
+    import matplotlib.pyplot as plt
+
+    os.makedirs('./figures/cursor_correlation', exist_ok=True)
+    name = f"./figures/cursor_correlation/{map_name}_{prop}_{signal}"
+    peaks.to_csv(f"{name}.csv")
+    peak_lags.to_csv(f"{name}_lags.csv")
+
+    plt.figure(figsize=(max(6, len(peaks) * 0.5), max(5, len(peaks) * 0.4)))
+    plt.imshow(peaks.to_numpy(), cmap='coolwarm', vmin=-1, vmax=1)
+    plt.colorbar(label='Peak correlation')
+    plt.xticks(range(len(peaks)), peaks.columns, rotation=90)
+    plt.yticks(range(len(peaks)), peaks.index)
+    plt.title(f'Lagged {prop} {signal} correlation on {map_name}')
+    plt.tight_layout()
+    with profiling.stage('savefig'):
+        plt.savefig(f"{name}.png")
+    plt.close()
+    print(f"Saved correlation matrix to {name}.csv")
+
+
 def main():
     parser = argparse.ArgumentParser(description='Generate aiming statistics for players')
     parser.add_argument('folder', type=util.dir_path, help='Path to the folder containing .dem files')
@@ -95,30 +170,44 @@ def main():
     parser.add_argument('--show', action='store_true', help='Show interactive plot instead of saving to file')
     parser.add_argument('--limit', type=int, default=None, help='Limit the number of demo files to process')
     parser.add_argument('--map', type=str, default=None, help='Filter results by a specific map')
+    parser.add_argument('--stream', action='store_true', help='Build the derivative distributions one demo at a time, with bounded memory')
+    parser.add_argument('--props', type=str, nargs='+', default=['pitch', 'yaw'], choices=['pitch', 'yaw'], help='Cursor signals to cross-correlate')
+    parser.add_argument('--signal', type=str, default='value', choices=correlation.signals, help="Correlate the view angles themselves, or their change per tick")
+    parser.add_argument('--max_lag', type=float, default=1.0, help='Largest lag between two players to correlate, in seconds')
     
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.start(args)
+
+    if args.stream:
+        histograms = {}
+        for _, ticks, _ in merger.iter_demo_ticks(args.folder, tick_props, players_of_interest=players_of_interest, limit=args.limit, map_name=args.map):
+            accumulate_derivative_histograms(histograms, ticks)
+
+        for (player, map_name, prop, metric), counts in tqdm(histograms.items(), desc="Plotting distributions"):
+            plot_histogram_distribution(counts, player, prop, map_name, metric)
+        return
 
     # Load the ticks data
-    ticks = util.load_cache([args.folder, args.limit, tick_props])
+    players = args.players or None
+    ticks = util.load_cache([args.folder, args.limit, tick_props, players, args.map], [args.folder])
     
     if ticks is None:
         ticks, _ = merger.merge_demo_files(
             folder_path=args.folder, 
             tick_props=tick_props,
-            players_of_interest=players_of_interest,
-            limit=args.limit
+            players_of_interest=players,
+            limit=args.limit,
+            map_name=args.map,
         )
 
-        util.store_cache(ticks, [args.folder, args.limit, tick_props])
-
-
-    player1 = ticks[(ticks['name'] == 'ZywOo') & (ticks['map'] == 'de_mirage')]
-    player2 = ticks[(ticks['name'] == 'ropz') & (ticks['map'] == 'de_mirage')]
+        util.store_cache(ticks, [args.folder, args.limit, tick_props, players, args.map], [args.folder])
 
-    corr_pitch = np.corrcoef(player1['pitch'], player2['pitch'])[0, 1]
-    corr_yaw = np.corrcoef(player1['yaw'], player2['yaw'])[0, 1]
-    print(f"Correlation between ZywOo and ropz on pitch: {corr_pitch}")
-    print(f"Correlation between ZywOo and ropz on yaw: {corr_yaw}")
+    # Correlate every pair of players at once, per map
+    results = correlation.cross_correlations(ticks, args.props, int(args.max_lag * downsampling.TICKRATE), args.signal)
+    for (map_name, prop), (players, lags, correlations) in results.items():
+        peaks, peak_lags = correlation.peak_correlations(players, lags, correlations)
+        save_correlation_matrix(peaks, peak_lags, map_name, prop, args.signal)
 
 
 
@@ -4,11 +4,11 @@ from tqdm import tqdm
 import util
 import pandas as pd
 import matplotlib
-matplotlib.use('wxAgg')
+matplotlib.use('Agg')
 
-import matplotlib.pyplot as plt
-import seaborn as sns
 import merge_demo_files as merger
+import profiling
+import sampling
 
 players_of_interest = [
     "ZywOo",
@@ -29,21 +29,33 @@ def main():
     parser.add_argument('folder', type=util.dir_path, help='Path to the folder containing .dem files')
     parser.add_argument('--players', type=str, nargs='*', default=[], help='List of player usernames to filter (empty for all players)')
     parser.add_argument('--show', action='store_true', help='Show interactive plot instead of saving to file')
+    parser.add_argument('--sample', type=int, default=None, help=f'Plot a stratified sample of ticks, the {sampling.usage}. Defaults to every tick')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the tick sample')
 
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.start(args)
 
-    ticks = util.load_cache([args.folder, tick_props])
+    if args.show:
+        # Interactive backend, only loaded when the plots are shown
+        matplotlib.use('wxAgg')
+
+    cache_args = [args.folder, tick_props] + ([args.sample, args.seed] if args.sample is not None else [])
+    ticks = util.load_cache(cache_args, [args.folder])
 
     if ticks is None:
-        ticks, _ = merger.merge_demo_files(
-            folder_path=args.folder, 
-            tick_props=tick_props,
-            players_of_interest=players_of_interest
-        )
+        if args.sample is not None:
+            ticks = sampling.merge_sampled(args.folder, tick_props, args.sample, args.seed, players_of_interest=players_of_interest, annotate_rounds=True)
+        else:
+            ticks, _ = merger.merge_demo_files(
+                folder_path=args.folder, 
+                tick_props=tick_props,
+                players_of_interest=players_of_interest
+            )
     
         ticks = util.split_list_columns(ticks)
 
-        util.store_cache(ticks, [args.folder, tick_props])
+        util.store_cache(ticks, cache_args, [args.folder])
 
     plot_distribution_by_player(
         ticks, 
@@ -91,6 +103,8 @@ def plot_distribution_by_player(
     - df (pd.DataFrame): The dataframe containing the game ticks data.
     - fields_of_interest (list or str): The columns to plot distributions for.
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
     # Ensure the specified fields exist in the dataframe
     missing_fields = [field for field in fields_of_interest if field not in df.columns]
@@ -121,7 +135,9 @@ def plot_distribution_by_player(
             player_data = df[df['name'] == player][field]
             
             # Plot the distribution for the current player
-            sns.kdeplot(player_data, label=player, fill=True)
+            with profiling.stage('kde'):
+                profiling.count(len(player_data))
+                sns.kdeplot(player_data, label=player, fill=True)
         
         # Set the title for the subplot
         plt.title(f'Distribution of {field}')
@@ -136,7 +152,8 @@ def plot_distribution_by_player(
     if args.show:
         plt.show()
     else:
-        plt.savefig(f"./figures/{name}.png")
+        with profiling.stage('savefig'):
+            plt.savefig(f"./figures/{name}.png")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,75 @@
+import argparse
+import numpy as np
+import pandas as pd
+import rounds
+
+# Tickrate of CS2 demos
+TICKRATE = 64
+
+usage = "'every:N' keeps every Nth tick, 'hz:H' keeps H ticks per second, " \
+        "'window:EVENT[,EVENT...]:S' keeps the ticks within S seconds of the given events " \
+        "(e.g. window:player_death,weapon_fire:2), 'full' keeps every tick"
+
+
+def downsample_spec(value: str) -> str:
+    """
+    Validates a downsampling spec for argparse, see `usage`.
+
+    :return: The spec, or None for 'full'
+    """
+    parts = value.split(':')
+    try:
+        if value == 'full':
+            return None
+        if parts[0] == 'every' and len(parts) == 2 and int(parts[1]) > 0:
+            return value
+        if parts[0] == 'hz' and len(parts) == 2 and float(parts[1]) > 0:
+            return value
+        if parts[0] == 'window' and len(parts) == 3 and parts[1] and float(parts[2]) >= 0:
+            return value
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"{value} is not a valid downsampling spec, {usage}")
+
+
+def tick_step(spec: str) -> int:
+    """
+    Number of ticks between kept ticks for 'every:N' and 'hz:H' specs.
+    """
+    kind, value = spec.split(':')
+    if kind == 'every':
+        return max(int(value), 1)
+    return max(int(round(TICKRATE / float(value))), 1)
+
+
+def window_mask(tick: np.ndarray, anchors: np.ndarray, half_width: int) -> np.ndarray:
+    """
+    Marks the ticks within `half_width` ticks of the nearest anchor, with one binary search per tick.
+    """
+    if len(anchors) == 0:
+        return np.zeros(len(tick), dtype=bool)
+
+    anchors = np.sort(anchors)
+    position = np.searchsorted(anchors, tick)
+    after = anchors[np.minimum(position, len(anchors) - 1)]
+    before = anchors[np.maximum(position - 1, 0)]
+    return (np.abs(after - tick) <= half_width) | (np.abs(tick - before) <= half_width)
+
+
+def downsample(ticks: pd.DataFrame, events, spec: str = None) -> pd.DataFrame:
+    """
+    Downsamples the ticks of a single demo according to `spec`, see `usage`.
+    Ticks are selected by tick number, so all players keep the same ticks and stay aligned.
+    """
+    if spec is None:
+        return ticks
+
+    if spec.startswith('window:'):
+        _, event_names, seconds = spec.split(':')
+        anchors = np.concatenate([rounds.get_event(events, name)['tick'].to_numpy(dtype='int64') for name in event_names.split(',')])
+        return ticks[window_mask(ticks['tick'].to_numpy(dtype='int64'), anchors, int(float(seconds) * TICKRATE))]
+
+    step = tick_step(spec)
+    if step == 1:
+        return ticks
+    return ticks[ticks['tick'].to_numpy() % step == 0]
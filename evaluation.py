@@ -0,0 +1,257 @@
+import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+import util
+import profiling
+import downsampling
+import spectral
+import trajectory
+import merge_demo_files as merger
+import player_similarity
+
+SCORES_FILE = './figures/similarity_scores.csv'
+
+# Metrics that can be evaluated from the per-match profiles, see `build_match_profiles`
+metrics = ['location', 'trajectory', 'spectral']
+
+evaluation_props = ['X', 'Y']
+
+# Profiles of the worker processes, set once per worker by `_init_worker`
+_profiles = None
+
+
+def build_match_profiles(folder: str, limit: int = None, map_name: str = None, live_only: bool = False, downsample: str = None, profile_metrics: list = None) -> dict:
+    """
+    Summarizes every (match, player) in `folder` once, so folds only combine summaries and never load ticks:
+    the location sketch, the resampled round paths and the aim band powers.
+    The paths and band powers are only built for the `profile_metrics` that use them, all `metrics` by default.
+
+    :return: {'maps': {match: map}, 'location': {(match, player): sketch}, 'paths': {(match, player): paths},
+              'spectra': {(match, player): (band powers summed over windows, windows)}}
+    """
+    profile_metrics = metrics if profile_metrics is None else profile_metrics
+    profiles = {'maps': {}, 'location': {}, 'paths': {}, 'spectra': {}}
+    for match, ticks, _ in merger.iter_demo_ticks(folder, evaluation_props, limit=limit, map_name=map_name, annotate_rounds='trajectory' in profile_metrics, live_only=live_only, downsample=downsample):
+        if ticks.empty:
+            continue
+        profiles['maps'][match] = ticks['map'].iloc[0]
+
+        sketches = {}
+        player_similarity.accumulate_location_sketches(sketches, ticks)
+        for player, player_ticks in ticks.groupby('name'):
+            profiles['location'][(match, player)] = sketches[player]
+            if 'trajectory' in profile_metrics:
+                profiles['paths'][(match, player)] = trajectory.round_paths(player_ticks)
+
+    # Spectra missing from the parsed stores are computed by parsing the aim of every demo, so only when needed
+    if 'spectral' not in profile_metrics:
+        return profiles
+    spectra = spectral.load_spectra(folder, limit, map_name)
+    power = spectra[spectral.feature_columns()].mul(spectra['windows'], axis=0).to_numpy()
+    for (match, player, windows), row in zip(spectra[['match', 'name', 'windows']].itertuples(index=False), power):
+        if match in profiles['maps'] and windows > 0:
+            profiles['spectra'][(match, player)] = (row, windows)
+
+    return profiles
+
+
+def load_match_profiles(folder: str, limit: int = None, map_name: str = None, live_only: bool = False, downsample: str = None, profile_metrics: list = None) -> dict:
+    profile_metrics = sorted(metrics if profile_metrics is None else profile_metrics)
+    cache_args = ['match_profiles', folder, limit, map_name, live_only, downsample, profile_metrics, trajectory.path_length, spectral.SPECTRA_VERSION]
+    profiles = util.load_cache(cache_args, [folder])
+    if profiles is None:
+        profiles = build_match_profiles(folder, limit, map_name, live_only, downsample, profile_metrics)
+        util.store_cache(profiles, cache_args, [folder])
+    return profiles
+
+
+def match_folds(matches: list, folds: int = None) -> list:
+    """
+    Splits the matches into folds of held out matches, one match per fold for leave-one-match-out.
+    """
+    matches = sorted(matches)
+    if folds is None or folds >= len(matches):
+        return [[match] for match in matches]
+    return [matches[fold::folds] for fold in range(folds)]
+
+
+def _pool_profiles(profiles: dict, held_out: set) -> dict:
+    """
+    Combines the profiles of all matches that are not held out per (map, player).
+    """
+    pool = {'location': {}, 'paths': {}, 'spectra': {}}
+    for (match, player), sketch in profiles['location'].items():
+        if match in held_out:
+            continue
+        key = (profiles['maps'][match], player)
+        if key in pool['location']:
+            pool['location'][key] = (pool['location'][key][0] + sketch[0], pool['location'][key][1] + sketch[1])
+        else:
+            pool['location'][key] = sketch
+
+    # Only built when the trajectory metric is evaluated
+    for (match, player), paths in profiles['paths'].items():
+        if match in held_out:
+            continue
+        key = (profiles['maps'][match], player)
+        pool['paths'][key] = np.concatenate([pool['paths'][key], paths]) if key in pool['paths'] else paths
+
+    for (match, player), (power, windows) in profiles['spectra'].items():
+        if match in held_out:
+            continue
+        key = (profiles['maps'][match], player)
+        pool['spectra'][key] = pool['spectra'][key] + power if key in pool['spectra'] else power
+
+    return pool
+
+
+def score_pair(profiles: dict, pool: dict, query: tuple, candidate: tuple, metric: str) -> float:
+    """
+    Similarity of a held out (match, player) to a pooled (map, player) under `metric`, or NaN if either lacks the data.
+    """
+    if metric == 'location':
+        return player_similarity.compute_location_similarity_sketch(profiles['location'][query], pool['location'][candidate])
+    if metric == 'trajectory':
+        new_paths, known_paths = profiles['paths'][query], pool['paths'][candidate]
+        if len(new_paths) == 0 or len(known_paths) == 0:
+            return np.nan
+        return trajectory.distance_similarity(np.mean([trajectory.nearest_distance(path, known_paths) for path in new_paths]))
+    if metric == 'spectral':
+        if query not in profiles['spectra'] or candidate not in pool['spectra']:
+            return np.nan
+        new_vector, known_vector = spectral.band_fractions([profiles['spectra'][query][0], pool['spectra'][candidate]])
+        return spectral.compute_spectral_similarity(new_vector, known_vector)
+    raise ValueError(f"Unknown metric {metric}")
+
+
+def _init_worker(profiles: dict):
+    global _profiles
+    _profiles = profiles
+
+
+def evaluate_fold(held_out: list, fold_metrics: list) -> list:
+    """
+    Scores every player of the held out matches against every player of the other matches on the same map.
+    Players that appear in no other match can not be identified, and are skipped.
+
+    :return: Rows of (held out match, player, candidate, metric, score)
+    """
+    pool = _pool_profiles(_profiles, set(held_out))
+    rows = []
+    for query in [key for key in _profiles['location'] if key[0] in held_out]:
+        match, player = query
+        map_name = _profiles['maps'][match]
+        if (map_name, player) not in pool['location']:
+            continue
+        for candidate in [key for key in pool['location'] if key[0] == map_name]:
+            for metric in fold_metrics:
+                rows.append((match, player, candidate[1], metric, score_pair(_profiles, pool, query, candidate, metric)))
+    return rows
+
+
+def run_folds(profiles: dict, folds: list, fold_metrics: list, workers: int = None) -> pd.DataFrame:
+    """
+    Runs the folds in a process pool. The profiles are sent to every worker once, not with every fold.
+    Workers are spawned, not forked, since forking after the compiled kernels started their threads can hang, see `kernels`.
+    """
+    rows = []
+    with profiling.stage('folds'):
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker, initargs=(profiles,)) as pool:
+            futures = [pool.submit(evaluate_fold, held_out, fold_metrics) for held_out in folds]
+            for future in tqdm(futures, desc="Evaluating folds"):
+                rows += future.result()
+        profiling.count(len(rows))
+    return pd.DataFrame(rows, columns=['match', 'player', 'candidate', 'metric', 'score'])
+
+
+def add_combined_scores(scores: pd.DataFrame, weights: dict = player_similarity.similarity_weights) -> pd.DataFrame:
+    """
+    Adds the 'combined' metric, the weighted mean of the available metrics of every pair, like `compute_similarity`.
+    """
+    wide = scores.pivot(index=['match', 'player', 'candidate'], columns='metric', values='score')
+    weight = pd.Series({metric: weights.get(metric, 0) for metric in wide.columns})
+    available = wide.notna().mul(weight, axis=1)
+    combined = (wide.fillna(0).mul(weight, axis=1).sum(axis=1) / available.sum(axis=1)).rename('score').reset_index()
+    return pd.concat([scores, combined.assign(metric='combined')], ignore_index=True)
+
+
+def roc_auc(positive: np.ndarray, negative: np.ndarray) -> float:
+    """
+    Probability that a same-player pair scores higher than a different-player pair, from the Mann-Whitney U statistic.
+    """
+    from scipy.stats import rankdata
+
+    if len(positive) == 0 or len(negative) == 0:
+        return np.nan
+    ranks = rankdata(np.concatenate([positive, negative]))
+    return (ranks[:len(positive)].sum() - len(positive) * (len(positive) + 1) / 2) / (len(positive) * len(negative))
+
+
+def summarize(scores: pd.DataFrame, top_k: int = 3) -> pd.DataFrame:
+    """
+    Identification and verification quality of every metric: how often the true player is ranked first or in the top k,
+    the ROC-AUC of same-player against different-player scores, and the score statistics of both.
+    """
+    summary = []
+    for metric, metric_scores in scores.dropna(subset=['score']).groupby('metric', sort=False):
+        is_self = (metric_scores['player'] == metric_scores['candidate']).to_numpy()
+        ranks = metric_scores.groupby(['match', 'player'])['score'].rank(ascending=False, method='min')
+        true_ranks = ranks[is_self]
+        self_scores, other_scores = metric_scores['score'][is_self], metric_scores['score'][~is_self]
+
+        summary.append({
+            'label': metric,
+            'queries': len(true_ranks),
+            'top_1': (true_ranks <= 1).mean(),
+            f'top_{top_k}': (true_ranks <= top_k).mean(),
+            'roc_auc': roc_auc(self_scores.to_numpy(), other_scores.to_numpy()),
+            'avg_self': self_scores.mean(),
+            'min_self': self_scores.min(),
+            'max_self': self_scores.max(),
+            'avg_other': other_scores.mean(),
+            'min_other': other_scores.min(),
+            'max_other': other_scores.max(),
+        })
+    return pd.DataFrame(summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cross-validate the player similarity metrics by leaving out one match, or one fold of matches, at a time')
+    parser.add_argument('folder', type=util.dir_path, help='Path to the folder containing the known .dem files')
+    parser.add_argument('--map', type=str, default=None, help='Only evaluate matches on this map')
+    parser.add_argument('--limit', type=int, default=None, help='Limit the number of demo files to process')
+    parser.add_argument('--folds', type=int, default=None, help='Number of folds of matches, defaults to leaving out one match at a time')
+    parser.add_argument('--metrics', type=str, nargs='+', default=metrics, choices=metrics, help='Metrics to evaluate, their weighted combination is always reported')
+    parser.add_argument('--top_k', type=int, default=3, help='Rank within which the true player counts as found')
+    parser.add_argument('--workers', type=int, default=None, help='Number of folds to run in parallel (defaults to the number of CPUs)')
+    parser.add_argument('--live_only', action='store_true', help='Only use ticks where a round is being played')
+    parser.add_argument('--downsample', type=downsampling.downsample_spec, default=None, help=f'Ticks to use, {downsampling.usage}. Defaults to every tick')
+    parser.add_argument('--trajectory_weight', type=float, default=player_similarity.similarity_weights['trajectory'], help='Weight of the trajectory metric in the combined score, see player_similarity.py')
+    parser.add_argument('--spectral_weight', type=float, default=player_similarity.similarity_weights['spectral'], help='Weight of the spectral metric in the combined score, see player_similarity.py')
+
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.start(args)
+
+    weights = dict(player_similarity.similarity_weights, trajectory=args.trajectory_weight, spectral=args.spectral_weight)
+
+    profiles = load_match_profiles(args.folder, args.limit, args.map, args.live_only, args.downsample, args.metrics)
+    folds = match_folds(list(profiles['maps']), args.folds)
+    print(f"Evaluating {len(args.metrics)} metrics over {len(folds)} folds of {len(profiles['maps'])} matches")
+
+    scores = add_combined_scores(run_folds(profiles, folds, args.metrics, args.workers), weights)
+    summary = summarize(scores, args.top_k)
+
+    os.makedirs('./figures', exist_ok=True)
+    scores.to_csv(SCORES_FILE, index=False)
+    summary.to_csv(player_similarity.EVALUATION_FILE, index=False)
+    print(summary.to_string(index=False, float_format='%.4f'))
+    print(f"Saved evaluation to {player_similarity.EVALUATION_FILE}, plot it with player_similarity.py --plot")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,15 @@
-from time import sleep
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from seleniumbase import Driver
 import os
+from glob import glob
 from time import localtime, strftime
-import patoolib
 import argparse
 from selenium.webdriver.support.select import Select
 from progress.bar import Bar
 import util
+import scrape_util
+import ingest
 
 
 def main(args):
@@ -72,34 +73,41 @@ def main(args):
             match_detail_links.append(match_detail_link)
             bar.next()
 
-    with Bar("Downloading demos", max=len(match_detail_links)) as bar:
-        for link in match_detail_links:
-            driver.uc_open_with_reconnect(link, reconnect_time=6)
-            download_button = driver.find_element(By.CLASS_NAME, "stream-box")
-
-            download_button.click()
-            util.wait_for_after_content(driver, (By.CLASS_NAME, 'vod-loading-status'), '"Download starting..."')
-            sleep(3)
-            util.monitor_folder_for_changes('./downloaded_files')
-            sleep(1)
-            bar.next()
+    # Demos downloaded in earlier runs are not parsed again
+    duplicates = []
+    known_hashes = set().union(*(util.find_demo_hashes(folder, duplicates=duplicates) for folder in glob('./replays_*')))
 
     destination_path = os.path.normpath(f'./replays_{strftime("%Y-%m-%d_%H-%M-%S", localtime())}')
     os.mkdir(destination_path)
+    os.makedirs('./downloaded_files', exist_ok=True)
+
+    # Archives are extracted and parsed by the pipeline while the next demos are downloading
+    futures = []
+    with ingest.start_pipeline(args.workers) as pipeline:
+        with Bar("Downloading demos", max=len(match_detail_links)) as bar:
+            for link in match_detail_links:
+                driver.uc_open_with_reconnect(link, reconnect_time=6)
+                download_button = driver.find_element(By.CLASS_NAME, "stream-box")
+
+                # Only files that appear after the click belong to this download
+                known_files = scrape_util.list_files('./downloaded_files')
+                download_button.click()
+                scrape_util.wait_for_after_content(driver, (By.CLASS_NAME, 'vod-loading-status'), '"Download starting..."')
+                files = scrape_util.monitor_folder_for_changes('./downloaded_files', known_files)
+
+                for file in files:
+                    if file.endswith('.rar'):
+                        futures.append(ingest.submit_archive(pipeline, file, destination_path, args.delete, args.delete_demos, known_hashes))
+                bar.next()
 
-    files = util.get_files_with_extension('./downloaded_files', 'rar')
+        driver.close()
 
-    with Bar("Extracting files", max=len(files)) as bar:
-        for file in files:
-            name = file.split('downloaded_files')[-1]
-            output_dir = os.path.normpath(f'{destination_path}{name.replace(".rar", "")}')
+        with Bar("Extracting and parsing files", max=len(futures)) as bar:
+            for future in futures:
+                duplicates += future.result()[1]
+                bar.next()
 
-            patoolib.extract_archive(file, program='unrar', outdir=output_dir)
-            if(args.delete):
-                os.remove(file)
-            bar.next()
-    
-    driver.close()
+    util.write_dedup_report(duplicates)
 
 
 if __name__ == "__main__":
@@ -107,6 +115,8 @@ if __name__ == "__main__":
     parser.add_argument('url', type=str, help='Path to the matches page of the team')
     parser.add_argument('-c', '--count', type=int, required=True, help='The number of replay files to download')
     parser.add_argument('-d', '--delete', action='store_true', help='Delete the .rar files after extracting')
+    parser.add_argument('--delete_demos', action='store_true', help='Delete the .dem files once they are parsed into the demo store')
+    parser.add_argument('--workers', type=int, default=None, help='Number of archives to extract and parse in parallel')
 
     args = parser.parse_args()
     main(args)
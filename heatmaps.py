@@ -1,15 +1,16 @@
 import os
 import merge_demo_files as merger
+import profiling
+import downsampling
+import kernels
 import argparse
 import util
 import matplotlib
 matplotlib.use('Agg')
 # Silence warning related to max amount of figures open at once
 matplotlib.rcParams['figure.max_open_warning'] = 0 
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
-import seaborn as sns
 import pandas as pd
+import numpy as np
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
@@ -28,74 +29,198 @@ def main():
     parser.add_argument('--min_vel', type=float, help="The minimum velocity to show in the heatmap. Ticks with velocity lower than this will not be shown")
     parser.add_argument('--map', type=str, help="The map of interest, all other maps will be ignored")
     parser.add_argument('--player', type=str, help="The player of interest, all other players will be ignored")
-
+    parser.add_argument('--stream', action='store_true', help="Process one demo at a time instead of merging all demos in memory")
+    parser.add_argument('--live_only', action='store_true', help="Ignore warmup, freeze time, halftime and post-round ticks, where players stand still at spawn")
+    parser.add_argument('--occupancy', action='store_true', help="Also generate occupancy heatmaps per player and map, summed over all matches")
+    parser.add_argument('--downsample', type=downsampling.downsample_spec, default=None, help=f"Ticks to keep, {downsampling.usage}. Defaults to every tick, hz:16 is much faster with similar heatmaps")
+    parser.add_argument('--backend', type=str, default='pandas', choices=['pandas', 'polars'], help="Load and filter the ticks with pandas, or as one lazy multi-threaded Polars query (ignored with --stream)")
+    parser.add_argument('--server', type=str, nargs='?', const='http://127.0.0.1:8765', default=None, help="Only generate the occupancy heatmaps, from the ticks held by a running tick_server.py")
+
+    profiling.add_arguments(parser)
     args = parser.parse_args()
-
-    ticks, _ = merger.merge_demo_files(args.folder, ['X', 'Y', 'Z', 'velocity'], True, players_of_interest=players_of_interest, limit=args.limit, map_name=args.map)
-    matches = util.parse_matches_from_ticks(ticks)
+    profiling.start(args)
+
+    if args.server:
+        plot_server_occupancy(args.server, [args.player] if args.player else players_of_interest, args.map, args.min_vel)
+        return
+
+    tick_props = ['X', 'Y', 'Z', 'velocity']
+    if args.stream:
+        demos = ((match, ticks) for match, ticks, _ in merger.iter_demo_ticks(args.folder, tick_props, players_of_interest=players_of_interest, limit=args.limit, map_name=args.map, live_only=args.live_only, downsample=args.downsample))
+    elif args.backend == 'polars':
+        import polars as pl
+        import lazy_backend
+
+        # The velocity and player filters run in the same query as the scan, only the kept rows reach pandas
+        query = lazy_backend.scan_demo_files(args.folder, tick_props, players_of_interest=players_of_interest, limit=args.limit, map_name=args.map, live_only=args.live_only, downsample=args.downsample)
+        if args.min_vel:
+            query = query.filter(pl.col('velocity') > args.min_vel)
+        if args.player:
+            query = query.filter(pl.col('name') == args.player)
+        ticks = lazy_backend.to_pandas(query)
+        demos = ticks.groupby('match', sort=False) if not ticks.empty else []
+    else:
+        ticks, _ = merger.merge_demo_files(args.folder, tick_props, True, players_of_interest=players_of_interest, limit=args.limit, map_name=args.map, live_only=args.live_only, downsample=args.downsample)
+        matches = util.parse_matches_from_ticks(ticks)
+        demos = ((match, ticks[ticks['match'] == match]) for match in matches['match'])
 
     print("Generating heatmaps")
-    # Generate heatmaps per round
-    for _, data in tqdm(matches.iterrows(), desc="Matches", total=len(matches)):
-        match = data['match']
-        
-        match_df = ticks[ticks['match'] == match]
-        players = util.parse_players_from_ticks(match_df)
-        maps = util.parse_maps_from_ticks(match_df)
-        map_name = maps['map'].tolist()[0]
+    occupancy = {}
+    # Generate heatmaps per match
+    for match, match_df in tqdm(demos, desc="Matches"):
+        if args.min_vel:
+            match_df = match_df[match_df['velocity'] > args.min_vel]
+
+        generate_match_heatmaps(match_df, match, args.player)
+
+        if args.occupancy:
+            accumulate_occupancy(occupancy, match_df)
+
+    for (player_name, map_name), counts in occupancy.items():
+        if args.player and player_name != args.player:
+            continue
+        plot_occupancy(
+            counts=counts,
+            map_name=map_name,
+            title=f"Occupancy of {player_name} on {map_name}",
+            save_path="occupancy",
+            save_filename=f"{player_name}_{map_name}",
+        )
+
+def plot_server_occupancy(server: str, players: list, map_name: str = None, min_vel: float = None):
+    """
+    Generates the occupancy heatmaps of `players` from the grids computed by a running tick server.
+    """
+    import tick_server
+    status = tick_server.query(server, 'status')
+    maps = [map_name] if map_name else status['maps']
+    for player_name in players:
+        if player_name not in status['players']:
+            print(f"{player_name} not found on the server")
+            continue
+        for map_name in maps:
+            try:
+                grid = tick_server.query(server, 'heatmap', player=player_name, map=map_name, min_vel=min_vel)
+            except RuntimeError:
+                # The player did not play this map
+                continue
+            plot_occupancy(
+                counts=np.array(grid['counts']),
+                map_name=map_name,
+                title=f"Occupancy of {player_name} on {map_name}",
+                save_path="occupancy",
+                save_filename=f"{player_name}_{map_name}",
+            )
 
-        print(f"\nMatch: {match}, map: {map_name}, players: {players['name'].tolist()}")
+def generate_match_heatmaps(match_df: pd.DataFrame, match: str, player: str = None):
+    players = util.parse_players_from_ticks(match_df)
+    maps = util.parse_maps_from_ticks(match_df)
+    if maps.empty:
+        return
+    map_name = maps['map'].tolist()[0]
 
-        if args.player:
-            players = players[players['name'] == args.player]
-        
-        # Generate per player
-        for _, data in tqdm(players.iterrows(), desc="Players", total=len(players),):
-            player_name = data['name']
-
-            map_df = match_df[match_df["map"] == map_name]
-            player_df = map_df[map_df["name"] == player_name]
-
-            if args.min_vel:
-                player_df = player_df[player_df['velocity'] > args.min_vel]
-
-            generate_heatmap(
-                df=player_df, 
-                map_name= map_name,
-                title=f"Heatmap of {player_name}'s Positions",
-                save_path=match,
-                save_filename=player_name + "_detailed",
-            )
-        
-        # # Generate average heatmap for match
-        # generate_heatmap(
-        #     df=match_df, 
-        #     map_name= map_name,
-        #     title="Heatmap of everyone's Positions",
-        #     save_path=match,
-        #     save_filename="average",
-        # )
+    print(f"\nMatch: {match}, map: {map_name}, players: {players['name'].tolist()}")
+
+    if player:
+        players = players[players['name'] == player]
+    
+    # Generate per player
+    for _, data in tqdm(players.iterrows(), desc="Players", total=len(players),):
+        player_name = data['name']
+
+        map_df = match_df[match_df["map"] == map_name]
+        player_df = map_df[map_df["name"] == player_name]
+
+        generate_heatmap(
+            df=player_df, 
+            map_name= map_name,
+            title=f"Heatmap of {player_name}'s Positions",
+            save_path=match,
+            save_filename=player_name + "_detailed",
+        )
+    
+    # # Generate average heatmap for match
+    # generate_heatmap(
+    #     df=match_df, 
+    #     map_name= map_name,
+    #     title="Heatmap of everyone's Positions",
+    #     save_path=match,
+    #     save_filename="average",
+    # )
+
+def accumulate_occupancy(occupancy: dict, ticks: pd.DataFrame):
+    """
+    Adds the position counts of every (player, map) in `ticks` to the grids in `occupancy`.
+    """
+    # The grids of all (player, map) in a single pass over the ticks
+    groups = ticks.groupby(['name', 'map'])
+    grids = kernels.grid_counts(ticks['X'].to_numpy(), ticks['Y'].to_numpy(), groups.ngroup().to_numpy(), groups.ngroups, kernels.location_edges)
+    for key, counts in zip(groups.size().index, grids):
+        occupancy[key] = occupancy[key] + counts if key in occupancy else counts
+
+def plot_occupancy(counts, map_name: str, title: str, save_path: str, save_filename: str):
+    import matplotlib.pyplot as plt
+    import matplotlib.image as mpimg
+
+    # Crop the grid to the visited area
+    visited_x = np.flatnonzero(counts.sum(axis=1))
+    visited_y = np.flatnonzero(counts.sum(axis=0))
+    if len(visited_x) == 0:
+        return
+    x_min, x_max = visited_x[0], visited_x[-1] + 1
+    y_min, y_max = visited_y[0], visited_y[-1] + 1
+    edges = kernels.location_edges
+    extent = [edges[x_min], edges[x_max], edges[y_min], edges[y_max]]
+
+    plt.figure(figsize=(10, 8))
+    ax = plt.gca()
+
+    map_path = f'./maps/{map_name}.jpg'
+    if os.path.exists(map_path):
+        background = mpimg.imread(map_path)
+        ax.imshow(background, extent=extent, aspect="auto", alpha=0.5, zorder=0)
+    else:
+        print(f"No map image found for {map_name}")
+
+    density = counts[x_min:x_max, y_min:y_max].T / counts.sum()
+    ax.imshow(np.ma.masked_equal(density, 0), extent=extent, origin="lower", cmap="magma", aspect="auto", alpha=0.8, zorder=1)
+
+    # Titles and labels
+    plt.title(title, fontsize=14)
+    plt.xlabel("X Coordinate")
+    plt.ylabel("Y Coordinate")
+
+    os.makedirs(f"heatmaps/{save_path}", exist_ok=True)
+    with profiling.stage('savefig'):
+        plt.savefig(f"heatmaps/{save_path}/{save_filename}.png")
+    plt.close()
 
 
 def generate_heatmap(df: pd.DataFrame, map_name: str, title: str, save_path: str, save_filename: str):
+    import matplotlib.pyplot as plt
+    import matplotlib.image as mpimg
+    import seaborn as sns
+
     # Create figure and axis
     plt.figure(figsize=(10, 8))
     ax = plt.gca()
 
     # Plot the heatmap
-    sns.kdeplot(
-        x=df["X"], 
-        y=df["Y"], 
-        fill=True, 
-        cmap="magma", 
-        thresh=0.05, 
-        levels=100,
-        ax=ax,
-        zorder=1,
-        bw_adjust=0.5,
-        # gridsize=100,
-        # thresh=0.05,
-    )
+    with profiling.stage('kde'):
+        profiling.count(len(df))
+        sns.kdeplot(
+            x=df["X"], 
+            y=df["Y"], 
+            fill=True, 
+            cmap="magma", 
+            thresh=0.05, 
+            levels=100,
+            ax=ax,
+            zorder=1,
+            bw_adjust=0.5,
+            # gridsize=100,
+            # thresh=0.05,
+        )
 
     map_path = f'./maps/{map_name}.jpg'
     if os.path.exists(map_path):
@@ -117,7 +242,8 @@ def generate_heatmap(df: pd.DataFrame, map_name: str, title: str, save_path: str
     # plt.show()
     if save_path and save_filename:
         os.makedirs(f"heatmaps/{save_path}", exist_ok=True)
-        plt.savefig(f"heatmaps/{save_path}/{save_filename}.png")
+        with profiling.stage('savefig'):
+            plt.savefig(f"heatmaps/{save_path}/{save_filename}.png")
     plt.close()
 
 
@@ -0,0 +1,116 @@
+import os
+import argparse
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List
+import util
+import merge_demo_files as merger
+import spectral
+
+# Union of the tick props used by the analysis scripts, so ingested demos serve all of them from the parsed store
+ingest_props = [
+    'X',
+    'Y',
+    'Z',
+    'velocity',
+    'pitch',
+    'yaw',
+    'ducking',
+    'is_airborne',
+    'duck_amount',
+    'aim_punch_angle',
+    'aim_punch_angle_vel',
+    'total_rounds_played',
+    'team_num',
+]
+
+
+def extract_archive(archive: str, destination_path: str) -> str:
+    """
+    Extracts a downloaded .rar archive into its own folder in `destination_path`.
+
+    :return: The folder the archive was extracted to
+    """
+    import patoolib
+
+    name = os.path.basename(archive)
+    output_dir = os.path.normpath(os.path.join(destination_path, name.replace(".rar", "")))
+    patoolib.extract_archive(archive, program='unrar', outdir=output_dir)
+
+    return output_dir
+
+
+def ingest_archive(archive: str, destination_path: str, tick_props: List[str] = None, delete_archive: bool = False, delete_demos: bool = False, exclude_hashes: set = None) -> tuple[List[str], List[dict]]:
+    """
+    Extracts an archive, parses every demo in it into its parsed store, and optionally removes the archive and .dem files.
+    Demos that duplicate another demo in the archive, or one of `exclude_hashes`, are not parsed.
+    A demo that fails to parse is reported and kept as it is, and the other demos of the archive are still ingested.
+
+    :param tick_props: Props to parse, `ingest_props` by default
+
+    :return: The match names of the ingested demos, and the skipped duplicates for `util.write_dedup_report`
+    """
+    output_dir = extract_archive(archive, destination_path)
+    if delete_archive:
+        os.remove(archive)
+
+    if tick_props is None:
+        tick_props = ingest_props
+
+    names, duplicates = [], []
+    for _, demo_file in util.find_demo_files(output_dir, exclude_hashes=exclude_hashes, duplicates=duplicates):
+        try:
+            ticks, events, info = merger.parse_demo(demo_file, tick_props)
+            merger.store_parsed_demo(demo_file, ticks, events, info, tick_props)
+            # Computed once while the ticks are in memory, so comparisons only load the band vectors
+            spectral.store_spectra(demo_file, ticks)
+        except Exception as e:
+            # demoparser2 raises plain exceptions for corrupt or truncated demos
+            print(f"Error: failed to ingest {demo_file}, it is kept unparsed: {e}")
+            continue
+        if delete_demos:
+            os.remove(demo_file)
+        names.append(util.get_match_name(demo_file))
+
+    return names, duplicates
+
+
+def start_pipeline(workers: int = None) -> ProcessPoolExecutor:
+    """
+    Starts the worker pool that archives are submitted to with `submit_archive` as soon as their download completes.
+    """
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def submit_archive(pipeline: ProcessPoolExecutor, archive: str, destination_path: str, delete_archive: bool = False, delete_demos: bool = False, exclude_hashes: set = None) -> Future:
+    return pipeline.submit(ingest_archive, archive, destination_path, ingest_props, delete_archive, delete_demos, exclude_hashes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract and parse downloaded demo archives into the parsed demo store')
+    parser.add_argument('folder', type=util.dir_path, help='Path to the folder containing .rar files')
+    parser.add_argument('destination', type=str, help='Path to the folder to extract the demos to')
+    parser.add_argument('--workers', type=int, default=None, help='Number of archives to process in parallel (defaults to the number of CPUs)')
+    parser.add_argument('-d', '--delete', action='store_true', help='Delete the .rar files after extracting')
+    parser.add_argument('--delete_demos', action='store_true', help='Delete the .dem files after parsing')
+
+    args = parser.parse_args()
+
+    os.makedirs(args.destination, exist_ok=True)
+    archives = util.get_files_with_extension(args.folder, 'rar')
+    # Demos that were ingested before, possibly from another archive, are not parsed again
+    duplicates = []
+    known_hashes = util.find_demo_hashes(args.destination, duplicates=duplicates)
+
+    with start_pipeline(args.workers) as pipeline:
+        futures = [submit_archive(pipeline, archive, args.destination, args.delete, args.delete_demos, known_hashes) for archive in archives]
+        for archive, future in zip(archives, futures):
+            names, archive_duplicates = future.result()
+            duplicates += archive_duplicates
+            print(f"{archive}: ingested {', '.join(names)}")
+
+    # Written once here, as the workers only see the duplicates of their own archive
+    util.write_dedup_report(duplicates)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+import importlib.util
+from types import SimpleNamespace
+import numpy as np
+
+# Backend of the kernels: 'numba' runs the compiled kernels, 'numpy' the numpy versions, and 'python' the kernels
+# without compiling them, which is only useful to check the numpy versions on small inputs. None picks numba if installed
+backend = None
+backends = ['numba', 'numpy', 'python']
+
+# The compiled kernels, compiled on first use, so numba is not imported by CLIs that never run a kernel.
+# They run on numba's thread pool, whose threads do not survive a fork, so processes that run kernels before starting
+# a process pool spawn its workers instead, see `evaluation.run_folds`
+_compiled = None
+
+# Replaced by numba.prange when the kernels are compiled. Without numba the kernels loop over the players in order
+prange = range
+
+# Fixed bins covering the coordinate range of all maps, so counts can be summed across demos.
+# Shared by the location sketches, their bootstrap and the occupancy heatmaps
+location_edges = np.linspace(-4096, 4096, 257)
+# Wasserstein distance between two location distributions, in world units, at which they are considered completely different
+max_location_distance = 1200
+
+
+def use_backend(name: str = None):
+    global backend
+    if name not in backends + [None]:
+        raise ValueError(f"Unknown kernel backend {name}, expected one of {backends}")
+    backend = name
+
+
+def get_backend() -> str:
+    if backend is None:
+        return 'numba' if importlib.util.find_spec('numba') is not None else 'numpy'
+    return backend
+
+
+def _kernels() -> SimpleNamespace:
+    global _compiled, prange, _bin
+    if get_backend() == 'python':
+        return SimpleNamespace(derivatives=_derivatives_kernel, histograms=_histograms_kernel, wasserstein=_wasserstein_kernel, binned_counts=_binned_counts_kernel, grid_counts=_grid_counts_kernel)
+
+    if _compiled is None:
+        import numba
+
+        # Kernels call `_bin` and `prange` through the module globals, so they are rebound before the kernels compile
+        prange = numba.prange
+        _bin = numba.njit(cache=True, error_model='numpy')(_bin)
+        compile = numba.njit(parallel=True, cache=True, error_model='numpy')
+        _compiled = SimpleNamespace(
+            derivatives=compile(_derivatives_kernel),
+            histograms=compile(_histograms_kernel),
+            wasserstein=compile(_wasserstein_kernel),
+            binned_counts=compile(_binned_counts_kernel),
+            grid_counts=compile(_grid_counts_kernel),
+        )
+    return _compiled
+
+
+def _blocks(codes: np.ndarray, groups: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rows of every group as consecutive blocks: the rows ordered by group, and the offset of every group's block.
+    Rows with a negative code, e.g. a missing player name, are left out.
+    """
+    order = np.argsort(codes, kind='stable')
+    order = order[np.count_nonzero(codes < 0):]
+    offsets = np.zeros(groups + 1, dtype='int64')
+    offsets[1:] = np.cumsum(np.bincount(codes[order], minlength=groups))
+    return order, offsets
+
+
+def _bin(value, edges):
+    # Bin of `value` on evenly spaced `edges`, the same bin as np.histogram, or -1 if outside the edges or NaN
+    bins = len(edges) - 1
+    if not (edges[0] <= value <= edges[-1]):
+        return -1
+    index = int((value - edges[0]) / (edges[-1] - edges[0]) * bins)
+    if index == bins:
+        index -= 1
+    if value < edges[index]:
+        index -= 1
+    elif index < bins - 1 and value >= edges[index + 1]:
+        index += 1
+    return index
+
+
+def _derivatives_kernel(values, order, offsets, out):
+    for group in prange(len(offsets) - 1):
+        last_value, last_speed, last_acceleration = np.nan, np.nan, np.nan
+        for position in range(offsets[group], offsets[group + 1]):
+            row = order[position]
+            speed = values[row] - last_value
+            acceleration = speed - last_speed
+            smoothness = acceleration - last_acceleration
+            out[0, row] = 0.0 if np.isnan(speed) else speed
+            out[1, row] = 0.0 if np.isnan(acceleration) else acceleration
+            out[2, row] = 0.0 if np.isnan(smoothness) else smoothness
+            last_value, last_speed, last_acceleration = values[row], speed, acceleration
+
+
+def derivatives(values: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """
+    First, second and third difference of `values` between consecutive rows of the same group, like a grouped
+    `Series.diff()` applied three times with the missing differences filled with 0.
+
+    :param codes: Group of every row, e.g. from `pd.factorize` of the player names. Rows with a negative code get NaN
+    :return: Array of shape (3, rows)
+    """
+    values = np.asarray(values, dtype='float64')
+    codes = np.asarray(codes, dtype='int64')
+    groups = codes.max() + 1 if len(codes) else 0
+    order, offsets = _blocks(codes, groups)
+    out = np.full((3, len(values)), np.nan)
+
+    if get_backend() == 'numpy':
+        starts = offsets[:-1][np.diff(offsets) > 0]
+        current = values[order]
+        for level in range(3):
+            current = np.diff(current, prepend=np.nan)
+            current[starts] = np.nan
+            out[level, order] = np.where(np.isnan(current), 0.0, current)
+        return out
+
+    _kernels().derivatives(values, order, offsets, out)
+    return out
+
+
+def _histograms_kernel(columns, bins, out):
+    for column in prange(columns.shape[0]):
+        values = columns[column]
+        low, high = np.inf, -np.inf
+        for value in values:
+            if value < low:
+                low = value
+            if value > high:
+                high = value
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+
+        edges = np.linspace(low, high, bins + 1)
+        # numba's linspace can round the last edge below `high`, which would leave the maximum out
+        edges[-1] = high
+        for value in values:
+            index = _bin(value, edges)
+            if index >= 0:
+                out[column, index] += 1
+        total = out[column].sum()
+        for index in range(bins):
+            out[column, index] /= total * (edges[index + 1] - edges[index])
+
+
+def histograms(columns: np.ndarray, bins: int = 50) -> np.ndarray:
+    """
+    Density histogram of every column, on `bins` bins over the range of the column, like `np.histogram(density=True)`.
+
+    :param columns: Array of shape (columns, rows)
+    :return: Array of shape (columns, bins)
+    """
+    columns = np.ascontiguousarray(columns, dtype='float64')
+    if get_backend() == 'numpy':
+        return np.array([np.histogram(values, bins=bins, density=True)[0] for values in columns]).reshape(len(columns), bins)
+
+    # The range of a column with NaN or infinite values has no finite edges, which np.histogram refuses too
+    finite = np.isfinite(columns).all(axis=1)
+    if not finite.all():
+        values = columns[~finite][0]
+        raise ValueError(f"autodetected range of [{values.min()}, {values.max()}] is not finite")
+
+    out = np.zeros((len(columns), bins))
+    _kernels().histograms(columns, bins, out)
+    return out
+
+
+def _wasserstein_kernel(new_columns, known_columns, out):
+    for column in prange(new_columns.shape[0]):
+        new_values, known_values = np.sort(new_columns[column]), np.sort(known_columns[column])
+        new_size, known_size = len(new_values), len(known_values)
+        # NaN sorts last, and makes the distance NaN, as in scipy
+        if np.isnan(new_values[-1]) or np.isnan(known_values[-1]):
+            out[column] = np.nan
+            continue
+
+        # Walk both sorted arrays at once, adding the area between the two CDFs up to every next value
+        i, j = 0, 0
+        total = 0.0
+        previous = min(new_values[0], known_values[0])
+        while i < new_size or j < known_size:
+            if j >= known_size or (i < new_size and new_values[i] <= known_values[j]):
+                value = new_values[i]
+            else:
+                value = known_values[j]
+            if i / new_size != j / known_size:
+                total += abs(i / new_size - j / known_size) * (value - previous)
+            while i < new_size and new_values[i] == value:
+                i += 1
+            while j < known_size and known_values[j] == value:
+                j += 1
+            previous = value
+        out[column] = total
+
+
+def wasserstein(new_columns: np.ndarray, known_columns: np.ndarray) -> np.ndarray:
+    """
+    Wasserstein distance between every pair of columns, like `scipy.stats.wasserstein_distance`.
+
+    :param new_columns: Array of shape (columns, rows)
+    :param known_columns: Array of shape (columns, other rows)
+    :return: One distance per column
+    """
+    new_columns = np.ascontiguousarray(new_columns, dtype='float64')
+    known_columns = np.ascontiguousarray(known_columns, dtype='float64')
+    if get_backend() == 'numpy':
+        from scipy.stats import wasserstein_distance
+        return np.array([wasserstein_distance(new_values, known_values) for new_values, known_values in zip(new_columns, known_columns)])
+
+    if new_columns.shape[1] == 0 or known_columns.shape[1] == 0:
+        raise ValueError("Distribution can't be empty.")
+    out = np.zeros(len(new_columns))
+    _kernels().wasserstein(new_columns, known_columns, out)
+    return out
+
+
+def _binned_counts_kernel(columns, order, offsets, edges, out):
+    for group in prange(len(offsets) - 1):
+        for position in range(offsets[group], offsets[group + 1]):
+            row = order[position]
+            for column in range(columns.shape[0]):
+                index = _bin(columns[column, row], edges)
+                if index >= 0:
+                    out[group, column, index] += 1
+
+
+def binned_counts(columns: np.ndarray, codes: np.ndarray, groups: int, edges: np.ndarray) -> np.ndarray:
+    """
+    Histogram of every column per group, on evenly spaced `edges`, like `np.histogram(bins=edges)` of every group's rows.
+
+    :param columns: Array of shape (columns, rows)
+    :param codes: Group of every row, rows with a negative code are left out
+    :return: Integer counts of shape (groups, columns, bins)
+    """
+    columns = np.ascontiguousarray(columns, dtype='float64')
+    codes = np.asarray(codes, dtype='int64')
+    bins = len(edges) - 1
+    if get_backend() == 'numpy':
+        index = np.searchsorted(edges, columns, side='right') - 1
+        index[columns == edges[-1]] = bins - 1
+        keep = (index >= 0) & (index < bins) & (codes >= 0)
+        flat = (codes * len(columns) + np.arange(len(columns))[:, None]) * bins + index
+        return np.bincount(flat[keep], minlength=groups * len(columns) * bins).reshape(groups, len(columns), bins)
+
+    order, offsets = _blocks(codes, groups)
+    out = np.zeros((groups, len(columns), bins), dtype='int64')
+    _kernels().binned_counts(columns, order, offsets, np.asarray(edges, dtype='float64'), out)
+    return out
+
+
+def _grid_counts_kernel(x, y, order, offsets, edges, out):
+    for group in prange(len(offsets) - 1):
+        for position in range(offsets[group], offsets[group + 1]):
+            row = order[position]
+            i, j = _bin(x[row], edges), _bin(y[row], edges)
+            if i >= 0 and j >= 0:
+                out[group, i, j] += 1
+
+
+def grid_counts(x: np.ndarray, y: np.ndarray, codes: np.ndarray, groups: int, edges: np.ndarray) -> np.ndarray:
+    """
+    2D histogram of the (x, y) positions per group, on evenly spaced `edges` along both axes,
+    like `np.histogram2d(bins=[edges, edges])` of every group's rows.
+
+    :param codes: Group of every row, rows with a negative code are left out
+    :return: Counts of shape (groups, bins, bins)
+    """
+    x, y = np.asarray(x, dtype='float64'), np.asarray(y, dtype='float64')
+    codes = np.asarray(codes, dtype='int64')
+    bins = len(edges) - 1
+    if get_backend() == 'numpy':
+        index = [np.searchsorted(edges, values, side='right') - 1 for values in (x, y)]
+        for axis, values in zip(index, (x, y)):
+            axis[values == edges[-1]] = bins - 1
+        keep = (index[0] >= 0) & (index[0] < bins) & (index[1] >= 0) & (index[1] < bins) & (codes >= 0)
+        flat = (codes * bins + index[0]) * bins + index[1]
+        return np.bincount(flat[keep], minlength=groups * bins * bins).reshape(groups, bins, bins).astype('float64')
+
+    order, offsets = _blocks(codes, groups)
+    out = np.zeros((groups, bins, bins))
+    _kernels().grid_counts(x, y, order, offsets, np.asarray(edges, dtype='float64'), out)
+    return out
@@ -0,0 +1,105 @@
+import pickle
+from typing import List
+import numpy as np
+import pandas as pd
+import polars as pl
+from tqdm import tqdm
+import util
+import cache
+import rounds
+import downsampling
+import profiling
+import merge_demo_files as merger
+
+# Lazy counterpart of `merge_demo_files`: scans the column files of the parsed demo stores with Polars, so the filters,
+# groupbys and derived columns of a script run as a single multi-threaded query, reading only the columns it uses.
+# Results are converted to pandas with `to_pandas`, where the plotting code takes over.
+
+
+def _read_events(demo_file: str):
+    with open(demo_file + util.PARSED_DEMO_SUFFIX + '/events.pkl', 'rb') as file:
+        return pickle.load(file)
+
+
+def _ensure_stored(demo_file: str, tick_props: List[str], map_name: str = None) -> dict:
+    """
+    Makes sure the parsed store of `demo_file` contains all `tick_props`, parsing the missing ones like `merge_demo_files`.
+
+    :return: The store info, or None if the demo is not on `map_name` or can not be loaded
+    """
+    stored_name = demo_file + util.PARSED_DEMO_SUFFIX
+    stored = merger.read_store_info(stored_name)
+    if stored is None or merger.get_missing_props(stored, tick_props):
+        if merger.load_demo(demo_file, tick_props, map_name) is None:
+            return None
+        stored = merger.read_store_info(stored_name)
+
+    if map_name is not None and stored['header']['map_name'] != map_name:
+        return None
+    return stored
+
+
+def _selected_ticks(demo_file: str, events, annotate_rounds: bool, live_only: bool, downsample: str) -> pd.DataFrame:
+    """
+    The ticks of a demo kept by `downsample` and `live_only`, with their round and phase if needed.
+    Computed once per tick rather than per row, with the same functions as `iter_demo_ticks`.
+    """
+    tick = np.unique(cache.read_table(demo_file + util.PARSED_DEMO_SUFFIX + '/keys', ['tick']).column(0).to_numpy())
+    ticks = downsampling.downsample(pd.DataFrame({'tick': tick}), events, downsample)
+    if live_only:
+        ticks = rounds.live_ticks(ticks, events)
+    elif annotate_rounds:
+        ticks = rounds.assign_phases(ticks, events)
+    return ticks
+
+
+def scan_demo(demo_file: str, name: str, stored: dict, tick_props: List[str], players_of_interest: List[str] = None, annotate_rounds: bool = False, live_only: bool = False, downsample: str = None) -> pl.LazyFrame:
+    """
+    Lazily scans a single parsed demo store, with the same columns and filters as `iter_demo_ticks`.
+    """
+    stored_name = demo_file + util.PARSED_DEMO_SUFFIX
+    scans = [pl.scan_ipc(stored_name + '/keys')]
+    # Props recorded as unavailable have no column file, and are left out like in `load_parsed_demo`
+    scans += [pl.scan_ipc(f'{stored_name}/{prop}') for prop in dict.fromkeys(tick_props) if prop in stored['props'] and prop not in merger.BASE_COLUMNS]
+    ticks = pl.concat(scans, how='horizontal')
+
+    if players_of_interest is not None:
+        ticks = ticks.filter(pl.col('name').is_in(players_of_interest))
+
+    if annotate_rounds or live_only or (downsample is not None and downsample.startswith('window:')):
+        selected = _selected_ticks(demo_file, _read_events(demo_file), annotate_rounds, live_only, downsample)
+        ticks = ticks.join(pl.from_pandas(selected).lazy(), on='tick', how='inner', maintain_order='left')
+    elif downsample is not None:
+        ticks = ticks.filter(pl.col('tick') % downsampling.tick_step(downsample) == 0)
+
+    return ticks.with_columns(match=pl.lit(name), map=pl.lit(stored['header']['map_name']))
+
+
+def scan_demo_files(folder_path: str, tick_props: List[str], players_of_interest: List[str] = None, limit: int = None, map_name: str = None, annotate_rounds: bool = False, live_only: bool = False, downsample: str = None, exclude_hashes: set = None) -> pl.LazyFrame:
+    """
+    Lazy version of `merge_demo_files`, with the same filters. Demos on other maps are skipped from their header,
+    and nothing else is read until the query is collected.
+    """
+    demo_files = util.find_demo_files(folder_path, limit=limit, exclude_hashes=exclude_hashes)
+
+    scans = []
+    for name, demo_file in tqdm(demo_files, desc="Scanning demo files", total=len(demo_files)):
+        stored = _ensure_stored(demo_file, tick_props, map_name)
+        if stored is None:
+            continue
+        scans.append(scan_demo(demo_file, name, stored, tick_props, players_of_interest, annotate_rounds, live_only, downsample))
+
+    if not scans:
+        return pl.LazyFrame()
+    return pl.concat(scans, how='vertical_relaxed')
+
+
+def to_pandas(ticks: pl.LazyFrame) -> pd.DataFrame:
+    """
+    Runs the query and converts the result for the pandas and plotting code.
+    """
+    with profiling.stage('collect'):
+        ticks = ticks.collect().to_pandas()
+        profiling.count(len(ticks))
+    return ticks
+
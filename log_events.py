@@ -0,0 +1,265 @@
+import os
+import re
+import glob
+import shutil
+import argparse
+from datetime import datetime
+from typing import Dict, Iterable, List
+import pyarrow as pa
+import pyarrow.parquet as pq
+import util
+
+# Every log line starts with `L <date> - <time>: `
+LINE_PREFIX = re.compile(r'L (\d{2}/\d{2}/\d{4} - \d{2}:\d{2}:\d{2}): ')
+TIME_FORMAT = "%m/%d/%Y - %H:%M:%S"
+
+
+def player(prefix: str) -> str:
+    return rf'"(?P<{prefix}_name>.*?)<(?P<{prefix}_userid>-?\d*)><(?P<{prefix}_steamid>.*?)><(?P<{prefix}_team>.*?)>"'
+
+
+def position(prefix: str) -> str:
+    return rf'\[(?P<{prefix}_x>-?\d+) (?P<{prefix}_y>-?\d+) (?P<{prefix}_z>-?\d+)\]'
+
+
+def player_columns(prefix: str, with_position: bool = False) -> Dict[str, str]:
+    columns = {
+        f'{prefix}_name': 'str',
+        f'{prefix}_userid': 'int',
+        f'{prefix}_steamid': 'str',
+        f'{prefix}_team': 'str',
+    }
+    if with_position:
+        columns.update({f'{prefix}_x': 'float', f'{prefix}_y': 'float', f'{prefix}_z': 'float'})
+    return columns
+
+
+# Known line types: event name -> (cheap substring guard, pattern for the part after the prefix, typed columns)
+# The first entry whose guard and pattern match wins, so more specific entries go first.
+EVENTS = {
+    'kill': (
+        ' killed ',
+        re.compile(rf'{player("attacker")} {position("attacker")} killed {player("victim")} {position("victim")} with "(?P<weapon>[^"]*)"(?: \((?P<modifiers>[^)]*)\))?'),
+        {**player_columns('attacker', True), **player_columns('victim', True), 'weapon': 'str', 'modifiers': 'str'},
+    ),
+    'damage': (
+        ' attacked ',
+        re.compile(rf'{player("attacker")} {position("attacker")} attacked {player("victim")} {position("victim")} with "(?P<weapon>[^"]*)" '
+                   r'\(damage "(?P<damage>\d+)"\) \(damage_armor "(?P<damage_armor>\d+)"\) \(health "(?P<health>\d+)"\) '
+                   r'\(armor "(?P<armor>\d+)"\) \(hitgroup "(?P<hitgroup>[^"]*)"\)'),
+        {**player_columns('attacker', True), **player_columns('victim', True), 'weapon': 'str',
+         'damage': 'int', 'damage_armor': 'int', 'health': 'int', 'armor': 'int', 'hitgroup': 'str'},
+    ),
+    'purchase': (
+        ' purchased ',
+        re.compile(rf'{player("player")} purchased "(?P<item>[^"]*)"'),
+        {**player_columns('player'), 'item': 'str'},
+    ),
+    'chat': (
+        ' say',
+        re.compile(rf'{player("player")} (?P<channel>say|say_team) "(?P<message>.*)"'),
+        {**player_columns('player'), 'channel': 'str', 'message': 'str'},
+    ),
+    'team_switch': (
+        ' switched from team ',
+        re.compile(r'"(?P<player_name>.*?)<(?P<player_userid>-?\d*)><(?P<player_steamid>.*?)>" switched from team <(?P<from_team>[^>]*)> to <(?P<to_team>[^>]*)>'),
+        {'player_name': 'str', 'player_userid': 'int', 'player_steamid': 'str', 'from_team': 'str', 'to_team': 'str'},
+    ),
+    'round_start': (
+        '"Round_Start"',
+        re.compile(r'World triggered "Round_Start"'),
+        {},
+    ),
+    'round_end': (
+        '"Round_End"',
+        re.compile(r'World triggered "Round_End"'),
+        {},
+    ),
+    'match_start': (
+        '"Match_Start"',
+        re.compile(r'World triggered "Match_Start" on "(?P<map>[^"]*)"'),
+        {'map': 'str'},
+    ),
+    'round_win': (
+        'Team "',
+        re.compile(r'Team "(?P<team>[^"]*)" triggered "(?P<reason>[^"]*)" \(CT "(?P<ct_score>\d+)"\) \(T "(?P<t_score>\d+)"\)'),
+        {'team': 'str', 'reason': 'str', 'ct_score': 'int', 't_score': 'int'},
+    ),
+}
+
+# Columns shared by all events. `round` counts the Round_Start lines seen so far in the log,
+# which lines up with the `total_rounds_played` tick prop of the demo (+1 during a round).
+COMMON_COLUMNS = {
+    'time': 'time',
+    'log_file': 'str',
+    'line_number': 'int',
+    'round': 'int',
+}
+
+TYPES = {
+    'str': pa.string(),
+    'int': pa.int64(),
+    'float': pa.float32(),
+    'time': pa.timestamp('s'),
+}
+
+CONVERTERS = {
+    'str': lambda value: value,
+    'int': lambda value: int(value) if value else None,
+    'float': lambda value: float(value) if value else None,
+    'time': lambda value: datetime.strptime(value, TIME_FORMAT),
+}
+
+
+def event_schema(event: str) -> pa.Schema:
+    columns = {**COMMON_COLUMNS, **EVENTS[event][2]}
+    return pa.schema([(column, TYPES[kind]) for column, kind in columns.items()])
+
+
+def parse_line(line: str):
+    """
+    Parses a single log line into an (event, time, values) tuple, or None when the line type is unknown.
+    """
+    prefix = LINE_PREFIX.match(line)
+    if not prefix:
+        return None
+
+    body = line[prefix.end():].rstrip('\r\n')
+    for event, (guard, pattern, columns) in EVENTS.items():
+        if guard not in body:
+            continue
+        match = pattern.match(body)
+        if match:
+            values = {column: CONVERTERS[kind](match.group(column)) for column, kind in columns.items()}
+            return event, prefix.group(1), values
+
+    return None
+
+
+def parse_events(lines: Iterable[str], log_file: str, first_line: int = 1, round_number: int = 0):
+    """
+    Generator of (event, record) tuples for every known line in `lines`.
+
+    :param first_line: Line number of the first line, to continue numbering when `lines` is the rest of a log
+    :param round_number: Rounds started before the first line
+    """
+    for line_number, line in enumerate(lines, start=first_line):
+        parsed = parse_line(line)
+        if parsed is None:
+            continue
+
+        event, time, values = parsed
+        if event == 'round_start':
+            round_number += 1
+
+        record = {
+            'time': CONVERTERS['time'](time),
+            'log_file': log_file,
+            'line_number': line_number,
+            'round': round_number,
+            **values,
+        }
+        yield event, record
+
+
+def remove_log(dir_dest: str, log_file: str):
+    """
+    Removes all stored events of a log, written by `write_events` or `write_event_part`.
+    """
+    for path in glob.glob(os.path.join(glob.escape(dir_dest), "*", "date=*", f"log={glob.escape(log_file)}")):
+        shutil.rmtree(path)
+
+
+def write_events(file: str, dir_dest: str, batch_size: int = 100_000) -> Dict[str, int]:
+    """
+    Streams the events of a log file to Parquet, partitioned as `<dir_dest>/<event>/date=<date>/log=<log>/part-0.parquet`.
+    At most `batch_size` rows per event type and date are held in memory at once.
+    The events stored for the log before are replaced, including the parts written by `write_event_part`.
+
+    :return: Number of rows written per event type
+    """
+    log_file = os.path.basename(file).rsplit(".", 1)[0]
+    remove_log(dir_dest, log_file)
+    buffers: Dict[tuple, List[dict]] = {}
+    writers: Dict[tuple, pq.ParquetWriter] = {}
+    counts: Dict[str, int] = {}
+
+    def flush(key):
+        event, date = key
+        if key not in writers:
+            path = os.path.join(dir_dest, event, f"date={date}", f"log={log_file}")
+            os.makedirs(path, exist_ok=True)
+            writers[key] = pq.ParquetWriter(os.path.join(path, "part-0.parquet"), event_schema(event))
+        writers[key].write_table(pa.Table.from_pylist(buffers[key], schema=writers[key].schema))
+        buffers[key] = []
+
+    try:
+        with open(file, "r", errors="replace") as lines:
+            for event, record in parse_events(lines, log_file):
+                key = (event, record['time'].date().isoformat())
+                buffers.setdefault(key, []).append(record)
+                counts[event] = counts.get(event, 0) + 1
+                if len(buffers[key]) >= batch_size:
+                    flush(key)
+
+        for key, buffer in buffers.items():
+            if buffer:
+                flush(key)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return counts
+
+
+def write_event_part(events: Iterable[tuple], dir_dest: str, log_file: str, part: int) -> Dict[str, int]:
+    """
+    Writes (event, record) tuples from `parse_events` as one more part of the partitions of `write_events`, e.g. for the
+    lines appended to a log since it was last read. Writing the same part again replaces it. The parts are named
+    `follow-<part>.parquet`, so they never replace the `part-0.parquet` of `write_events`.
+
+    :param part: Number of the part, unique per log, e.g. the byte offset the lines start at
+    :return: Number of rows written per event type
+    """
+    partitions: Dict[tuple, List[dict]] = {}
+    for event, record in events:
+        partitions.setdefault((event, record['time'].date().isoformat()), []).append(record)
+
+    counts: Dict[str, int] = {}
+    for (event, date), records in partitions.items():
+        path = os.path.join(dir_dest, event, f"date={date}", f"log={log_file}")
+        os.makedirs(path, exist_ok=True)
+        pq.write_table(pa.Table.from_pylist(records, schema=event_schema(event)), os.path.join(path, f"follow-{part}.parquet"))
+        counts[event] = counts.get(event, 0) + len(records)
+    return counts
+
+
+def load_events(dir_dest: str, event: str, filters=None) -> pa.Table:
+    """
+    Loads the stored events of one type, e.g. `load_events(dir, 'kill', [('round', '=', 3)])`.
+    """
+    return pq.read_table(os.path.join(dir_dest, event), filters=filters, partitioning="hive")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse cs2 server logs into typed event tables stored as Parquet')
+    parser.add_argument('--srcdir', type=util.dir_path, help='Path to the directory containing .log files')
+    parser.add_argument('--srcfile', type=util.file_path, help='Path to a single .log file')
+    parser.add_argument('--dstdir', type=str, required=True, help='Path to the directory for the Parquet output')
+    parser.add_argument('--batch_size', type=int, default=100_000, help='Rows per event type to buffer before writing')
+    args = parser.parse_args()
+
+    if args.srcdir:
+        files = util.get_files_with_extension(args.srcdir, '.log')
+    elif args.srcfile:
+        files = [args.srcfile]
+    else:
+        raise argparse.ArgumentTypeError(f"need either a source file or a source directory")
+
+    for file in files:
+        counts = write_events(file, args.dstdir, args.batch_size)
+        print(f"{file}: " + ", ".join(f"{count} {event}" for event, count in sorted(counts.items())))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,60 +1,234 @@
+import json
 import pickle
-from time import strftime, localtime
 from typing import List
 import util
+import cache
+import rounds
+import downsampling
+import profiling
 import pandas as pd
 import os
-import hashlib
 from tqdm import tqdm
 
-# TODO: Filter by players of interest, as to not load all players into memory
-def merge_demo_files(folder_path : str, tick_props : List[str], save : bool = True, players_of_interest : List[str] = None, limit: int = None, map_name: str = None):
-    input_hash = hashlib.sha1((folder_path + str(tick_props) + str(players_of_interest) + (str(limit) if limit else "") + (map_name if map_name else "")).encode('utf-8')).hexdigest()
-    stored_name = f'./stored_dfs/{input_hash}'
-    if os.path.exists(stored_name):
-        print(f"Found stored data in: {input_hash}")
-        merged_ticks = pd.read_feather(stored_name+'/merged_ticks')
-        with open(stored_name+'/merged_events.pkl', 'rb') as file:
-            merged_events = pickle.load(file)
-            
-        
-        return merged_ticks, merged_events
-
-    # Parse all demo files in the folder
-    parsers = util.parse_demos_from_folder(folder_path, limit=limit)
+# Columns that are always present in parsed ticks, or added while merging, rather than requested tick props
+BASE_COLUMNS = ['tick', 'steamid', 'name', 'match', 'map']
+# Columns identifying a row of parsed ticks, stored once per demo
+KEY_COLUMNS = ['tick', 'steamid', 'name']
+# Bump when the layout of the parsed demo store changes
+STORE_VERSION = 2
 
-    # Merge the demo files
-    merged_ticks = pd.DataFrame()
-    merged_events = []
+def parse_demo(demo_file: str, tick_props: List[str], map_name: str = None):
+    """
+    Parses the header, ticks and events of a single demo.
+
+    :return: (ticks, events, info) tuple, or None if the demo is not on `map_name`
+    """
+    from demoparser2 import DemoParser
+
+    parser = DemoParser(demo_file)
+    info = parser.parse_header()
+    if map_name is not None and info['map_name'] != map_name:
+        return None
+
+    ticks = parser.parse_ticks(wanted_props=tick_props)
+    events = parser.parse_events(event_name=['all'])
+
+    return ticks, events, info
+
+def write_atomic(path: str, write):
+    """
+    Calls `write` with a temporary path and moves the result to `path`, so readers never see a partially written file.
+    Used for every file of a parsed demo store, including files other modules add to it.
+    """
+    write(path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+def _pickle_to(data):
+    def write(path):
+        with open(path, 'wb') as file:
+            pickle.dump(data, file)
+    return write
+
+def _json_to(data):
+    def write(path):
+        with open(path, 'w') as file:
+            json.dump(data, file)
+    return write
+
+def read_store_info(stored_name: str):
+    """
+    Reads the info.json of a parsed demo store, or returns None if the store is missing or has an older layout.
+    """
+    if not os.path.exists(stored_name+'/info.json'):
+        return None
+    with open(stored_name+'/info.json', 'r') as file:
+        stored = json.load(file)
+    return stored if stored.get('version') == STORE_VERSION else None
+
+def store_parsed_demo(demo_file: str, ticks: pd.DataFrame, events, info, tick_props: List[str]):
+    """
+    Stores a parsed demo next to its .dem file, with every tick prop in its own column file.
+    Props parsed later are added to an existing store, so the .dem can be deleted once all needed props are stored.
+
+    Requested props the parser did not return are recorded as unavailable, with a warning, so they are not parsed
+    again on every run.
+
+    :param events: The parsed events, or None to keep the events already in the store
+    """
+    stored_name = demo_file + util.PARSED_DEMO_SUFFIX
+    os.makedirs(stored_name, exist_ok=True)
+    stored = read_store_info(stored_name)
+    ticks = ticks.reset_index(drop=True)
+
+    if stored is None:
+        stored = {'version': STORE_VERSION, 'header': info, 'hash': util.demo_hash(demo_file), 'rows': len(ticks), 'props': []}
+        write_atomic(stored_name+'/keys', lambda path: cache.write_frame(ticks[KEY_COLUMNS], path))
+    elif len(ticks) != stored['rows'] or not ticks[['tick', 'steamid']].equals(cache.read_frame(stored_name+'/keys', columns=['tick', 'steamid'])):
+        # Align newly parsed props on the rows that are already stored
+        keys = cache.read_frame(stored_name+'/keys', columns=['tick', 'steamid'])
+        ticks = keys.merge(ticks.drop_duplicates(subset=['tick', 'steamid']), on=['tick', 'steamid'], how='left')
+
+    if events is not None:
+        write_atomic(stored_name+'/events.pkl', _pickle_to(events))
+
+    for prop in tick_props:
+        if prop in BASE_COLUMNS:
+            continue
+        if prop not in ticks.columns:
+            print(f"Warning: {demo_file} has no prop {prop}, it is recorded as unavailable and left out of the ticks")
+            stored.setdefault('unavailable', [])
+            if prop not in stored['unavailable']:
+                stored['unavailable'].append(prop)
+            continue
+        write_atomic(f'{stored_name}/{prop}', lambda path: cache.write_frame(ticks[[prop]], path))
+        if prop not in stored['props']:
+            stored['props'].append(prop)
+
+    # Written last, props are only visible once their column file is complete
+    write_atomic(stored_name+'/info.json', _json_to(stored))
+
+def load_parsed_demo(demo_file: str, tick_props: List[str]):
+    """
+    Loads a demo stored by `store_parsed_demo`, projected onto `tick_props`.
 
+    :return: (ticks, events, info) tuple, or None if there is no store containing all `tick_props`.
+             Props recorded as unavailable are left out of the ticks
+    """
+    stored_name = demo_file + util.PARSED_DEMO_SUFFIX
+    stored = read_store_info(stored_name)
+    if stored is None or get_missing_props(stored, tick_props):
+        return None
 
-    for name, parser in tqdm(parsers, desc="Merging demo files", total=len(parsers)):
-        info = parser.parse_header()
-        ticks = parser.parse_ticks(wanted_props=tick_props)
+    # Assemble the mapped column files into one table, so the conversion to pandas is zero-copy
+    table = cache.read_table(stored_name+'/keys')
+    for prop in tick_props:
+        if prop in stored['props'] and prop not in BASE_COLUMNS:
+            column = cache.read_table(f'{stored_name}/{prop}')
+            table = table.append_column(column.field(0), column.column(0))
+    ticks = table.to_pandas(split_blocks=True)
+    profiling.count(len(ticks))
 
-        if players_of_interest is not None:
-            ticks = ticks[ticks['name'].isin(players_of_interest)]
-        if map_name is not None and info['map_name'] != map_name:
+    with open(stored_name+'/events.pkl', 'rb') as file:
+        events = pickle.load(file)
+
+    return ticks, events, stored['header']
+
+def get_missing_props(stored: dict, tick_props: List[str]) -> List[str]:
+    # Props the parser did not return for this demo are not missing, parsing again would not add them
+    unavailable = stored.get('unavailable', [])
+    return [prop for prop in tick_props if prop not in BASE_COLUMNS and prop not in stored['props'] and prop not in unavailable]
+
+def load_demo(demo_file: str, tick_props: List[str], map_name: str = None):
+    """
+    Loads a single demo from its parsed store. Only the props missing from the store are parsed from the .dem file,
+    and then added to the store, so any later request for a subset of the stored props is served without parsing.
+
+    :return: (ticks, events, info) tuple, or None if the demo is not on `map_name` or can not be loaded
+    """
+    stored = read_store_info(demo_file + util.PARSED_DEMO_SUFFIX)
+    if stored is not None and map_name is not None and stored['header']['map_name'] != map_name:
+        return None
+
+    missing_props = get_missing_props(stored, tick_props) if stored is not None else [prop for prop in tick_props if prop not in BASE_COLUMNS]
+    if stored is None or missing_props:
+        if not os.path.isfile(demo_file):
+            print(f"Skipping {demo_file}, the .dem file was deleted and its parsed store is missing {missing_props}")
+            return None
+
+        with profiling.stage('parse'):
+            # Only imported when a demo actually needs parsing, runs served from the store or cache never load it
+            from demoparser2 import DemoParser
+
+            parser = DemoParser(demo_file)
+            info = parser.parse_header()
+            if map_name is not None and info['map_name'] != map_name:
+                return None
+
+            ticks = parser.parse_ticks(wanted_props=missing_props)
+            events = parser.parse_events(event_name=['all']) if stored is None else None
+            profiling.count(len(ticks))
+
+        with profiling.stage('store'):
+            store_parsed_demo(demo_file, ticks, events, info, missing_props)
+
+    with profiling.stage('load_store'):
+        return load_parsed_demo(demo_file, tick_props)
+
+def iter_demo_ticks(folder_path : str, tick_props : List[str], players_of_interest : List[str] = None, limit: int = None, map_name: str = None, annotate_rounds: bool = False, live_only: bool = False, downsample: str = None, exclude_hashes: set = None):
+    """
+    Generator of (match name, ticks, events) tuples, one demo at a time.
+    Analyses that aggregate per demo can consume it with memory bounded by the largest demo, instead of the whole folder.
+
+    :param annotate_rounds: Add the 'round' and 'phase' of every tick, see `rounds.assign_phases`
+    :param live_only: Drop warmup, freeze time, halftime and post-round ticks (implies `annotate_rounds`)
+    :param downsample: Downsampling spec applied to every demo, see `downsampling.usage`. The parsed store keeps full resolution
+    :param exclude_hashes: Content hashes of demos to skip, see `util.find_demo_files`
+    """
+    demo_files = util.find_demo_files(folder_path, limit=limit, exclude_hashes=exclude_hashes)
+
+    for name, demo_file in tqdm(demo_files, desc="Loading demo files", total=len(demo_files)):
+        demo = load_demo(demo_file, tick_props, map_name)
+        if demo is None:
             continue
+        ticks, events, info = demo
+
+        with profiling.stage('filter'):
+            if players_of_interest is not None:
+                ticks = ticks[ticks['name'].isin(players_of_interest)]
+
+            ticks = downsampling.downsample(ticks, events, downsample)
+
+            if live_only:
+                ticks = rounds.live_ticks(ticks, events)
+            elif annotate_rounds:
+                ticks = rounds.assign_phases(ticks, events)
+            profiling.count(len(ticks))
 
-        ticks['match'] = name
-        ticks['map'] = info['map_name']
+        yield name, ticks.assign(match=name, map=info['map_name']), events
 
-        events = parser.parse_events(event_name=['all'])
+# TODO: Filter by players of interest, as to not load all players into memory
+def merge_demo_files(folder_path : str, tick_props : List[str], save : bool = True, players_of_interest : List[str] = None, limit: int = None, map_name: str = None, annotate_rounds: bool = False, live_only: bool = False, downsample: str = None, exclude_hashes: set = None):
+    cache_args = ['merge_demo_files', folder_path, tick_props, players_of_interest, limit, map_name, annotate_rounds, live_only, downsample, sorted(exclude_hashes) if exclude_hashes else None]
+    merged_ticks = cache.load(cache_args, [folder_path])
+    if merged_ticks is not None:
+        merged_events = cache.load(cache_args + ['events'], [folder_path])
+        if merged_events is not None:
+            return merged_ticks, merged_events
 
-        merged_ticks = pd.concat([merged_ticks, ticks], ignore_index=True)
+    # Merge the demo files
+    merged_ticks = []
+    merged_events = []
+
+    for name, ticks, events in iter_demo_ticks(folder_path, tick_props, players_of_interest, limit, map_name, annotate_rounds, live_only, downsample, exclude_hashes):
+        merged_ticks.append(ticks)
         merged_events += events
 
+    with profiling.stage('concat'):
+        merged_ticks = pd.concat(merged_ticks, ignore_index=True) if merged_ticks else pd.DataFrame()
+        profiling.count(len(merged_ticks))
+
     if save:
-        print(f"Saving at: {stored_name}")
-        os.makedirs(stored_name, exist_ok=True)
-        merged_ticks.to_feather(stored_name+'/merged_ticks')
-        with open(stored_name+'/merged_events.pkl', 'wb') as file:
-            pickle.dump(merged_events,  file)
-        with open(stored_name+'/info.txt', 'w') as file:
-            file.write(f"""Created on: {strftime("%Y-%m-%d_%H-%M-%S", localtime())}
-Tick props: {str(tick_props)}
-Players of interest: {str(players_of_interest)}
-""")
+        cache.store(merged_ticks, cache_args, [folder_path])
+        cache.store(merged_events, cache_args + ['events'], [folder_path])
   
     return merged_ticks, merged_events
\ No newline at end of file
@@ -1,56 +1,193 @@
 import os
 import csv
 import util
+import profiling
 import argparse
 import re
+import json
+import log_events
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
 
-def get_files(dir_src, dir_dest):
+# Matches both `say` and `say_team` lines: time, user, team, verb, message
+CHAT_PATTERN = re.compile(r'L (\d{2}/\d{2}/\d{4} - \d{2}:\d{2}:\d{2}): "(.*?)<.*?><.*?><(.*?)>" (say|say_team) "(.*?)"')
+CHAT_HEADER = ['Time', 'User', 'Team', 'Message']
+# Progress of follow mode in every log, used to resume: processed bytes and lines, and the rounds started in them
+OFFSETS_FILE = ".follow_offsets.json"
+NEW_LOG = {'offset': 0, 'line': 0, 'round': 0}
+# Folder in the output directory where follow mode writes the parsed events, see `log_events.load_events`
+EVENTS_FOLDER = "events"
+
+def is_relevant_log(file):
+	return "001.log" in file
+
+def get_files(dir_src, dir_dest, workers=None):
 	relevant_log = []
 	files = os.listdir(dir_src)
 	for file in files:
-		if "001.log" in file:
-			 relevant_log.append(file)
-	for file in relevant_log:
-		file = dir_src + "/" + file
-		extract_chat(file, dir_dest)
+		if is_relevant_log(file):
+			 relevant_log.append(dir_src + "/" + file)
 
-def extract_chat(file, dir_dest):
+	# Every log writes to its own output files, so they can be processed independently
+	with profiling.stage('extract_chat'), ProcessPoolExecutor(max_workers=workers) as executor:
+		for count in executor.map(extract_chat, relevant_log, [dir_dest] * len(relevant_log)):
+			profiling.count(count)
+
+def get_output_files(file, dir_dest):
 	log_name = os.path.basename(file).split('/')[-1]
 	log_name = dir_dest + "/" + log_name.rsplit(".", 1)[0]
-	log_all = log_name + "_world.csv"
-	log_ct = log_name + "_ct.csv"
-	log_ter = log_name + "_ter.csv"
-	with open (file, "r") as lines:
-		for line in lines:
-			if "say" in line:
-				pattern = r'L (\d{2}/\d{2}/\d{4} - \d{2}:\d{2}:\d{2}): "(.*?)<.*?><.*?><(.*?)>" say "(.*?)"'
-				match = re.match(pattern, line)
-				if match:
-					line = [match.group(1),match.group(2),match.group(3),match.group(4)]
-					write_to_file(log_all, line)
-			if "say_team" in line and "<CT>" in line:
-				pattern = r'L (\d{2}/\d{2}/\d{4} - \d{2}:\d{2}:\d{2}): "(.*?)<.*?><.*?><(.*?)>" say_team "(.*?)"'
-				match = re.match(pattern, line)
-				if match:
-					line = [match.group(1),match.group(2),match.group(3),match.group(4)]
-					write_to_file(log_ct, line)
-			if "say_team" in line and "<TERRORIST>" in line:
-				pattern = r'L (\d{2}/\d{2}/\d{4} - \d{2}:\d{2}:\d{2}): "(.*?)<.*?><.*?><(.*?)>" say_team "(.*?)"'
-				match = re.match(pattern, line)
-				if match:
-					line = [match.group(1),match.group(2),match.group(3),match.group(4)]
-					write_to_file(log_ter, line)
-
-def write_to_file(file, line):
+	return {
+		'world': log_name + "_world.csv",
+		'ct': log_name + "_ct.csv",
+		'ter': log_name + "_ter.csv",
+	}
+
+def extract_chat(file, dir_dest):
+	outputs = get_output_files(file, dir_dest)
+	with ExitStack() as stack, open(file, "r") as lines:
+		writers = {}
+		return extract_chat_lines(lines, outputs, writers, stack)
+
+def extract_chat_lines(lines, outputs, writers, stack, emit=None):
+	"""
+	Writes the chat messages found in `lines` to the world/ct/ter csv files in `outputs`.
+	Writers are opened lazily on the first matching line, kept in `writers` and closed by `stack`.
+	`emit(channel, row)` is called for every written row, if given.
+	Returns the number of rows written.
+	"""
+	written = 0
+	for line in lines:
+		if "say" not in line:
+			continue
+		match = CHAT_PATTERN.match(line)
+		if not match:
+			continue
+
+		time, user, team, verb, message = match.groups()
+		row = [time, user, team, message]
+		if verb == "say":
+			channels = ['world']
+		# Exclusive on purpose: the original extractor replaced `line` by the matched row after writing a CT line,
+		# so a CT team line mentioning <TERRORIST> never reached the ter file
+		elif "<CT>" in line:
+			channels = ['ct']
+		elif "<TERRORIST>" in line:
+			channels = ['ter']
+		else:
+			channels = []
+
+		for channel in channels:
+			if channel not in writers:
+				writers[channel] = open_writer(outputs[channel], stack)
+			writers[channel].writerow(row)
+			written += 1
+			if emit:
+				emit(channel, row)
+
+	return written
+
+def open_writer(file, stack):
 	file_exists = os.path.isfile(file)
-	with open(file, 'a+') as f:
-		writer = csv.writer(f)
-		if not file_exists:
-			writer.writerow(['Time', 'User', 'Team', 'Message'])
-		writer.writerow(line)
+	f = stack.enter_context(open(file, 'a+'))
+	writer = csv.writer(f)
+	if not file_exists:
+		writer.writerow(CHAT_HEADER)
+	return writer
+def follow(dir_src, dir_dest, poll_interval=0.5, emit=None, passes=None):
+	"""
+	Watches `dir_src` and incrementally extracts the chat and events of newly appended lines of every relevant log.
+	Only complete lines are consumed, and the progress in every log is saved to `OFFSETS_FILE` in `dir_dest` as soon as
+	its output is written, so a restarted follower continues where it left off without reprocessing.
+	`passes` limits the number of passes over the changed logs, None follows forever.
+	"""
+	if emit is None:
+		emit = print_chat
+	offsets_file = os.path.join(dir_dest, OFFSETS_FILE)
+	offsets = load_offsets(offsets_file)
+
+	print(f"Following logs in {dir_src}")
+	# The watch is in place before the full scan, so lines appended during the scan are not missed
+	watcher = util.watch_folder(dir_src, poll_interval)
+	# Start with a full scan, to pick up whatever was appended while not following
+	changed = None
+	while True:
+		if changed is None:
+			files = [file for file in os.listdir(dir_src) if is_relevant_log(file)]
+		else:
+			files = {os.path.basename(file) for file in changed if is_relevant_log(os.path.basename(file))}
+
+		for file in sorted(files):
+			path = os.path.join(dir_src, file)
+			if not os.path.isfile(path):
+				continue
+			state = follow_file(path, dir_dest, offsets.get(file, NEW_LOG), emit)
+			if state != offsets.get(file, NEW_LOG):
+				offsets[file] = state
+				# Stored right after this log's output is flushed, not after the pass, so a crash can only replay
+				# the lines of the log being written at that moment
+				store_offsets(offsets_file, offsets)
+
+		if passes is not None:
+			passes -= 1
+			if passes <= 0:
+				return
+		changed = next(watcher)
+
+def follow_file(file, dir_dest, state, emit):
+	"""
+	Extracts the chat and events of the complete lines appended to `file` since `state`, and returns the new state.
+	Chat is appended to the csv files of `extract_chat`, events are written as one Parquet part per call to
+	`EVENTS_FOLDER`, named after the offset the lines start at, so writing them again after a crash replaces them.
+
+	:param state: Progress in the log, see `NEW_LOG`
+	"""
+	if os.path.getsize(file) < state['offset']:
+		# The log was truncated or replaced, start over, without the events of the old log
+		state = NEW_LOG
+		log_events.remove_log(os.path.join(dir_dest, EVENTS_FOLDER), os.path.basename(file).rsplit(".", 1)[0])
+	offset = state['offset']
+
+	with open(file, "rb") as f:
+		f.seek(offset)
+		data = f.read()
+
+	end = data.rfind(b"\n") + 1
+	if end == 0:
+		return state
+
+	lines = data[:end].decode("utf-8", errors="replace").splitlines(keepends=True)
+	outputs = get_output_files(file, dir_dest)
+	with ExitStack() as stack:
+		writers = {}
+		extract_chat_lines(lines, outputs, writers, stack, lambda channel, row: emit(os.path.basename(file), channel, row))
+
+	log_name = os.path.basename(file).rsplit(".", 1)[0]
+	events = list(log_events.parse_events(lines, log_name, state['line'] + 1, state['round']))
+	log_events.write_event_part(events, os.path.join(dir_dest, EVENTS_FOLDER), log_name, offset)
+
+	return {
+		'offset': offset + end,
+		'line': state['line'] + len(lines),
+		'round': events[-1][1]['round'] if events else state['round'],
+	}
 
+def print_chat(log, channel, row):
+	time, user, team, message = row
+	print(f"[{log}] {time} ({channel}) {user}: {message}", flush=True)
 
+def load_offsets(file):
+	if not os.path.isfile(file):
+		return {}
+	with open(file, "r") as f:
+		offsets = json.load(f)
+	# Older followers stored only the byte offset, continue counting lines and rounds from there
+	return {log: state if isinstance(state, dict) else dict(NEW_LOG, offset=state) for log, state in offsets.items()}
 
+def store_offsets(file, offsets):
+	# Write to a temporary file first, so a crash never leaves a truncated offsets file behind
+	with open(file + ".tmp", "w") as f:
+		json.dump(offsets, f)
+	os.replace(file + ".tmp", file)
 
 
 if __name__ == "__main__":
@@ -58,10 +195,20 @@ if __name__ == "__main__":
     parser.add_argument('--srcdir', type=util.dir_path, help='Path to the directory containing .log files')
     parser.add_argument('--dstdir', type=util.dir_path, required=True, help='Path to the directory for output')
     parser.add_argument('--srcfile', type=util.file_path, help='path to soruce file')
+    parser.add_argument('--workers', type=int, default=None, help='Number of log files to process in parallel (defaults to the number of CPUs)')
+    parser.add_argument('--follow', action='store_true', help='Keep watching the source directory and parse lines as they are appended')
+    parser.add_argument('--poll_interval', type=float, default=0.5, help='Seconds between checks for new lines in follow mode')
+    profiling.add_arguments(parser)
     args = parser.parse_args()
-    if args.srcdir and args.dstdir:
-        get_files(args.srcdir, args.dstdir)
+    profiling.start(args)
+    if args.follow:
+        if not args.srcdir:
+            raise argparse.ArgumentTypeError(f"--follow needs a source directory")
+        follow(args.srcdir, args.dstdir, args.poll_interval)
+    elif args.srcdir and args.dstdir:
+        get_files(args.srcdir, args.dstdir, args.workers)
     elif args.srcfile and args.dstdir:
-        extract_chat(args.srcfile, args.dstdir)
+        with profiling.stage('extract_chat'):
+            profiling.count(extract_chat(args.srcfile, args.dstdir))
     else:
         raise argparse.ArgumentTypeError(f"need either a source file or a source directory")
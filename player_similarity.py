@@ -1,20 +1,20 @@
 import os
 import numpy as np
 import pandas as pd
-from scipy.spatial.distance import cosine, euclidean, mahalanobis
-from scipy.stats import entropy
-from sklearn.preprocessing import MinMaxScaler, StandardScaler
 from tqdm import tqdm
 import util
 import merge_demo_files as merger
+import profiling
+import downsampling
+import trajectory
+import spectral
+import bootstrap
+import kernels
+import sampling
 import argparse
-from scipy.spatial.distance import jensenshannon
 from cursor_movement import compute_derivatives
-from scipy.stats import wasserstein_distance
-from scipy.stats import ks_2samp
 import matplotlib
-matplotlib.use('wxAgg')
-import matplotlib.pyplot as plt
+matplotlib.use('Agg')
 
 tick_props = [
     'pitch',
@@ -33,6 +33,22 @@ players_of_interest = [
     "apEX",
 ]
 
+# Derivatives compared by the cursor similarities, see `compute_derivatives`
+cursor_columns = [f'{prop}_{metric}' for prop in ['yaw', 'pitch'] for metric in ['speed', 'acceleration', 'smoothness']]
+
+# Weight of every metric in `compute_similarity`. The newer metrics are opt-in, so the default score stays the location
+# similarity, and setting their weight enables them
+similarity_weights = {
+    'location': 1.0,
+    # Only used when the ticks have round annotations, see `merger.merge_demo_files(annotate_rounds=True)`
+    'trajectory': 0.0,
+    # Only used when the band vectors of both players are given, see `spectral.player_vectors`
+    'spectral': 0.0,
+}
+
+# Written by `evaluation.py`, read by `plot_similarity_results`
+EVALUATION_FILE = './figures/similarity_evaluation.csv'
+
 def filter_player_and_map(ticks: pd.DataFrame, player_name: str, map_name: str) -> pd.DataFrame:
     """
     Filter df to only include rows where `name == <player_name>` and `map == <map_name>`.
@@ -40,56 +56,72 @@ def filter_player_and_map(ticks: pd.DataFrame, player_name: str, map_name: str)
     player_ticks = ticks[(ticks['name'] == player_name) & (ticks['map'] == map_name if map_name else True)]
     return player_ticks
 
-def compute_similarity(new_features: pd.DataFrame, known_features: pd.DataFrame) -> float:
+def compute_similarity(new_features: pd.DataFrame, known_features: pd.DataFrame, new_spectrum: np.ndarray = None, known_spectrum: np.ndarray = None) -> float:
     """
     Computes a confidence score based on multiple similarity metrics.
+
+    :param new_spectrum: Aim band vector of the new player, precomputed by `spectral.player_vectors`
+    :param known_spectrum: Aim band vector of the known player, precomputed by `spectral.player_vectors`
     """
-    return (
-        compute_location_similarity_wasserstein(new_features, known_features) 
-        # compute_cursor_similarity_jensenshannon(new_features, known_features)
+    metrics = {
+        'location': lambda: compute_location_similarity_wasserstein(new_features, known_features),
+        'trajectory': lambda: trajectory.compute_trajectory_similarity(new_features, known_features),
+        'spectral': lambda: spectral.compute_spectral_similarity(new_spectrum, known_spectrum),
         # TODO: add more metrics here
         # such as heatmap, crouching/jumping, weapon usage, etc.
-    ) / 1
+    }
+    weights = {name: weight for name, weight in similarity_weights.items() if weight > 0}
+    if 'round' not in new_features.columns or 'round' not in known_features.columns:
+        weights.pop('trajectory', None)
+    if new_spectrum is None or known_spectrum is None:
+        weights.pop('spectral', None)
+
+    with profiling.stage('similarity'):
+        profiling.count(len(known_features))
+        return sum(weight * metrics[name]() for name, weight in weights.items()) / sum(weights.values())
     
 
+def compute_similarity_intervals(new_features: pd.DataFrame, known_features: pd.DataFrame, new_spectrum: np.ndarray = None, known_spectrum: np.ndarray = None, rng: np.random.Generator = None) -> dict:
+    """
+    Same metrics as `compute_similarity`, with bootstrap confidence intervals from resampling the rounds (or tick blocks)
+    of the players, see `bootstrap`.
+
+    :return: {metric or 'combined': (similarity, low, high)}. The location similarity comes from location sketches,
+             like its resamples, so the combined similarity is close to, not equal to, `compute_similarity`
+    """
+    rng = rng or np.random.default_rng(0)
+    weights = {name: weight for name, weight in similarity_weights.items() if weight > 0}
+    if 'round' not in new_features.columns or 'round' not in known_features.columns:
+        weights.pop('trajectory', None)
+    if new_spectrum is None or known_spectrum is None:
+        weights.pop('spectral', None)
+
+    estimates, deviations = {}, {}
+    if 'location' in weights:
+        estimates['location'], deviations['location'] = bootstrap.location_bootstrap(new_features, known_features, rng)
+    if 'trajectory' in weights:
+        estimates['trajectory'], deviations['trajectory'] = bootstrap.trajectory_bootstrap(new_features, known_features, rng)
+    if 'spectral' in weights:
+        # The interval comes from resampling the new player's windows, the estimate from the stored spectra like `compute_similarity`
+        estimates['spectral'] = spectral.compute_spectral_similarity(new_spectrum, known_spectrum)
+        _, deviations['spectral'] = bootstrap.spectral_bootstrap(new_features, known_spectrum, rng)
+
+    return bootstrap.similarity_intervals(estimates, deviations, weights)
+
 def compute_cursor_similarity_jensenshannon(new_features: pd.DataFrame, known_features: pd.DataFrame) -> float:
     """
     Computes a confidence score based on multiple similarity metrics.
     """
+    from scipy.spatial.distance import jensenshannon
+
     new_features = compute_derivatives(new_features, ['yaw', 'pitch'])
     known_features = compute_derivatives(known_features, ['yaw', 'pitch'])
 
-    pitch_speed_1, _ = np.histogram(new_features['pitch_speed'], bins=50, density=True)
-    pitch_speed_2, _ = np.histogram(known_features['pitch_speed'], bins=50, density=True)
-
-    pitch_speed_jsd = jensenshannon(pitch_speed_1, pitch_speed_2)
-
-    pitch_acceleration_1, _ = np.histogram(new_features['pitch_acceleration'], bins=50, density=True)
-    pitch_acceleration_2, _ = np.histogram(known_features['pitch_acceleration'], bins=50, density=True)
-
-    pitch_acceleration_jsd = jensenshannon(pitch_acceleration_1, pitch_acceleration_2)
-
-    pitch_smoothness_1, _ = np.histogram(new_features['pitch_smoothness'], bins=50, density=True)
-    pitch_smoothness_2, _ = np.histogram(known_features['pitch_smoothness'], bins=50, density=True)
-
-    pitch_smoothness_jsd = jensenshannon(pitch_smoothness_1, pitch_smoothness_2)
-
-    yaw_speed_1, _ = np.histogram(new_features['yaw_speed'], bins=50, density=True)
-    yaw_speed_2, _ = np.histogram(known_features['yaw_speed'], bins=50, density=True)
+    new_histograms = kernels.histograms(new_features[cursor_columns].to_numpy().T, bins=50)
+    known_histograms = kernels.histograms(known_features[cursor_columns].to_numpy().T, bins=50)
 
-    yaw_speed_jsd = jensenshannon(yaw_speed_1, yaw_speed_2)
-
-    yaw_acceleration_1, _ = np.histogram(new_features['yaw_acceleration'], bins=50, density=True)
-    yaw_acceleration_2, _ = np.histogram(known_features['yaw_acceleration'], bins=50, density=True)
-
-    yaw_acceleration_jsd = jensenshannon(yaw_acceleration_1, yaw_acceleration_2)
-
-    yaw_smoothness_1, _ = np.histogram(new_features['yaw_smoothness'], bins=50, density=True)
-    yaw_smoothness_2, _ = np.histogram(known_features['yaw_smoothness'], bins=50, density=True)
-
-    yaw_smoothness_jsd = jensenshannon(yaw_smoothness_1, yaw_smoothness_2)
-
-    return 1 - (pitch_speed_jsd + pitch_acceleration_jsd + pitch_smoothness_jsd + yaw_speed_jsd + yaw_acceleration_jsd + yaw_smoothness_jsd) / 6
+    jsd = [jensenshannon(new_histogram, known_histogram) for new_histogram, known_histogram in zip(new_histograms, known_histograms)]
+    return 1 - sum(jsd) / len(cursor_columns)
 
 def compute_cursor_similarity_wasserstein(new_features: pd.DataFrame, known_features: pd.DataFrame) -> float:
     """
@@ -98,28 +130,20 @@ def compute_cursor_similarity_wasserstein(new_features: pd.DataFrame, known_feat
     new_features = compute_derivatives(new_features, ['yaw', 'pitch'])
     known_features = compute_derivatives(known_features, ['yaw', 'pitch'])
 
-    y1 = wasserstein_distance(new_features['yaw_speed'], known_features['yaw_speed'])
-    y2 = wasserstein_distance(new_features['yaw_acceleration'], known_features['yaw_acceleration'])
-    y3 = wasserstein_distance(new_features['yaw_smoothness'], known_features['yaw_smoothness'])
-
-    p1 = wasserstein_distance(new_features['pitch_speed'], known_features['pitch_speed'])
-    p2 = wasserstein_distance(new_features['pitch_acceleration'], known_features['pitch_acceleration'])
-    p3 = wasserstein_distance(new_features['pitch_smoothness'], known_features['pitch_smoothness'])
-    return 1 - (y1 + y2 + y3 + p1 + p2 + p3) / 6
+    distances = kernels.wasserstein(new_features[cursor_columns].to_numpy().T, known_features[cursor_columns].to_numpy().T)
+    return 1 - distances.sum() / len(cursor_columns)
 
 def compute_location_similarity_jensenshannon(new_features: pd.DataFrame, known_features: pd.DataFrame) -> float:
     """
     Computes a confidence score based on multiple similarity metrics.
     """
-    x1, _ = np.histogram(new_features['X'], bins=50, density=True)
-    x2, _ = np.histogram(known_features['X'], bins=50, density=True)
+    from scipy.spatial.distance import jensenshannon
 
-    x_jsd = jensenshannon(x1, x2)
+    new_histograms = kernels.histograms(new_features[['X', 'Y']].to_numpy().T, bins=50)
+    known_histograms = kernels.histograms(known_features[['X', 'Y']].to_numpy().T, bins=50)
 
-    y1, _ = np.histogram(new_features['Y'], bins=50, density=True)
-    y2, _ = np.histogram(known_features['Y'], bins=50, density=True)
-
-    y_jsd = jensenshannon(y1, y2)
+    x_jsd = jensenshannon(new_histograms[0], known_histograms[0])
+    y_jsd = jensenshannon(new_histograms[1], known_histograms[1])
 
     return 1 - (x_jsd + y_jsd) / 2
 
@@ -127,21 +151,72 @@ def compute_location_similarity_wasserstein(new_features: pd.DataFrame, known_fe
     """
     Computes a confidence score based on multiple similarity metrics, normalized to [0, 1].
     """
-    x1 = wasserstein_distance(new_features['X'], known_features['X'])
-    y1 = wasserstein_distance(new_features['Y'], known_features['Y'])
+    x1, y1 = kernels.wasserstein(new_features[['X', 'Y']].to_numpy().T, known_features[['X', 'Y']].to_numpy().T)
     
     # Normalize the distances to [0, 1] using a max possible distance (e.g., domain knowledge or a large constant)
-    max_distance = 1200  # Adjust this value based on the expected range of X and Y
-    normalized_x1 = min(x1 / max_distance, 1.0)
-    normalized_y1 = min(y1 / max_distance, 1.0)
+    normalized_x1 = min(x1 / kernels.max_location_distance, 1.0)
+    normalized_y1 = min(y1 / kernels.max_location_distance, 1.0)
     
     # Compute similarity as 1 - normalized average distance
     return 1 - (normalized_x1 + normalized_y1) / 2
 
-def evaluate_players(new_ticks: pd.DataFrame, known_ticks: pd.DataFrame, players: list, map_name: str):
+def accumulate_location_sketches(sketches: dict, ticks: pd.DataFrame, map_name: str = None):
+    """
+    Adds the X and Y histograms of every player in `ticks` to `sketches`, keyed by player name.
+    A sketch summarizes all of a player's positions in a fixed amount of memory.
+    """
+    if map_name:
+        ticks = ticks[ticks['map'] == map_name]
+
+    # The histograms of all players in a single pass over the ticks
+    codes, players = pd.factorize(ticks['name'])
+    counts = kernels.binned_counts(ticks[['X', 'Y']].to_numpy().T, codes, len(players), kernels.location_edges)
+    for player, (x_counts, y_counts) in zip(players, counts):
+        if player in sketches:
+            sketches[player] = (sketches[player][0] + x_counts, sketches[player][1] + y_counts)
+        else:
+            sketches[player] = (x_counts, y_counts)
+
+def compute_location_similarity_sketch(new_sketch: tuple, known_sketch: tuple) -> float:
+    """
+    Same as `compute_location_similarity_wasserstein`, computed from location sketches.
+    The Wasserstein distance between two histograms on the same bins is the area between their CDFs.
+    """
+    bin_width = kernels.location_edges[1] - kernels.location_edges[0]
+    normalized = []
+    for new_counts, known_counts in zip(new_sketch, known_sketch):
+        if new_counts.sum() == 0 or known_counts.sum() == 0:
+            return 0
+        new_cdf = np.cumsum(new_counts) / new_counts.sum()
+        known_cdf = np.cumsum(known_counts) / known_counts.sum()
+        distance = np.abs(new_cdf - known_cdf).sum() * bin_width
+        normalized.append(min(distance / kernels.max_location_distance, 1.0))
+
+    return 1 - sum(normalized) / len(normalized)
+
+def build_location_sketches(folder: str, map_name: str = None, limit: int = None, exclude_hashes: set = None, live_only: bool = False, downsample: str = None) -> tuple[dict, set]:
+    """
+    Streams the demos in `folder` one at a time into per-player location sketches.
+
+    :return: The sketches, and the names of the matches they were built from
+    """
+    sketches = {}
+    matches = set()
+    for match, ticks, _ in merger.iter_demo_ticks(folder, tick_props, limit=limit, map_name=map_name, live_only=live_only, downsample=downsample, exclude_hashes=exclude_hashes):
+        accumulate_location_sketches(sketches, ticks, map_name)
+        matches.add(match)
+
+    return sketches, matches
+
+def evaluate_players(new_ticks: pd.DataFrame, known_ticks: pd.DataFrame, players: list, map_name: str, new_spectra: dict = None, known_spectra: dict = None):
     """
     Evaluate the similarity scores for players of interest.
+
+    :param new_spectra: Aim band vectors of the new players, see `spectral.player_vectors`
+    :param known_spectra: Aim band vectors of the known players, see `spectral.player_vectors`
     """
+    new_spectra = new_spectra or {}
+    known_spectra = known_spectra or {}
     self_similarities = []
     other_similarities = []
     all_players = known_ticks['name'].unique()
@@ -153,14 +228,14 @@ def evaluate_players(new_ticks: pd.DataFrame, known_ticks: pd.DataFrame, players
 
         # Compute self-similarity
         if not new_features.empty and not known_features.empty:
-            self_similarity = compute_similarity(new_features, known_features)
+            self_similarity = compute_similarity(new_features, known_features, new_spectra.get(player), known_spectra.get(player))
             self_similarities.append(self_similarity)
         
         # Compute similarity with other players
         for other_player in [p for p in all_players if p != player]:
             other_features = filter_player_and_map(known_ticks, other_player, map_name)
             if not new_features.empty and not other_features.empty:
-                other_similarity = compute_similarity(new_features, other_features)
+                other_similarity = compute_similarity(new_features, other_features, new_spectra.get(player), known_spectra.get(other_player))
                 other_similarities.append(other_similarity)
 
     # Calculate averages
@@ -182,64 +257,19 @@ def evaluate_players(new_ticks: pd.DataFrame, known_ticks: pd.DataFrame, players
     print(f"Min. similarity with other players: {min_other_similarity:.4f}")
     print(f"Max. similarity with other players: {max_other_similarity:.4f}")
 
-def plot_similarity_results():
+def plot_similarity_results(path: str = EVALUATION_FILE):
     """
     Plots a grouped bar chart of similarity evaluation results.
     
-    Parameters:
-        results (list of dicts): Each dict contains similarity metrics for a dataset.
-            Example format:
-            {
-                "label": "Dataset 1",
-                "avg_self": 0.85,
-                "min_self": 0.70,
-                "max_self": 0.95,
-                "avg_other": 0.65,
-                "min_other": 0.50,
-                "max_other": 0.80
-            }
+    :param path: Evaluation table written by `evaluation.py`, with one row per metric and the columns
+                 'label', 'avg_self', 'min_self', 'max_self', 'avg_other', 'min_other' and 'max_other'
     """
-    results = [
-        # Cursor results
-        # {
-        #     "label": "Janson-Shannon",
-        #     "avg_self": 0.4534,
-        #     "min_self": 0.3276,
-        #     "max_self": 0.6264,
-        #     "avg_other": 0.4927,
-        #     "min_other": 0.2364,
-        #     "max_other": 0.9702,
-        # },
-        # {
-        #     "label": "Wasserstein",
-        #     "avg_self": 0.9348,
-        #     "min_self": 0.8272,
-        #     "max_self": 0.9927,
-        #     "avg_other": 0.8476,
-        #     "min_other": 0.2843,
-        #     "max_other": 0.9850,
-        # }
-
-        # Location results
-        {
-            "label": "Janson-Shannon",
-            "avg_self": 0.7747,
-            "min_self": 0.6580,
-            "max_self": 0.8150,
-            "avg_other": 0.6637,
-            "min_other": 0.1193,
-            "max_other": 0.8143,
-        },
-        # {
-        #     "label": "Wasserstein",
-        #     "avg_self": 0.7282,
-        #     "min_self": 0.6691,
-        #     "max_self": 0.7924,
-        #     "avg_other": 0.6032,
-        #     "min_other": 0.0455,
-        #     "max_other": 0.9291,
-        # }
-    ]
+    import matplotlib.pyplot as plt
+
+    if not os.path.exists(path):
+        print(f"Error: {path} not found, run evaluation.py first.")
+        return
+    results = pd.read_csv(path).to_dict('records')
     categories = ["Avg Self", "Min Self", "Max Self", "Avg Other", "Min Other", "Max Other"]
     num_categories = len(categories)
     num_datasets = len(results)
@@ -271,7 +301,8 @@ def plot_similarity_results():
     ax.set_ylim(0, 1)  # Assuming similarity scores are between 0 and 1
 
     # plt.show()
-    plt.savefig("./figures/player_location_similarity_evaluation_js.png", dpi=300)
+    with profiling.stage('savefig'):
+        plt.savefig("./figures/player_similarity_evaluation.png", dpi=300)
 
 def main():
     parser = argparse.ArgumentParser(description='Compute player similarity between new and known demo files.')
@@ -283,26 +314,88 @@ def main():
     parser.add_argument('--limit_new', type=int, default=None, help='Limit the number of demo files to process')
     parser.add_argument('--evaluate', action='store_true', help='Evaluate players of interest')
     parser.add_argument('--plot', action='store_true', help='Plot similarity evaluation results')
-
+    parser.add_argument('--stream', action='store_true', help='Rank players from location sketches built one demo at a time, with bounded memory')
+    parser.add_argument('--live_only', action='store_true', help='Only compare ticks where a round is being played')
+    parser.add_argument('--downsample', type=downsampling.downsample_spec, default=None, help=f'Ticks to compare, {downsampling.usage}. Defaults to every tick')
+    parser.add_argument('--trajectory_weight', type=float, default=similarity_weights['trajectory'], help='Weight of the round trajectory similarity relative to the location similarity, e.g. 1. Disabled (0) by default')
+    parser.add_argument('--spectral_weight', type=float, default=similarity_weights['spectral'], help='Weight of the aim movement spectra similarity relative to the location similarity, e.g. 1. Disabled (0) by default')
+    parser.add_argument('--bootstrap', action='store_true', help=f'Add {bootstrap.confidence:.0%} bootstrap confidence intervals to the rankings, from {bootstrap.resamples} resamples of rounds')
+    parser.add_argument('--sample', type=int, default=None, help=f'Compare a stratified sample of ticks, the {sampling.usage}. Defaults to every tick')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the bootstrap resamples and of the tick sample')
+    parser.add_argument('--server', type=str, nargs='?', const='http://127.0.0.1:8765', default=None, help='Rank players from location sketches held by a running tick_server.py, which serves the known demos')
+
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.start(args)
+    similarity_weights['trajectory'] = args.trajectory_weight
+    similarity_weights['spectral'] = args.spectral_weight
 
     if args.plot:
         plot_similarity_results()
         return
 
-    # Merge demo files for new and known demos
-    new_ticks, _ = merger.merge_demo_files(args.new_demo_folder, tick_props, limit=args.limit_new)
-    known_ticks, _ = merger.merge_demo_files(args.known_demo_folder, tick_props, limit=args.limit)
+    if args.server:
+        if not args.player:
+            print("Error: --player is required with --server.")
+            return
+
+        import tick_server
+        similarities = tick_server.query(args.server, 'similarity', player=args.player, map=args.map, new_folder=os.path.abspath(args.new_demo_folder))['rankings']
+        print("\nPlayer Similarity Rankings:")
+        for rank, (player, score) in enumerate(similarities, start=1):
+            print(f"{rank}. {player}: {score:.4f}")
+        return
+
+    # Ensure no duplicate matches, if sourcing from the same folder or if a demo was downloaded twice.
+    # The duplicates of both folders are reported once here, whether or not the merged ticks come from the cache
+    duplicates = []
+    new_hashes = util.find_demo_hashes(args.new_demo_folder, args.limit_new, duplicates)
+    util.find_demo_files(args.known_demo_folder, args.limit, new_hashes, duplicates)
+    util.write_dedup_report(duplicates)
+
+    if args.stream:
+        if not args.player:
+            print("Error: --player is required with --stream.")
+            return
+
+        new_sketches, _ = build_location_sketches(args.new_demo_folder, args.map, args.limit_new, live_only=args.live_only, downsample=args.downsample)
+        known_sketches, _ = build_location_sketches(args.known_demo_folder, args.map, args.limit, exclude_hashes=new_hashes, live_only=args.live_only, downsample=args.downsample)
+        if args.player not in new_sketches:
+            print(f"Error: {args.player} not found in the new demos.")
+            return
+
+        with profiling.stage('similarity'):
+            similarities = [(known_player, compute_location_similarity_sketch(new_sketches[args.player], sketch)) for known_player, sketch in known_sketches.items()]
+        similarities.sort(key=lambda x: x[1], reverse=True)
+        print("\nPlayer Similarity Rankings:")
+        for rank, (player, score) in enumerate(similarities, start=1):
+            print(f"{rank}. {player}: {score:.4f}")
+        return
+
+    # Merge demo files for new and known demos, with the rounds the trajectories are split on
+    # The rounds also stratify the sample, if one is taken
+    annotate_rounds = args.trajectory_weight > 0 or args.sample is not None
 
-    # Ensure no duplicate matches, if sourcing from the same folder
-    known_ticks = known_ticks[~known_ticks['match'].isin(new_ticks['match'])]
+    def merge(folder, **kwargs):
+        if args.sample is not None:
+            return sampling.merge_sampled(folder, tick_props, args.sample, args.seed, **kwargs)
+        return merger.merge_demo_files(folder, tick_props, **kwargs)[0]
+
+    new_ticks = merge(args.new_demo_folder, limit=args.limit_new, annotate_rounds=annotate_rounds, live_only=args.live_only, downsample=args.downsample)
+    known_ticks = merge(args.known_demo_folder, limit=args.limit, annotate_rounds=annotate_rounds, live_only=args.live_only, downsample=args.downsample, exclude_hashes=new_hashes)
 
     new_ticks = util.split_list_columns(new_ticks)
     known_ticks = util.split_list_columns(known_ticks)
 
+    # Aim spectra are stored per demo, so only the small band vectors are loaded here
+    new_spectra, known_spectra = {}, {}
+    if args.spectral_weight > 0:
+        new_spectra = spectral.player_vectors(spectral.load_spectra(args.new_demo_folder, args.limit_new, args.map), args.map)
+        known_spectra = spectral.player_vectors(spectral.load_spectra(args.known_demo_folder, args.limit, args.map, exclude_hashes=new_hashes), args.map)
+
     if args.evaluate:
         # Evaluate players of interest
-        evaluate_players(new_ticks, known_ticks, players_of_interest, args.map)
+        evaluate_players(new_ticks, known_ticks, players_of_interest, args.map, new_spectra, known_spectra)
     else:
         if not args.player:
             print("Error: --player is required unless --evaluate is specified.")
@@ -315,16 +408,21 @@ def main():
         known_players = known_ticks['name'].unique()
         similarities = []
 
+        rng = np.random.default_rng(args.seed)
         for known_player in tqdm(known_players, desc="Comparing against known players"):
             known_features = filter_player_and_map(known_ticks, known_player, args.map)
-            similarity = compute_similarity(new_features, known_features)
-            similarities.append((known_player, similarity))
+            if args.bootstrap:
+                similarity, low, high = compute_similarity_intervals(new_features, known_features, new_spectra.get(args.player), known_spectra.get(known_player), rng)['combined']
+                similarities.append((known_player, similarity, f" [{low:.4f}, {high:.4f}]"))
+            else:
+                similarity = compute_similarity(new_features, known_features, new_spectra.get(args.player), known_spectra.get(known_player))
+                similarities.append((known_player, similarity, ""))
 
         # Sort by similarity and display results
         similarities.sort(key=lambda x: x[1], reverse=True)
-        print("\nPlayer Similarity Rankings:")
-        for rank, (player, score) in enumerate(similarities, start=1):
-            print(f"{rank}. {player}: {score:.4f}")
+        print("\nPlayer Similarity Rankings:" + (f" (similarity [{bootstrap.confidence:.0%} interval])" if args.bootstrap else ""))
+        for rank, (player, score, interval) in enumerate(similarities, start=1):
+            print(f"{rank}. {player}: {score:.4f}{interval}")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
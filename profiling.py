@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import atexit
+import argparse
+from contextlib import contextmanager, nullcontext
+from time import perf_counter, process_time
+import cache
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where psutil is used for the peak memory instead, if installed
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+enabled = False
+
+# Stage name -> accumulated measurements, in the order the stages were first entered
+stages = {}
+# Names of the currently open stages, innermost last
+_open_stages = []
+_null_stage = nullcontext()
+_start = None
+
+
+def peak_rss() -> int:
+    """
+    Peak resident memory of this process so far in bytes, or None if it can not be measured on this platform.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss)
+    return None
+
+
+def _cpu_time() -> float:
+    # Includes the worker processes that have finished, e.g. the pools of `parser_log` and `ingest`
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return process_time() + children.ru_utime + children.ru_stime
+    return process_time()
+
+
+@contextmanager
+def _measure(name: str):
+    path = '/'.join(_open_stages + [name])
+    _open_stages.append(name)
+    wall, cpu = perf_counter(), _cpu_time()
+    try:
+        yield
+    finally:
+        _open_stages.pop()
+        record = stages.setdefault(path, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'rows': None, 'peak_rss': None})
+        record['calls'] += 1
+        record['wall'] += perf_counter() - wall
+        record['cpu'] += _cpu_time() - cpu
+        record['peak_rss'] = peak_rss()
+
+
+def stage(name: str):
+    """
+    Context manager measuring the wall time, CPU time and peak memory of a named stage.
+    Stages opened inside other stages are reported as 'outer/inner'. Does nothing unless profiling is enabled.
+
+        with profiling.stage('concat'):
+            ticks = pd.concat(frames)
+            profiling.count(len(ticks))
+    """
+    return _measure(name) if enabled else _null_stage
+
+
+def count(rows: int):
+    """
+    Adds `rows` to the row count of the innermost open stage.
+    """
+    if not enabled or not _open_stages:
+        return
+    path = '/'.join(_open_stages)
+    record = stages.setdefault(path, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'rows': None, 'peak_rss': None})
+    record['rows'] = (record['rows'] or 0) + rows
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--profile', type=str, nargs='?', const='./profile.json', default=None, help='Record the time, memory and rows of every stage to a JSON report (default ./profile.json)')
+    parser.add_argument('--profile_summary', action='store_true', help='Print a text summary of the profile at the end of the run, only written to a report with --profile')
+
+
+def start(args: argparse.Namespace):
+    """
+    Enables profiling if `--profile` or `--profile_summary` was given, and writes the report and/or prints its summary
+    when the program exits.
+    """
+    global enabled, _start
+    if not args.profile and not args.profile_summary:
+        return
+    enabled = True
+    _start = (perf_counter(), _cpu_time())
+    atexit.register(finish, args.profile, args.profile_summary)
+
+
+def report() -> dict:
+    wall, cpu = _start if _start is not None else (perf_counter(), _cpu_time())
+    return {
+        'command': sys.argv,
+        'wall': perf_counter() - wall,
+        'cpu': _cpu_time() - cpu,
+        'peak_rss': peak_rss(),
+        'stages': stages,
+        'cache': cache.stats(),
+    }
+
+
+def summary(profile: dict) -> str:
+    def megabytes(value):
+        return f"{value / 1024 ** 2:.0f} MB" if value is not None else '-'
+
+    lines = [f"{'stage':<40}{'calls':>8}{'wall':>10}{'cpu':>10}{'rows':>12}{'peak rss':>12}"]
+    for path, record in profile['stages'].items():
+        rows = record['rows'] if record['rows'] is not None else '-'
+        lines.append(f"{path:<40}{record['calls']:>8}{record['wall']:>9.2f}s{record['cpu']:>9.2f}s{rows:>12}{megabytes(record['peak_rss']):>12}")
+    lines.append(f"{'total':<40}{'':>8}{profile['wall']:>9.2f}s{profile['cpu']:>9.2f}s{'':>12}{megabytes(profile['peak_rss']):>12}")
+    lines.append(', '.join(f"cache {name}: {value}" for name, value in profile['cache'].items()))
+    return '\n'.join(lines)
+
+
+def finish(path: str = None, print_summary: bool = False):
+    """
+    Writes the report to `path`, if given, and prints its summary if `print_summary`.
+    """
+    profile = report()
+    if print_summary:
+        print(summary(profile))
+    if path is None:
+        return
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(profile, file, indent=2)
+    print(f"Wrote profile to {path}")
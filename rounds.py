@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+# Events that start a phase, in the order they occur within a round
+phase_events = {
+    'round_start': 'freeze',
+    'round_freeze_end': 'live',
+    'round_end': 'post',
+}
+
+phases = ['warmup', 'freeze', 'live', 'post']
+
+# Sides by the `team_num` prop of demoparser2
+sides = {2: 'T', 3: 'CT'}
+
+
+def get_event(events, event_name: str) -> pd.DataFrame:
+    """
+    Returns the parsed events with the given name, from the (event name, DataFrame) list returned by demoparser2.
+    """
+    frames = [df for name, df in events if name == event_name and df is not None and len(df) > 0]
+    if not frames:
+        return pd.DataFrame({'tick': pd.Series(dtype='int64')})
+    return pd.concat(frames, ignore_index=True)
+
+
+def build_round_index(events) -> pd.DataFrame:
+    """
+    Builds the phase boundaries of a demo from its round_start, round_freeze_end and round_end events.
+    Everything before the match start (the last round_announce_match_start, if any) is warmup.
+
+    :return: DataFrame sorted by tick, with one row per boundary and columns 'tick', 'phase' and 'round'
+    """
+    match_start = get_event(events, 'round_announce_match_start')['tick']
+    match_start_tick = match_start.max() if len(match_start) > 0 else 0
+
+    boundaries = []
+    for event_name, phase in phase_events.items():
+        ticks = get_event(events, event_name)['tick']
+        ticks = ticks[ticks >= match_start_tick]
+        boundaries.append(pd.DataFrame({'tick': ticks.astype('int64'), 'phase': phase, 'order': phases.index(phase)}))
+
+    index = pd.concat(boundaries, ignore_index=True).sort_values(['tick', 'order'], kind='stable').drop(columns='order')
+    # Every round starts with its freeze time
+    index['round'] = (index['phase'] == 'freeze').cumsum()
+
+    return index.reset_index(drop=True)
+
+
+def assign_phases(ticks: pd.DataFrame, events) -> pd.DataFrame:
+    """
+    Adds the 'round' and 'phase' of every tick of a single demo, with one binary search per tick,
+    and the 'side' of every player in the round if the ticks have the 'team_num' prop, see `assign_sides`.
+    Ticks before the first round are round 0, in the 'warmup' phase.
+    """
+    index = build_round_index(events)
+    position = np.searchsorted(index['tick'].to_numpy(), ticks['tick'].to_numpy(), side='right') - 1
+
+    # Position -1 (before the first boundary) picks the appended warmup entry
+    round_numbers = np.append(index['round'].to_numpy(), 0)
+    phase_names = np.append(index['phase'].to_numpy(dtype=object), 'warmup')
+
+    ticks = ticks.assign(round=round_numbers[position], phase=phase_names[position])
+    if 'team_num' in ticks.columns:
+        ticks = assign_sides(ticks)
+    return ticks
+
+
+def assign_sides(ticks: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the 'side' ('T' or 'CT') of every player in every round: their 'team_num' at the first tick of the round,
+    so a team switch during a round, e.g. at halftime, only applies from the next round on.
+    Without 'round' annotations, the side of every tick is its own 'team_num'.
+
+    :param ticks: Ticks with 'team_num' and 'name', ordered by tick within each match
+    """
+    team_num = ticks['team_num']
+    if 'round' in ticks.columns:
+        keys = [ticks[column] for column in ['match', 'name', 'round'] if column in ticks.columns]
+        team_num = team_num.groupby(keys, sort=False, observed=True).transform('first')
+    return ticks.assign(side=team_num.map(sides))
+
+
+def live_ticks(ticks: pd.DataFrame, events) -> pd.DataFrame:
+    """
+    Keeps only the ticks where a round is being played, dropping warmup, freeze time, halftime and post-round ticks.
+    """
+    ticks = assign_phases(ticks, events)
+    return ticks[ticks['phase'] == 'live']
+
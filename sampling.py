@@ -0,0 +1,84 @@
+from typing import List
+import numpy as np
+import pandas as pd
+import util
+import profiling
+import merge_demo_files as merger
+
+usage = "number of ticks kept per (player, map), drawn evenly from every match and, within a match, every round"
+
+
+def allocate(sizes: np.ndarray, total: int) -> np.ndarray:
+    """
+    Splits `total` draws as evenly as possible over strata of the given sizes. Strata smaller than their share are
+    taken whole, and the draws they leave over go to the larger strata.
+
+    :return: Draws per stratum, never more than its size, summing to min(total, sizes.sum())
+    """
+    sizes = np.asarray(sizes, dtype='int64')
+    if total >= sizes.sum():
+        return sizes.copy()
+
+    # Find the largest per-stratum cap c with sum(min(size, c)) <= total
+    ordered = np.sort(sizes)
+    below = np.concatenate([[0], np.cumsum(ordered)[:-1]])
+    capacity = below + ordered * (len(ordered) - np.arange(len(ordered)))
+    index = np.searchsorted(capacity, total, side='right')
+    cap = (total - below[index]) // (len(ordered) - index)
+    counts = np.minimum(sizes, cap)
+
+    # Hand out the remainder one draw each to the strata that are not yet full
+    open_strata = np.flatnonzero(counts < sizes)
+    counts[open_strata[:total - counts.sum()]] += 1
+    return counts
+
+
+def _sample_keys(ticks: pd.DataFrame, seed: int) -> np.ndarray:
+    # A fixed random key per row, from hashing the row's identity, so a player's sample does not depend on the other
+    # rows in the frame, and adding demos leaves the existing draws in place
+    return pd.util.hash_pandas_object(ticks[['match', 'tick', 'steamid']], index=False, hash_key=f'{seed:016d}'[-16:]).to_numpy()
+
+
+def stratified_sample(ticks: pd.DataFrame, size: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Draws at most `size` ticks per (player, map), see `usage`. Ticks are stratified by match, and by round if the ticks
+    have round annotations, so players with few and many demos are summarized by equally sized samples.
+    Rows keep their original order.
+    """
+    with profiling.stage('sample'):
+        profiling.count(len(ticks))
+        if ticks.empty:
+            return ticks
+        strata = ['name', 'map', 'match'] + (['round'] if 'round' in ticks.columns else [])
+        stratum = ticks.groupby(strata, sort=False, observed=True).ngroup().to_numpy()
+        stratum_keys = ticks[strata].iloc[np.unique(stratum, return_index=True)[1]].reset_index(drop=True)
+        stratum_sizes = np.bincount(stratum)
+
+        # Share the draws of every (player, map) over its matches, then the draws of every match over its rounds
+        quotas = np.zeros(len(stratum_sizes), dtype='int64')
+        for _, group in stratum_keys.groupby(['name', 'map'], sort=False, observed=True):
+            matches = group.groupby('match', sort=False, observed=True).indices
+            match_quotas = allocate([stratum_sizes[group.index[rows]].sum() for rows in matches.values()], size)
+            for rows, quota in zip(matches.values(), match_quotas):
+                quotas[group.index[rows]] = allocate(stratum_sizes[group.index[rows]], quota)
+
+        # Keep the rows with the smallest keys of every stratum
+        order = np.lexsort((_sample_keys(ticks, seed), stratum))
+        starts = np.concatenate([[0], np.cumsum(stratum_sizes)[:-1]])
+        rank = np.empty(len(ticks), dtype='int64')
+        rank[order] = np.arange(len(ticks)) - starts[stratum[order]]
+        return ticks[rank < quotas[stratum]]
+
+
+def merge_sampled(folder_path: str, tick_props: List[str], size: int, seed: int = 0, players_of_interest: List[str] = None, limit: int = None, map_name: str = None, annotate_rounds: bool = False, live_only: bool = False, downsample: str = None, exclude_hashes: set = None) -> pd.DataFrame:
+    """
+    `merge_demo_files` followed by `stratified_sample`, cached, so later runs load only the sample.
+    Annotate the rounds to stratify the sample by round.
+    """
+    cache_args = ['merge_sampled', folder_path, tick_props, size, seed, players_of_interest, limit, map_name, annotate_rounds, live_only, downsample, sorted(exclude_hashes) if exclude_hashes else None]
+    sample = util.load_cache(cache_args, [folder_path])
+    if sample is None:
+        ticks, _ = merger.merge_demo_files(folder_path, tick_props, players_of_interest=players_of_interest, limit=limit, map_name=map_name, annotate_rounds=annotate_rounds, live_only=live_only, downsample=downsample, exclude_hashes=exclude_hashes)
+        sample = stratified_sample(ticks, size, seed).reset_index(drop=True)
+        util.store_cache(sample, cache_args, [folder_path])
+    return sample
@@ -4,11 +4,11 @@ from tqdm import tqdm
 import util
 import pandas as pd
 import matplotlib
-matplotlib.use('wxAgg')
+matplotlib.use('Agg')
 
-import matplotlib.pyplot as plt
-import seaborn as sns
 import merge_demo_files as merger
+import profiling
+import sampling
 
 players_of_interest = [
     "ZywOo",
@@ -32,23 +32,31 @@ def main():
     parser.add_argument('--players', type=str, nargs='*', default=[], help='List of player usernames to filter (empty for all players)')
     parser.add_argument('--show', action='store_true', help='Show interactive plot instead of saving to file')
     parser.add_argument('--limit', type=int, default=None, help='Limit the number of demo files to process')
+    parser.add_argument('--sample', type=int, default=None, help=f'Plot a stratified sample of ticks, the {sampling.usage}. Defaults to every tick')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the tick sample')
 
 
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.start(args)
 
-    ticks = util.load_cache([args.folder, args.limit, tick_props])
+    cache_args = [args.folder, args.limit, tick_props] + ([args.sample, args.seed] if args.sample is not None else [])
+    ticks = util.load_cache(cache_args, [args.folder])
 
     if ticks is None:
-        ticks, _ = merger.merge_demo_files(
-            folder_path=args.folder, 
-            tick_props=tick_props,
-            players_of_interest=players_of_interest,
-            limit=args.limit
-        )
+        if args.sample is not None:
+            ticks = sampling.merge_sampled(args.folder, tick_props, args.sample, args.seed, players_of_interest=players_of_interest, limit=args.limit, annotate_rounds=True)
+        else:
+            ticks, _ = merger.merge_demo_files(
+                folder_path=args.folder, 
+                tick_props=tick_props,
+                players_of_interest=players_of_interest,
+                limit=args.limit
+            )
     
         # ticks = util.split_list_columns(ticks)
 
-        util.store_cache(ticks, [args.folder, args.limit, tick_props])
+        util.store_cache(ticks, cache_args, [args.folder])
 
     maps = util.parse_maps_from_ticks(ticks)
 
@@ -81,6 +89,8 @@ def plot_scatter(
     :param df: Pandas DataFrame with columns ['name', 'match', 'aim_X', 'aim_Y']
     :param player_name: Name of the player to filter data
     """
+    import matplotlib.pyplot as plt
+
     # Filter data for the given player
     player_data = df[df['name'] == player_name]
     
@@ -103,7 +113,8 @@ def plot_scatter(
 
     # plt.legend()
     # plt.show()
-    plt.savefig(f"./figures/{figure_name}.png")
+    with profiling.stage('savefig'):
+        plt.savefig(f"./figures/{figure_name}.png")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,79 @@
+import os
+from time import time
+from typing import List
+import util
+
+def wait_for_after_content(driver, element_locator, expected_content, timeout=10):
+    # Imported here, so the download monitoring below can be used without selenium installed
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    # Wait for the element to be present in the DOM
+    element = WebDriverWait(driver, timeout).until(
+        EC.presence_of_element_located(element_locator)
+    )
+    
+    # Wait until the ::after content matches the expected value
+    WebDriverWait(driver, timeout).until(
+        lambda driver: driver.execute_script("""
+            var element = arguments[0];
+            var styles = window.getComputedStyle(element, '::after');
+            return styles.getPropertyValue('content') === arguments[1];
+        """, element, expected_content)
+    )
+
+# Extensions of files that are still being downloaded by the browser
+PARTIAL_DOWNLOAD_EXTENSIONS = ('.crdownload', '.part', '.tmp')
+
+def list_files(folder_path) -> set:
+    if not os.path.isdir(folder_path):
+        return set()
+    return {entry.name for entry in os.scandir(folder_path) if entry.is_file()}
+
+def monitor_folder_for_changes(folder_path, known_files: set = None, timeout: float = None, poll_interval: float = 0.25) -> List[str]:
+    """
+    Waits until the downloads that appeared in `folder_path` after `known_files` was listed are complete.
+    A download is complete once it no longer has a partial extension (e.g. Chrome's `.crdownload`)
+    and its size is unchanged for `poll_interval` seconds. Files in `known_files` are never looked at,
+    so the cost does not depend on how many files are already in the folder.
+
+    :param known_files: File names present before the download started, see `list_files`.
+                        When None, waits for all files currently being downloaded.
+    :param timeout: Maximum number of seconds to wait, or None to wait indefinitely
+    :return: Paths of the completed new files
+    """
+    # Ensure the folder exists
+    if not os.path.exists(folder_path):
+        print("Folder not found")
+        return []
+
+    if known_files is None:
+        known_files = {name for name in list_files(folder_path) if not name.endswith(PARTIAL_DOWNLOAD_EXTENSIONS)}
+
+    deadline = time() + timeout if timeout is not None else None
+    previous_sizes = None
+    previous_check = 0.0
+
+    for _ in util.watch_folder(folder_path, poll_interval):
+        new_files = list_files(folder_path) - known_files
+        pending = [name for name in new_files if name.endswith(PARTIAL_DOWNLOAD_EXTENSIONS)]
+        finished = sorted(name for name in new_files if not name.endswith(PARTIAL_DOWNLOAD_EXTENSIONS))
+
+        if deadline is not None and time() > deadline:
+            return [os.path.join(folder_path, name) for name in finished]
+
+        if pending or not finished:
+            previous_sizes = None
+            continue
+
+        try:
+            sizes = {name: os.path.getsize(os.path.join(folder_path, name)) for name in finished}
+        except FileNotFoundError:
+            # Renamed or removed while listing, check again
+            continue
+        if sizes == previous_sizes and time() - previous_check >= poll_interval:
+            return [os.path.join(folder_path, name) for name in finished]
+
+        if sizes != previous_sizes:
+            previous_sizes = sizes
+            previous_check = time()
@@ -0,0 +1,190 @@
+import os
+from typing import List
+import numpy as np
+import pandas as pd
+import util
+import cache
+import downsampling
+import profiling
+import merge_demo_files as merger
+
+# Bump when the features change, so spectra stored with an older version are recomputed
+SPECTRA_VERSION = 1
+
+spectral_props = ['yaw', 'pitch']
+
+# Welch windows of 2 seconds, overlapping by half
+window_size = 128
+hop = window_size // 2
+
+# Frequency bands of aim movement in Hz, up to the Nyquist frequency of the 64 tick demos
+bands = {
+    'drift': (0.5, 2),
+    'tracking': (2, 6),
+    'micro_correction': (6, 12),
+    'tremor': (12, 32),
+}
+
+_frequencies = np.fft.rfftfreq(window_size, 1 / downsampling.TICKRATE)
+_band_masks = np.array([(_frequencies >= low) & (_frequencies < high) for low, high in bands.values()])
+_band_masks[-1, -1] = True
+_taper = np.hanning(window_size)
+
+
+def feature_columns(props: List[str] = spectral_props) -> List[str]:
+    return [f'{prop}_{band}' for prop in props for band in bands]
+
+
+def window_starts(tick: np.ndarray) -> np.ndarray:
+    """
+    Start positions of the Welch windows over the velocities of a player, which are the differences between
+    consecutive rows. Windows only cover consecutive ticks, so gaps (e.g. deaths or downsampling) never enter a spectrum.
+    """
+    if len(tick) <= window_size:
+        return np.empty(0, dtype='int64')
+    gaps = np.concatenate([[0], np.cumsum(np.diff(tick) != 1)])
+    starts = np.arange(0, len(tick) - window_size, hop)
+    return starts[gaps[starts + window_size] == gaps[starts]]
+
+
+def _velocity_windows(player_ticks: pd.DataFrame, starts: np.ndarray, props: List[str]) -> List[np.ndarray]:
+    """
+    The windows of angular velocity of a single player starting at `starts`, one array of windows per prop.
+    """
+    if len(starts) == 0:
+        return []
+    windows = []
+    for prop in props:
+        velocity = np.diff(player_ticks[prop].to_numpy(dtype='float64'))
+        if prop == 'yaw':
+            velocity = (velocity + 180) % 360 - 180
+        velocity *= downsampling.TICKRATE
+        windows.append(np.lib.stride_tricks.sliding_window_view(velocity, window_size)[starts])
+    return windows
+
+
+def _band_powers(windows: np.ndarray) -> np.ndarray:
+    """
+    Tapers every window and integrates its power spectrum over every band, all windows in one batched FFT.
+    """
+    windows = (windows - windows.mean(axis=1, keepdims=True)) * _taper
+    power = np.abs(np.fft.rfft(windows, axis=1)) ** 2 / (downsampling.TICKRATE * (_taper ** 2).sum())
+    return power @ _band_masks.T * (_frequencies[1] - _frequencies[0])
+
+
+def window_band_powers(player_ticks: pd.DataFrame, props: List[str] = spectral_props) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Band powers of every Welch window of a single player, before averaging, e.g. to resample windows.
+
+    :param player_ticks: Ticks of one player in one demo, sorted by tick
+    :return: (band powers of shape (windows, props * bands) in the column order of `feature_columns`, start tick of every window)
+    """
+    tick = player_ticks['tick'].to_numpy()
+    starts = window_starts(tick)
+    if len(starts) == 0:
+        return np.empty((0, len(props) * len(bands))), np.empty(0, dtype=tick.dtype)
+    powers = [_band_powers(windows) for windows in _velocity_windows(player_ticks, starts, props)]
+    return np.concatenate(powers, axis=1), tick[starts]
+
+
+def compute_spectra(ticks: pd.DataFrame, props: List[str] = spectral_props) -> pd.DataFrame:
+    """
+    Welch band powers of the angular velocity of every player in the ticks of a single demo. The windows of all
+    players and props are tapered and transformed in one batched FFT.
+
+    :return: DataFrame with one row per player, the number of windows, and the mean power of every band per prop
+    """
+    with profiling.stage('spectra'):
+        profiling.count(len(ticks))
+        names, counts, windows = [], [], []
+        for name, player_ticks in ticks.sort_values(['name', 'tick'], kind='stable').groupby('name', sort=False):
+            starts = window_starts(player_ticks['tick'].to_numpy())
+            names.append(name)
+            counts.append(len(starts))
+            windows += _velocity_windows(player_ticks, starts, props)
+
+        if not names:
+            return pd.DataFrame(columns=['name', 'windows'] + feature_columns(props))
+
+        band_power = _band_powers(np.concatenate(windows) if windows else np.empty((0, window_size)))
+
+        # Mean band power of every (player, prop), from its consecutive block of windows
+        sizes = np.repeat(counts, len(props))
+        sums = np.zeros((len(sizes), len(bands)))
+        np.add.at(sums, np.repeat(np.arange(len(sizes)), sizes), band_power)
+        means = sums / np.maximum(sizes, 1)[:, None]
+
+        features = pd.DataFrame(means.reshape(len(names), -1), columns=feature_columns(props))
+        features.insert(0, 'windows', counts)
+        features.insert(0, 'name', names)
+        return features
+
+
+def _spectra_path(demo_file: str) -> str:
+    return f'{demo_file}{util.PARSED_DEMO_SUFFIX}/spectra_v{SPECTRA_VERSION}'
+
+
+def store_spectra(demo_file: str, ticks: pd.DataFrame) -> pd.DataFrame:
+    """
+    Computes the spectra of a parsed demo and stores them in its parsed store, e.g. at ingest while the ticks are in memory.
+    """
+    spectra = compute_spectra(ticks)
+    merger.write_atomic(_spectra_path(demo_file), lambda path: cache.write_frame(spectra, path))
+    return spectra
+
+
+def load_spectra(folder_path: str, limit: int = None, map_name: str = None, exclude_hashes: set = None) -> pd.DataFrame:
+    """
+    Loads the spectra of every demo in `folder_path`, computing and storing the ones that are missing.
+
+    :return: The spectra of all demos, with 'match' and 'map' columns
+    """
+    frames = []
+    for name, demo_file in util.find_demo_files(folder_path, limit=limit, exclude_hashes=exclude_hashes):
+        stored = merger.read_store_info(demo_file + util.PARSED_DEMO_SUFFIX)
+        if stored is not None and os.path.exists(_spectra_path(demo_file)):
+            header = stored['header']
+            if map_name is not None and header['map_name'] != map_name:
+                continue
+            spectra = cache.read_frame(_spectra_path(demo_file))
+        else:
+            demo = merger.load_demo(demo_file, spectral_props, map_name)
+            if demo is None:
+                continue
+            ticks, _, header = demo
+            spectra = store_spectra(demo_file, ticks)
+        frames.append(spectra.assign(match=name, map=header['map_name']))
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['name', 'windows', 'match', 'map'] + feature_columns())
+
+
+def player_vectors(spectra: pd.DataFrame, map_name: str = None) -> dict:
+    """
+    Combines the spectra of all matches of every player, weighted by their number of windows, into the fraction of
+    the power of every prop in each band.
+
+    :return: {player name: vector of band fractions, grouped by prop}
+    """
+    if map_name:
+        spectra = spectra[spectra['map'] == map_name]
+    spectra = spectra[spectra['windows'] > 0]
+
+    weighted = spectra[feature_columns()].mul(spectra['windows'], axis=0).groupby(spectra['name']).sum()
+    return dict(zip(weighted.index, band_fractions(weighted.to_numpy())))
+
+
+def band_fractions(power: np.ndarray) -> np.ndarray:
+    """
+    Normalizes band powers, in the column order of `feature_columns`, to the fraction of the power of every prop in each band.
+    """
+    power = np.asarray(power, dtype='float64').reshape(-1, len(spectral_props), len(bands))
+    fractions = power / np.maximum(power.sum(axis=-1, keepdims=True), np.finfo('float64').tiny)
+    return fractions.reshape(len(power), -1)
+
+
+def compute_spectral_similarity(new_vector: np.ndarray, known_vector: np.ndarray) -> float:
+    """
+    One minus the total variation distance between the band fractions of two players, averaged over the props.
+    """
+    difference = np.abs(np.asarray(new_vector) - np.asarray(known_vector)).reshape(len(spectral_props), len(bands))
+    return 1 - difference.sum(axis=-1).mean() / 2
@@ -0,0 +1,132 @@
+import os
+import argparse
+from typing import List
+import numpy as np
+import pandas as pd
+import downsampling
+import merge_demo_files as merger
+
+# Player pool, including the players of interest of the analysis scripts, so their filters keep rows
+player_pool = [
+    "ZywOo", "ropz", "flameZ", "mezii", "apEX",
+    "s1mple", "NiKo", "m0NESY", "donk", "sh1ro",
+    "electroNic", "b1t", "Twistzz", "frozen", "jL",
+    "broky", "rain", "karrigan", "Spinx", "XANTARES",
+]
+
+maps = ['de_mirage', 'de_inferno', 'de_dust2', 'de_nuke', 'de_anubis', 'de_ancient', 'de_vertigo']
+
+# About 45 minutes at 64 ticks per second
+default_ticks_per_match = 64 * 60 * 45
+round_ticks = 64 * 115
+freeze_ticks = 64 * 15
+post_round_ticks = 64 * 5
+
+def markov_flags(rng: np.random.Generator, shape: tuple, switch_probability: float) -> np.ndarray:
+    """
+    Boolean flags that switch state with `switch_probability` per tick, giving runs like ducking or being airborne.
+    """
+    return (np.cumsum(rng.random(shape) < switch_probability, axis=0) % 2).astype(bool)
+
+def generate_match(rng: np.random.Generator, match: str, ticks: int, players_per_match: int = 10, list_props: bool = True) -> pd.DataFrame:
+    """
+    Generates the ticks of one match, ordered by tick and then player, like `DemoParser.parse_ticks`.
+    Positions and view angles are random walks, with heavy tailed flicks in yaw.
+    """
+    players = rng.choice(len(player_pool), players_per_match, replace=False)
+    shape = (ticks, players_per_match)
+
+    steps = rng.normal(0, 3, (2,) + shape)
+    position = np.clip(rng.uniform(-2500, 2500, (2, 1, players_per_match)) + np.cumsum(steps, axis=1), -4000, 4000)
+    z = np.clip(np.cumsum(rng.normal(0, 0.5, shape), axis=0), -400, 400)
+    velocity = np.hypot(steps[0], steps[1]) * downsampling.TICKRATE
+
+    yaw = (np.cumsum(rng.standard_t(2, shape) * 2, axis=0) + 180) % 360 - 180
+    pitch = np.clip(np.cumsum(rng.normal(0, 0.5, shape), axis=0), -89, 89)
+
+    ducking = markov_flags(rng, shape, 0.01)
+    tick = np.arange(ticks)
+
+    data = {
+        'tick': np.repeat(tick, players_per_match),
+        'steamid': np.tile(76561198000000000 + players, ticks),
+        'name': np.tile(np.array(player_pool, dtype=object)[players], ticks),
+        'X': position[0].ravel().astype('float32'),
+        'Y': position[1].ravel().astype('float32'),
+        'Z': z.ravel().astype('float32'),
+        'velocity': velocity.ravel().astype('float32'),
+        'pitch': pitch.ravel().astype('float32'),
+        'yaw': yaw.ravel().astype('float32'),
+        'ducking': ducking.ravel(),
+        'is_airborne': markov_flags(rng, shape, 0.02).ravel(),
+        'duck_amount': ducking.ravel().astype('float32'),
+        'team_num': np.tile(np.where(np.arange(players_per_match) < players_per_match // 2, 2, 3), ticks),
+        'total_rounds_played': np.repeat(tick // round_ticks, players_per_match),
+    }
+    if list_props:
+        punch = rng.normal(0, 0.2, (ticks * players_per_match, 3)) * (rng.random((ticks * players_per_match, 1)) < 0.05)
+        data['aim_punch_angle'] = punch.tolist()
+
+    return pd.DataFrame(data).assign(match=match)
+
+def generate_events(ticks: int) -> list:
+    """
+    Round events for a match of `ticks` ticks, in the (event name, DataFrame) format of `DemoParser.parse_events`.
+    """
+    round_start = np.arange(0, ticks, round_ticks)
+    return [
+        ('round_announce_match_start', pd.DataFrame({'tick': [0]})),
+        ('round_start', pd.DataFrame({'tick': round_start})),
+        ('round_freeze_end', pd.DataFrame({'tick': round_start + freeze_ticks})),
+        ('round_end', pd.DataFrame({'tick': round_start + round_ticks - post_round_ticks})),
+    ]
+
+def generate_ticks(rows: int, players_per_match: int = 10, ticks_per_match: int = default_ticks_per_match, seed: int = 0, list_props: bool = True) -> pd.DataFrame:
+    """
+    Generates `rows` ticks of realistic looking merged demo data, with the columns of `merge_demo_files` plus the
+    'match' and 'map' columns. Matches are full length, except when `rows` is smaller than a single match.
+
+    :param list_props: Include the list-valued 'aim_punch_angle' prop, which is slow to generate at large scales
+    """
+    rng = np.random.default_rng(seed)
+    matches = max(1, round(rows / (players_per_match * ticks_per_match)))
+    ticks = -(-rows // (players_per_match * matches))
+
+    frames = []
+    for index in range(matches):
+        frame = generate_match(rng, f'synthetic_{index}.dem', ticks, players_per_match, list_props)
+        frames.append(frame.assign(map=maps[index % len(maps)]))
+
+    return pd.concat(frames, ignore_index=True).iloc[:rows]
+
+def write_parsed_demos(ticks: pd.DataFrame, folder: str, tick_props: List[str]) -> List[str]:
+    """
+    Writes every match of synthetic ticks as a parsed demo store in `folder`,
+    so `merge_demo_files` can load them without .dem files.
+
+    :return: The demo files of the stores
+    """
+    os.makedirs(folder, exist_ok=True)
+    demo_files = []
+    for match, match_ticks in ticks.groupby('match', sort=False):
+        demo_file = os.path.join(folder, match)
+        info = {'map_name': match_ticks['map'].iloc[0]}
+        merger.store_parsed_demo(demo_file, match_ticks[merger.KEY_COLUMNS + tick_props], generate_events(match_ticks['tick'].max() + 1), info, tick_props)
+        demo_files.append(demo_file)
+
+    return demo_files
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic parsed demos, to run the analysis scripts without real demo files')
+    parser.add_argument('destination', type=str, help='Path to the folder to write the parsed demo stores to')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Total number of ticks to generate')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+    args = parser.parse_args()
+
+    ticks = generate_ticks(args.rows, seed=args.seed)
+    tick_props = [column for column in ticks.columns if column not in merger.BASE_COLUMNS]
+    demo_files = write_parsed_demos(ticks, args.destination, tick_props)
+    print(f"Wrote {len(ticks)} ticks in {len(demo_files)} parsed demos to {args.destination}")
+
+if __name__ == '__main__':
+    main()
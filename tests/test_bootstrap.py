@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+import bootstrap
+import player_similarity
+import synthetic
+
+
+@pytest.fixture(scope='module')
+def ticks():
+    return synthetic.generate_ticks(40_000, ticks_per_match=2000, seed=0)
+
+
+def player_ticks(ticks, rank):
+    name = ticks['name'].value_counts().index[rank]
+    return ticks[ticks['name'] == name]
+
+
+def test_resample_weights():
+    weights = bootstrap.resample_weights(7, np.random.default_rng(0), count=500)
+
+    assert weights.shape == (500, 7)
+    assert (weights.sum(axis=1) == 7).all()
+    assert (weights >= 0).all() and np.array_equal(weights, np.rint(weights))
+    # Every unit is drawn once per resample on average
+    np.testing.assert_allclose(weights.mean(axis=0), 1, atol=0.15)
+    np.testing.assert_array_equal(weights, bootstrap.resample_weights(7, np.random.default_rng(0), count=500))
+
+
+def test_resample_units_by_round_or_block():
+    ticks = pd.DataFrame({'match': ['a', 'a', 'a', 'b'], 'tick': [0, 1, bootstrap.block_ticks, 0]})
+    units, count = bootstrap.resample_units(ticks)
+    assert count == 3 and units.tolist() == [0, 0, 1, 2]
+
+    units, count = bootstrap.resample_units(ticks.assign(round=[1, 2, 2, 1]))
+    assert count == 3 and units.tolist() == [0, 1, 1, 2]
+
+
+def test_basic_interval():
+    deviations = np.linspace(-0.1, 0.2, 1001)
+    low, high = bootstrap.interval(0.5, deviations)
+    # Mirrored around the estimate: the upper deviations lower the bound
+    assert low == pytest.approx(0.5 - np.percentile(deviations, 97.5))
+    assert high == pytest.approx(0.5 - np.percentile(deviations, 2.5))
+
+    # Clipped to the similarity range, and a perfect score stays inside its own interval
+    assert bootstrap.interval(0.95, deviations)[1] == 1.0
+    assert bootstrap.interval(1.0, -np.abs(deviations)) == (1.0, 1.0)
+    assert np.isnan(bootstrap.interval(0.5, np.full(10, np.nan))).all()
+
+
+def test_location_interval_covers_the_estimate(ticks):
+    new, known = player_ticks(ticks, 0), player_ticks(ticks, 1)
+    estimate, deviations = bootstrap.location_bootstrap(new, known, np.random.default_rng(1))
+
+    # The full-sample estimate is the similarity of the location sketches
+    sketches = {}
+    player_similarity.accumulate_location_sketches(sketches, pd.concat([new, known]))
+    assert estimate == pytest.approx(player_similarity.compute_location_similarity_sketch(sketches[new['name'].iloc[0]], sketches[known['name'].iloc[0]]))
+
+    assert len(deviations) == bootstrap.resamples
+    low, high = bootstrap.interval(estimate, deviations)
+    assert low <= estimate <= high
+    assert high - low < 0.5
+
+    # Deterministic for a seed
+    np.testing.assert_array_equal(deviations, bootstrap.location_bootstrap(new, known, np.random.default_rng(1))[1])
+
+
+def test_combined_interval():
+    rng = np.random.default_rng(2)
+    deviations = {'location': rng.normal(0, 0.02, 1000), 'trajectory': rng.normal(0, 0.05, 1000)}
+    intervals = bootstrap.similarity_intervals({'location': 0.8, 'trajectory': 0.4}, deviations, {'location': 3, 'trajectory': 1})
+
+    estimate, low, high = intervals['combined']
+    assert estimate == pytest.approx(0.7)
+    assert low < estimate < high
+    for metric in deviations:
+        assert intervals[metric][1] < intervals[metric][0] < intervals[metric][2]
+
+    # A metric without resamples leaves the combined interval undefined instead of narrower
+    deviations['trajectory'] = np.full(1000, np.nan)
+    intervals = bootstrap.similarity_intervals({'location': 0.8, 'trajectory': 0.4}, deviations, {'location': 3, 'trajectory': 1})
+    assert np.isnan(intervals['combined'][1:]).all()
+    assert not np.isnan(intervals['location'][1:]).any()
@@ -0,0 +1,42 @@
+import sys
+import pandas as pd
+import pytest
+import boxplots
+import cache
+import synthetic
+
+
+@pytest.fixture
+def run_main(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'cache_dir', str(tmp_path / 'cache'))
+    monkeypatch.chdir(tmp_path)
+
+    def run(*argv):
+        monkeypatch.setattr(sys, 'argv', ['boxplots.py', *argv])
+        boxplots.main()
+        return pd.read_csv(tmp_path / 'figures' / 'boxplot_summary.csv')
+
+    return run
+
+
+def test_summary_table_of_no_ticks():
+    summary = boxplots.compute_summary_table(pd.DataFrame(), ['ducking'], ['name', 'match', 'side'])
+    assert summary.empty
+    assert summary.columns.tolist() == ['name', 'match', 'side', 'field', 'kind', 'count', 'sum', 'mean', 'p25', 'p50', 'p75']
+
+
+@pytest.mark.parametrize('flags', [[], ['--stream']])
+def test_empty_folder(run_main, tmp_path, flags):
+    (tmp_path / 'demos').mkdir()
+    summary = run_main(str(tmp_path / 'demos'), 'ducking', '--split', 'side', *flags)
+    assert summary.empty
+    assert 'side' in summary.columns
+
+
+def test_stream_matches_merged_summary():
+    ticks = synthetic.generate_ticks(4000, ticks_per_match=200, seed=3)
+    merged = boxplots.compute_summary_table(ticks, ['ducking', 'velocity'])
+    streamed = pd.concat([boxplots.compute_summary_table(match_ticks, ['ducking', 'velocity']) for _, match_ticks in ticks.groupby('match')], ignore_index=True)
+
+    key = ['name', 'match', 'field']
+    pd.testing.assert_frame_equal(merged.sort_values(key).reset_index(drop=True), streamed.sort_values(key).reset_index(drop=True))
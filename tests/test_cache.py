@@ -0,0 +1,124 @@
+import os
+import pandas as pd
+import pytest
+import cache
+
+
+@pytest.fixture(autouse=True)
+def cache_folder(tmp_path, monkeypatch):
+    # configure changes module state, the original folder and budget are restored after each test
+    monkeypatch.setattr(cache, 'cache_dir', cache.cache_dir)
+    monkeypatch.setattr(cache, 'max_bytes', cache.max_bytes)
+    monkeypatch.setattr(cache, '_stats', dict.fromkeys(cache._stats, 0))
+    cache.configure(str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
+
+
+def entry_files(folder):
+    return sorted(os.listdir(folder)) if folder.exists() else []
+
+
+def test_frames_and_objects_round_trip(cache_folder):
+    frame = pd.DataFrame({'name': ['ZywOo', 'ropz'], 'ducking': [0.25, 0.5]})
+    cache.store(frame, ['frame'])
+    cache.store({'rows': 2}, ['object'])
+
+    pd.testing.assert_frame_equal(cache.load(['frame']), frame)
+    assert cache.load(['object']) == {'rows': 2}
+    assert {file.rsplit('.', 1)[1] for file in entry_files(cache_folder)} == {'feather', 'pkl'}
+
+
+def test_failed_write_leaves_no_entry(cache_folder):
+    cache.store({'version': 1}, ['args'])
+
+    def replace(source, destination):
+        raise OSError('disk full')
+    with pytest.MonkeyPatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(os, 'replace', replace)
+        cache.store({'version': 2}, ['args'])
+
+    # The temporary file is removed and the previous entry is untouched
+    assert not any(file.endswith('.tmp') for file in entry_files(cache_folder))
+    assert cache.load(['args']) == {'version': 1}
+
+
+def test_unreadable_entry_is_removed(cache_folder):
+    cache.store({'rows': 2}, ['args'])
+    [path] = cache._entry_paths(cache.make_key(['args']))[1:]
+    with open(path, 'wb') as file:
+        file.write(b'truncated')
+
+    assert cache.load(['args']) is None
+    assert not os.path.exists(path)
+    assert cache.stats()['misses'] == 1
+
+
+def test_least_recently_used_entries_are_evicted(cache_folder):
+    payload = b'x' * 10_000
+    for index in range(3):
+        cache.store(payload, [index])
+        path = cache._entry_paths(cache.make_key([index]))[1]
+        os.utime(path, (1000 + index, 1000 + index))
+    size = os.path.getsize(path)
+
+    # Loading marks entry 0 as recently used, so entry 1 is the oldest
+    assert cache.load([0]) == payload
+    cache.configure(size_budget=3 * size)
+    cache.store(payload, [3])
+
+    assert cache.load([1]) is None
+    assert all(cache.load([index]) == payload for index in [0, 2, 3])
+    assert cache.stats()['evictions'] == 1
+
+
+def test_evict_keeps_recent_temporary_files(cache_folder):
+    cache.store(b'x' * 1000, ['args'])
+    temporary_path = cache_folder / 'entry.pkl.1.tmp'
+    temporary_path.write_bytes(b'x' * 1000)
+
+    cache.evict(0)
+    assert entry_files(cache_folder) == ['entry.pkl.1.tmp']
+
+
+def test_demo_changes_invalidate_entries(tmp_path):
+    folder = tmp_path / 'demos'
+    store = folder / 'match.dem.parsed'
+    store.mkdir(parents=True)
+    demo = folder / 'match.dem'
+    demo.write_bytes(b'demo')
+    (store / 'keys').write_bytes(b'keys')
+    (store / 'info.json').write_text('{}')
+
+    cache.store('merged', ['args'], [str(folder)])
+    assert cache.load(['args'], [str(folder)]) == 'merged'
+    assert cache.load(['args'], [str(demo)]) is None
+
+    # Props added to the store don't change the merged ticks of the other props
+    (store / 'velocity').write_bytes(b'velocity')
+    (store / 'info.json').write_text('{"props": ["velocity"]}')
+    assert cache.load(['args'], [str(folder)]) == 'merged'
+
+    key = cache.make_key(['args'], [str(folder)])
+    os.utime(demo, ns=(0, 0))
+    assert cache.make_key(['args'], [str(folder)]) != key
+
+    key = cache.make_key(['args'], [str(folder)])
+    demo.write_bytes(b'longer demo')
+    os.utime(demo, ns=(0, 0))
+    assert cache.make_key(['args'], [str(folder)]) != key
+
+    key = cache.make_key(['args'], [str(folder)])
+    (store / 'keys').write_bytes(b'rebuilt keys')
+    assert cache.make_key(['args'], [str(folder)]) != key
+
+
+def test_stats_count_hits_misses_and_stores():
+    assert cache.load(['args']) is None
+    cache.store('data', ['args'])
+    assert cache.load(['args']) == 'data'
+    assert cache.load(['args']) == 'data'
+
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'stores': 1, 'evictions': 0}
+    # A copy, callers can't change the counters
+    cache.stats()['hits'] = 0
+    assert cache.stats()['hits'] == 2
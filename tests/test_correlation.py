@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import correlation
+
+
+def test_align_match_on_mixed_tick_steps():
+    # Every other tick at first, then a gap, then ticks four apart: the grid step is their common divisor
+    ticks = pd.DataFrame({
+        'tick': [100, 100, 102, 104, 104, 110, 114, 114],
+        'name': ['a', 'b', 'a', 'a', 'b', 'a', 'a', 'ignored'],
+        'yaw': [170.0, 1.0, -170.0, -160.0, 3.0, 0.0, 10.0, 99.0],
+    })
+    grid, step = correlation.align_match(ticks, 'yaw', ['a', 'b'])
+
+    assert step == 2
+    expected = np.full((8, 2), np.nan)
+    expected[[0, 1, 2, 5, 7], 0] = [170, -170, -160, 0, 10]
+    expected[[0, 2], 1] = [1, 3]
+    np.testing.assert_array_equal(grid, expected)
+
+    # Speeds wrap around ±180 and stay missing next to gaps
+    speed, _ = correlation.align_match(ticks, 'yaw', ['a', 'b'], signal='speed')
+    np.testing.assert_allclose(speed[:3, 0], [np.nan, 20, 10])
+    assert np.isnan(speed[2, 1]) and np.isnan(speed[6, 0])
+
+
+def test_align_match_of_a_single_tick():
+    grid, step = correlation.align_match(pd.DataFrame({'tick': [5], 'name': ['a'], 'X': [1.0]}), 'X', ['a'])
+    assert step == 1
+    np.testing.assert_array_equal(grid, [[1.0]])
+
+
+def test_lagged_products_match_direct_correlation():
+    rng = np.random.default_rng(0)
+    grid = rng.normal(size=(300, 3))
+    grid[rng.random(grid.shape) < 0.2] = np.nan
+    max_lag = 20
+
+    products, overlaps = correlation.lagged_products(grid, max_lag)
+
+    present = ~np.isnan(grid)
+    mean = np.nanmean(grid, axis=0)
+    standardized = np.where(present, (grid - mean) / np.nanstd(grid, axis=0), 0)
+    center = len(grid) - 1
+    for a in range(3):
+        for b in range(3):
+            # np.correlate(v, u)[center + k] sums u[t] * v[t + k]
+            window = slice(center - max_lag, center + max_lag + 1)
+            np.testing.assert_allclose(products[a, b], np.correlate(standardized[:, b], standardized[:, a], 'full')[window], atol=1e-9)
+            np.testing.assert_array_equal(overlaps[a, b], np.correlate(present[:, b].astype(float), present[:, a].astype(float), 'full')[window])
+
+
+def test_cross_correlations_find_the_lag():
+    rng = np.random.default_rng(1)
+    signal = rng.normal(size=600)
+    lag = 6
+    ticks = pd.DataFrame({
+        'map': 'de_mirage',
+        'match': 'm1',
+        'tick': np.tile(np.arange(0, 1200, 2), 2),
+        'name': np.repeat(['a', 'b'], 600),
+        # b follows a by three grid rows, six ticks
+        'X': np.concatenate([signal, np.roll(signal, lag // 2)]),
+    })
+    players, lags, correlations = correlation.cross_correlations(ticks, ['X'], max_lag=20)[('de_mirage', 'X')]
+
+    assert players == ['a', 'b']
+    # Odd lags fall between the grid rows of the downsampled match
+    assert np.isnan(correlations[0, 1, lags % 2 == 1]).all()
+    peaks, peak_lags = correlation.peak_correlations(players, lags, correlations)
+    assert peak_lags.loc['a', 'b'] == lag
+    assert peaks.loc['a', 'b'] > 0.95
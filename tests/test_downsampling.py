@@ -0,0 +1,53 @@
+import argparse
+import numpy as np
+import pandas as pd
+import pytest
+import downsampling
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('full', None),
+    ('every:4', 'every:4'),
+    ('hz:16', 'hz:16'),
+    ('hz:0.5', 'hz:0.5'),
+    ('window:player_death:2', 'window:player_death:2'),
+    ('window:player_death,weapon_fire:0', 'window:player_death,weapon_fire:0'),
+])
+def test_valid_specs(spec, expected):
+    assert downsampling.downsample_spec(spec) == expected
+
+
+@pytest.mark.parametrize('spec', ['', 'every', 'every:0', 'every:-2', 'every:1.5', 'hz:0', 'hz:x', 'window::2', 'window:player_death', 'window:player_death:-1', 'random:3'])
+def test_invalid_specs(spec):
+    with pytest.raises(argparse.ArgumentTypeError):
+        downsampling.downsample_spec(spec)
+
+
+@pytest.mark.parametrize('spec, step', [('every:1', 1), ('every:8', 8), ('hz:64', 1), ('hz:16', 4), ('hz:20', 3), ('hz:128', 1), ('hz:0.5', 128)])
+def test_tick_step(spec, step):
+    assert downsampling.tick_step(spec) == step
+
+
+def test_window_mask_edges():
+    tick = np.arange(0, 30)
+    mask = downsampling.window_mask(tick, np.array([10]), 3)
+    # Both ends of the window are included
+    assert tick[mask].tolist() == [7, 8, 9, 10, 11, 12, 13]
+
+
+def test_window_mask_multiple_events():
+    tick = np.arange(0, 40)
+    # Unsorted anchors, overlapping windows, and a window cut off by the first tick
+    mask = downsampling.window_mask(tick, np.array([30, 1, 12, 14]), 2)
+    assert tick[mask].tolist() == [0, 1, 2, 3, 10, 11, 12, 13, 14, 15, 16, 28, 29, 30, 31, 32]
+    assert not downsampling.window_mask(tick, np.array([], dtype='int64'), 2).any()
+
+
+def test_downsample_keeps_players_aligned():
+    ticks = pd.DataFrame({'tick': np.repeat(np.arange(16), 2), 'name': ['a', 'b'] * 16})
+    kept = downsampling.downsample(ticks, [], 'hz:16')
+    assert kept['tick'].tolist() == [0, 0, 4, 4, 8, 8, 12, 12]
+    assert downsampling.downsample(ticks, [], None) is ticks
+
+    events = [('player_death', pd.DataFrame({'tick': [5]}))]
+    assert downsampling.downsample(ticks, events, 'window:player_death:0')['tick'].tolist() == [5, 5]
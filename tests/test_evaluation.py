@@ -0,0 +1,34 @@
+import pytest
+import cache
+import evaluation
+import spectral
+import synthetic
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'cache_dir', str(tmp_path / 'cache'))
+    ticks = synthetic.generate_ticks(80_000, ticks_per_match=500, list_props=False, seed=0)
+    synthetic.write_parsed_demos(ticks, str(tmp_path / 'demos'), ['X', 'Y'])
+    return str(tmp_path / 'demos')
+
+
+def test_spectra_only_loaded_for_spectral_metric(folder, monkeypatch):
+    def load_spectra(*args, **kwargs):
+        raise AssertionError("spectra loaded without the spectral metric")
+    monkeypatch.setattr(spectral, 'load_spectra', load_spectra)
+
+    profiles = evaluation.load_match_profiles(folder, profile_metrics=['location'])
+    assert profiles['location'] and not profiles['paths'] and not profiles['spectra']
+
+    folds = evaluation.match_folds(list(profiles["maps"]))
+    evaluation._init_worker(profiles)
+    rows = evaluation.evaluate_fold(folds[0], ['location'])
+    assert rows and {row[3] for row in rows} == {'location'}
+
+
+def test_profiles_cached_per_metric_set(folder):
+    location = evaluation.load_match_profiles(folder, profile_metrics=['location'])
+    trajectory = evaluation.load_match_profiles(folder, profile_metrics=['trajectory', 'location'])
+    assert not location['paths'] and trajectory['paths']
+    assert evaluation.load_match_profiles(folder, profile_metrics=['location', 'trajectory'])['paths'].keys() == trajectory['paths'].keys()
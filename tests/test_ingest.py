@@ -0,0 +1,107 @@
+import os
+import shutil
+import struct
+import zlib
+import pytest
+import ingest
+import merge_demo_files as merger
+import synthetic
+import util
+
+PROPS = ['X', 'Y', 'pitch', 'yaw']
+
+
+def rar_block(head_type, flags, body=b''):
+    header = struct.pack('<BHH', head_type, flags, 7 + len(body)) + body
+    return struct.pack('<H', zlib.crc32(header) & 0xffff) + header
+
+
+def write_rar(path, files):
+    """
+    Writes a RAR 4 archive that stores `files` ({name: content}) uncompressed, a fixture small enough to build in place.
+    """
+    data = b'Rar!\x1a\x07\x00' + rar_block(0x73, 0, b'\x00' * 6)
+    for name, content in files.items():
+        name = name.encode('utf-8')
+        body = struct.pack('<IIBIIBBHI', len(content), len(content), 2, zlib.crc32(content), 0x5A210000, 20, 0x30, len(name), 0x20) + name
+        data += rar_block(0x74, 0x8000, body) + content
+    data += rar_block(0x7b, 0x4000)
+    with open(path, 'wb') as file:
+        file.write(data)
+    return str(path)
+
+
+ARCHIVE_FILES = {'good.dem': b'good demo', 'bad.dem': b'corrupt demo', 'copy.dem': b'good demo', 'other.dem': b'other demo'}
+
+
+def test_extract_archive(tmp_path):
+    pytest.importorskip('patoolib')
+    if shutil.which('unrar') is None:
+        pytest.skip('unrar is not installed')
+    archive = write_rar(tmp_path / 'match-1.rar', ARCHIVE_FILES)
+
+    output_dir = ingest.extract_archive(archive, str(tmp_path / 'replays'))
+
+    assert output_dir == os.path.normpath(str(tmp_path / 'replays' / 'match-1'))
+    assert sorted(os.listdir(output_dir)) == sorted(ARCHIVE_FILES)
+    with open(os.path.join(output_dir, 'good.dem'), 'rb') as file:
+        assert file.read() == b'good demo'
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    archive = write_rar(tmp_path / 'match-1.rar', ARCHIVE_FILES)
+
+    def extract_archive(archive, destination_path):
+        # Lays out the archive contents like unrar, which is not needed to test the ingestion around it
+        output_dir = os.path.join(destination_path, 'match-1')
+        os.makedirs(output_dir)
+        for name, content in ARCHIVE_FILES.items():
+            with open(os.path.join(output_dir, name), 'wb') as file:
+                file.write(content)
+        return output_dir
+
+    ticks = synthetic.generate_ticks(2000, ticks_per_match=200, list_props=False, seed=0)
+    ticks = ticks[ticks['match'] == ticks['match'].iloc[0]]
+
+    def parse_demo(demo_file, tick_props, map_name=None):
+        if demo_file.endswith('bad.dem'):
+            raise Exception("Demo is corrupt")
+        return ticks[merger.KEY_COLUMNS + tick_props], synthetic.generate_events(ticks['tick'].max() + 1), {'map_name': 'de_mirage'}
+
+    monkeypatch.setattr(ingest, 'extract_archive', extract_archive)
+    monkeypatch.setattr(merger, 'parse_demo', parse_demo)
+    return archive
+
+
+def test_ingest_archive_continues_after_failed_demo(tmp_path, archive, capsys):
+    names, duplicates = ingest.ingest_archive(archive, str(tmp_path / 'replays'), PROPS, delete_demos=True)
+
+    output_dir = tmp_path / 'replays' / 'match-1'
+    # Demos are listed by name, so good.dem is the duplicate of copy.dem
+    assert sorted(names) == ['match-1_copy.dem', 'match-1_other.dem']
+    assert [duplicate['match'] for duplicate in duplicates] == ['match-1_good.dem']
+    assert 'failed to ingest' in capsys.readouterr().out
+    # The failed demo is kept for another attempt, the others are in their parsed stores
+    assert sorted(os.listdir(output_dir)) == ['bad.dem', 'copy.dem.parsed', 'good.dem', 'other.dem.parsed']
+    assert merger.read_store_info(str(output_dir / 'copy.dem.parsed'))['props'] == PROPS
+
+
+def test_ingest_archive_excludes_known_hashes(tmp_path, archive):
+    known = tmp_path / 'known.dem'
+    known.write_bytes(b'other demo')
+
+    names, _ = ingest.ingest_archive(archive, str(tmp_path / 'replays'), PROPS, exclude_hashes={util.demo_hash(str(known))})
+    assert sorted(names) == ['match-1_copy.dem']
+
+
+def test_ingest_archive_default_props(tmp_path, archive, monkeypatch):
+    requested = []
+
+    def parse_demo(demo_file, tick_props, map_name=None):
+        requested.append(tick_props)
+        raise Exception("Demo is corrupt")
+    monkeypatch.setattr(merger, 'parse_demo', parse_demo)
+
+    assert ingest.ingest_archive(archive, str(tmp_path / 'replays')) == ([], [{'match': 'match-1_good.dem', 'demo_file': os.path.join(str(tmp_path / 'replays'), 'match-1', 'good.dem'), 'duplicate_of': 'match-1_copy.dem', 'hash': util.demo_hash(os.path.join(str(tmp_path / 'replays'), 'match-1', 'good.dem'))}])
+    assert requested == [ingest.ingest_props] * 3
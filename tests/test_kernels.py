@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+import kernels
+
+EDGES = np.linspace(-2.0, 2.0, 9)
+
+
+@pytest.fixture(params=['python', 'numba'])
+def backend(request):
+    if request.param == 'numba':
+        pytest.importorskip('numba')
+    selected = kernels.backend
+    yield request.param
+    kernels.use_backend(selected)
+
+
+def compare(backend, function, *args):
+    # Result of `function` with the numpy backend and with `backend`
+    kernels.use_backend('numpy')
+    expected = function(*args)
+    kernels.use_backend(backend)
+    return expected, function(*args)
+
+
+def columns(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=(2, rows))
+    # Values on the edges, including the last edge, which np.histogram puts in the last bin
+    values[0, :len(EDGES)] = EDGES[:rows]
+    return values
+
+
+@pytest.mark.parametrize('rows', [0, 1, 5, 1000])
+def test_derivatives(backend, rows):
+    rng = np.random.default_rng(rows)
+    values = rng.normal(size=rows)
+    values[::7] = np.nan
+    codes = rng.integers(-1, 4, size=rows)
+    expected, result = compare(backend, kernels.derivatives, values, codes)
+    np.testing.assert_allclose(result, expected, rtol=0, atol=1e-12)
+
+
+@pytest.mark.filterwarnings('ignore:invalid value:RuntimeWarning')
+@pytest.mark.parametrize('rows', [0, 1, 5, 1000])
+def test_histograms(backend, rows):
+    expected, result = compare(backend, kernels.histograms, columns(rows), 10)
+    np.testing.assert_allclose(result, expected, rtol=1e-12)
+
+
+def test_histograms_constant(backend):
+    expected, result = compare(backend, kernels.histograms, np.full((1, 4), 3.0), 5)
+    np.testing.assert_allclose(result, expected)
+
+
+@pytest.mark.parametrize('value', [np.nan, np.inf])
+def test_histograms_not_finite(backend, value):
+    values = columns(100)
+    values[1, 3] = value
+    kernels.use_backend('numpy')
+    with pytest.raises(ValueError) as expected:
+        kernels.histograms(values)
+    kernels.use_backend(backend)
+    with pytest.raises(ValueError, match='not finite') as result:
+        kernels.histograms(values)
+    assert str(result.value) == str(expected.value)
+
+
+@pytest.mark.parametrize('rows', [1, 5, 1000])
+def test_wasserstein(backend, rows):
+    known = columns(rows + 3, seed=1)
+    # Ties between and within both distributions
+    known[:, :2] = columns(rows)[:, :1]
+    expected, result = compare(backend, kernels.wasserstein, columns(rows), known)
+    np.testing.assert_allclose(result, expected, rtol=1e-10)
+
+
+def test_wasserstein_nan(backend):
+    values = columns(10)
+    values[0, 4] = np.nan
+    expected, result = compare(backend, kernels.wasserstein, values, columns(20, seed=1))
+    np.testing.assert_allclose(result, expected, rtol=1e-10)
+    assert np.isnan(result[0]) and not np.isnan(result[1])
+
+
+def test_wasserstein_empty(backend):
+    kernels.use_backend(backend)
+    with pytest.raises(ValueError, match="can't be empty"):
+        kernels.wasserstein(np.zeros((1, 0)), np.ones((1, 3)))
+
+
+@pytest.mark.parametrize('rows', [0, 1, 5, 1000])
+def test_binned_counts(backend, rows):
+    values = columns(rows) * 1.5
+    values[1, ::5] = np.nan
+    codes = np.random.default_rng(rows).integers(-1, 3, size=rows)
+    expected, result = compare(backend, kernels.binned_counts, values, codes, 3, EDGES)
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize('rows', [0, 1, 5, 1000])
+def test_grid_counts(backend, rows):
+    values = columns(rows) * 1.5
+    values[1, ::5] = np.nan
+    codes = np.random.default_rng(rows).integers(-1, 3, size=rows)
+    expected, result = compare(backend, kernels.grid_counts, values[0], values[1], codes, 3, EDGES)
+    np.testing.assert_array_equal(result, expected)
+    # Matches np.histogram2d of every group's rows
+    for group in range(3):
+        rows_of_group = codes == group
+        histogram = np.histogram2d(values[0, rows_of_group], values[1, rows_of_group], bins=[EDGES, EDGES])[0]
+        np.testing.assert_array_equal(result[group], histogram)
@@ -0,0 +1,120 @@
+import glob
+import os
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import log_events
+
+AL = '"al<3><[U:1:2]><TERRORIST>"'
+BOB = '"bob<2><[U:1:1]><CT>"'
+
+# One line per event type, with the values it is parsed into
+SAMPLES = {
+    'kill': (
+        f'{AL} [-100 200 -5] killed {BOB} [300 -400 16] with "ak47" (headshot)',
+        {'attacker_name': 'al', 'attacker_userid': 3, 'attacker_steamid': '[U:1:2]', 'attacker_team': 'TERRORIST',
+         'attacker_x': -100.0, 'attacker_y': 200.0, 'attacker_z': -5.0,
+         'victim_name': 'bob', 'victim_userid': 2, 'victim_steamid': '[U:1:1]', 'victim_team': 'CT',
+         'victim_x': 300.0, 'victim_y': -400.0, 'victim_z': 16.0, 'weapon': 'ak47', 'modifiers': 'headshot'},
+    ),
+    'damage': (
+        f'{AL} [-100 200 -5] attacked {BOB} [300 -400 16] with "ak47" (damage "27") (damage_armor "3") (health "73") (armor "97") (hitgroup "chest")',
+        {'attacker_name': 'al', 'attacker_userid': 3, 'attacker_steamid': '[U:1:2]', 'attacker_team': 'TERRORIST',
+         'attacker_x': -100.0, 'attacker_y': 200.0, 'attacker_z': -5.0,
+         'victim_name': 'bob', 'victim_userid': 2, 'victim_steamid': '[U:1:1]', 'victim_team': 'CT',
+         'victim_x': 300.0, 'victim_y': -400.0, 'victim_z': 16.0, 'weapon': 'ak47',
+         'damage': 27, 'damage_armor': 3, 'health': 73, 'armor': 97, 'hitgroup': 'chest'},
+    ),
+    'purchase': (
+        f'{AL} purchased "ak47"',
+        {'player_name': 'al', 'player_userid': 3, 'player_steamid': '[U:1:2]', 'player_team': 'TERRORIST', 'item': 'ak47'},
+    ),
+    'chat': (
+        f'{BOB} say_team "go <TERRORIST> side"',
+        {'player_name': 'bob', 'player_userid': 2, 'player_steamid': '[U:1:1]', 'player_team': 'CT', 'channel': 'say_team', 'message': 'go <TERRORIST> side'},
+    ),
+    'team_switch': (
+        '"bob<2><[U:1:1]>" switched from team <Unassigned> to <CT>',
+        {'player_name': 'bob', 'player_userid': 2, 'player_steamid': '[U:1:1]', 'from_team': 'Unassigned', 'to_team': 'CT'},
+    ),
+    'round_start': ('World triggered "Round_Start"', {}),
+    'round_end': ('World triggered "Round_End"', {}),
+    'match_start': ('World triggered "Match_Start" on "de_mirage"', {'map': 'de_mirage'}),
+    'round_win': (
+        'Team "CT" triggered "SFUI_Notice_CTs_Win" (CT "1") (T "0")',
+        {'team': 'CT', 'reason': 'SFUI_Notice_CTs_Win', 'ct_score': 1, 't_score': 0},
+    ),
+}
+
+PYTHON_TYPES = {'str': str, 'int': int, 'float': float}
+
+
+def log_line(body, time='01/02/2025 - 10:00:00'):
+    return f'L {time}: {body}\n'
+
+
+def test_every_event_has_a_sample():
+    assert set(SAMPLES) == set(log_events.EVENTS)
+
+
+@pytest.mark.parametrize('event', list(log_events.EVENTS))
+def test_parse_line(event):
+    body, expected = SAMPLES[event]
+    assert log_events.parse_line(log_line(body)) == (event, '01/02/2025 - 10:00:00', expected)
+
+    # Every column is converted to its declared type, and fits the Parquet schema of the event
+    columns = log_events.EVENTS[event][2]
+    assert all(isinstance(expected[column], PYTHON_TYPES[kind]) for column, kind in columns.items())
+    [(_, record)] = log_events.parse_events([log_line(body)], 'server_001')
+    table = pa.Table.from_pylist([record], schema=log_events.event_schema(event))
+    assert table.to_pylist()[0] == record
+
+
+@pytest.mark.parametrize('line', [
+    '',
+    'not a log line\n',
+    log_line('Log file started (file "logs/server_001.log")'),
+    log_line(f'{AL} killed with nothing'),
+])
+def test_unknown_lines_are_skipped(line):
+    assert log_events.parse_line(line) is None
+
+
+def test_round_counter():
+    lines = [log_line(SAMPLES[event][0]) for event in ['purchase', 'round_start', 'kill', 'round_end', 'round_start', 'chat']]
+    events = list(log_events.parse_events(lines, 'server_001'))
+    assert [(event, record['round'], record['line_number']) for event, record in events] == [
+        ('purchase', 0, 1), ('round_start', 1, 2), ('kill', 1, 3), ('round_end', 1, 4), ('round_start', 2, 5), ('chat', 2, 6),
+    ]
+
+    # Continuing a log keeps counting from the rounds and lines already read
+    events = list(log_events.parse_events(lines[3:], 'server_001', first_line=4, round_number=1))
+    assert [(record['round'], record['line_number']) for _, record in events] == [(1, 4), (2, 5), (2, 6)]
+
+
+def test_write_events_in_batches(tmp_path):
+    lines = [log_line('Log file started')]
+    for round_number in range(3):
+        lines.append(log_line(SAMPLES['round_start'][0], f'01/0{2 + round_number // 2}/2025 - 23:59:0{round_number}'))
+        for kill in range(5):
+            lines.append(log_line(SAMPLES['kill'][0], f'01/0{2 + round_number // 2}/2025 - 23:59:1{kill}'))
+    log = tmp_path / 'server_001.log'
+    log.write_text(''.join(lines))
+    dest = tmp_path / 'events'
+
+    assert log_events.write_events(str(log), str(dest), batch_size=2) == {'round_start': 3, 'kill': 15}
+
+    # Rows are flushed in batches, partitioned by date
+    parts = sorted(glob.glob(str(dest / 'kill' / 'date=*' / 'log=server_001' / 'part-0.parquet')))
+    assert [os.path.basename(os.path.dirname(os.path.dirname(part))) for part in parts] == ['date=2025-01-02', 'date=2025-01-03']
+    assert pq.ParquetFile(parts[0]).num_row_groups > 1
+
+    kills = log_events.load_events(str(dest), 'kill').to_pandas().sort_values('line_number')
+    assert len(kills) == 15
+    assert kills['line_number'].tolist() == [line for line in range(2, 20) if (line - 2) % 6]
+    assert kills['round'].tolist() == [1] * 5 + [2] * 5 + [3] * 5
+    assert kills['time'].iloc[-1] == datetime(2025, 1, 3, 23, 59, 14)
+    assert kills['attacker_x'].dtype == 'float32'
+
+    assert log_events.load_events(str(dest), 'kill', [('round', '=', 2)]).num_rows == 5
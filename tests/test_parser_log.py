@@ -0,0 +1,111 @@
+import parser_log
+import log_events
+
+LINES = [
+    'L 01/02/2025 - 10:00:00: "bob<2><STEAM_1:0:1><CT>" say_team "go <TERRORIST> side"\n',
+    'L 01/02/2025 - 10:00:01: "al<3><STEAM_1:0:2><TERRORIST>" say_team "rush"\n',
+    'L 01/02/2025 - 10:00:02: "al<3><STEAM_1:0:2><TERRORIST>" say "gg"\n',
+]
+
+
+def read(path):
+    with open(path) as file:
+        return file.read().splitlines()
+
+
+def test_extract_chat_channels(tmp_path):
+    log = tmp_path / "server_001.log"
+    log.write_text(''.join(LINES))
+
+    assert parser_log.extract_chat(str(log), str(tmp_path)) == 3
+    assert read(tmp_path / "server_001_world.csv") == ['Time,User,Team,Message', '01/02/2025 - 10:00:02,al,TERRORIST,gg']
+    # A CT team line mentioning the other team only goes to the CT file, as it always has
+    assert read(tmp_path / "server_001_ct.csv") == ['Time,User,Team,Message', '01/02/2025 - 10:00:00,bob,CT,go <TERRORIST> side']
+    assert read(tmp_path / "server_001_ter.csv") == ['Time,User,Team,Message', '01/02/2025 - 10:00:01,al,TERRORIST,rush']
+
+
+class FakeLogWriter:
+    """
+    Appends to a log like a running server, which can stop in the middle of a line.
+    """
+    def __init__(self, path):
+        self.path = path
+        open(path, "w").close()
+
+    def write(self, text):
+        with open(self.path, "a") as file:
+            file.write(text)
+
+
+def follow_once(src, dest, rows):
+    parser_log.follow(str(src), str(dest), emit=lambda log, channel, row: rows.append((log, channel, row)), passes=1)
+
+
+def test_follow_consumes_complete_lines_once(tmp_path):
+    src, dest = tmp_path / "logs", tmp_path / "out"
+    src.mkdir()
+    dest.mkdir()
+    log = FakeLogWriter(src / "server_001.log")
+    rows = []
+
+    log.write(LINES[0] + LINES[1][:30])
+    follow_once(src, dest, rows)
+    assert [channel for _, channel, _ in rows] == ["ct"]
+
+    # The partial line is only consumed once the server finishes it
+    log.write(LINES[1][30:] + 'L 01/02/2025 - 10:00:01: World triggered "Round_Start"\n')
+    follow_once(src, dest, rows)
+    assert [channel for _, channel, _ in rows] == ["ct", "ter"]
+
+    # A restarted follower resumes from the stored offsets without repeating anything
+    follow_once(src, dest, rows)
+    log.write(LINES[2])
+    follow_once(src, dest, rows)
+    assert [channel for _, channel, _ in rows] == ["ct", "ter", "world"]
+    assert read(dest / "server_001_ter.csv") == ['Time,User,Team,Message', '01/02/2025 - 10:00:01,al,TERRORIST,rush']
+
+    offsets = parser_log.load_offsets(str(dest / parser_log.OFFSETS_FILE))
+    assert offsets["server_001.log"] == {'offset': len(''.join(LINES)) + 55, 'line': 4, 'round': 1}
+
+    events = log_events.load_events(str(dest / parser_log.EVENTS_FOLDER), 'round_start').to_pylist()
+    assert [(event['line_number'], event['round']) for event in events] == [(3, 1)]
+    chat = log_events.load_events(str(dest / parser_log.EVENTS_FOLDER), 'chat').to_pylist()
+    assert sorted((event['line_number'], event['round']) for event in chat) == [(1, 0), (2, 0), (4, 1)]
+
+
+def test_follow_replays_events_idempotently(tmp_path):
+    src, dest = tmp_path / "logs", tmp_path / "out"
+    src.mkdir()
+    dest.mkdir()
+    FakeLogWriter(src / "server_001.log").write(''.join(LINES))
+
+    follow_once(src, dest, [])
+    # As if the follower crashed before storing its offsets
+    (dest / parser_log.OFFSETS_FILE).unlink()
+    follow_once(src, dest, [])
+
+    chat = log_events.load_events(str(dest / parser_log.EVENTS_FOLDER), 'chat')
+    assert chat.num_rows == 3
+
+
+def test_load_offsets_of_older_followers(tmp_path):
+    file = tmp_path / parser_log.OFFSETS_FILE
+    file.write_text('{"server_001.log": 120}')
+    assert parser_log.load_offsets(str(file)) == {"server_001.log": {'offset': 120, 'line': 0, 'round': 0}}
+
+
+def test_batch_run_replaces_followed_events(tmp_path):
+    src, dest = tmp_path / "logs", tmp_path / "out"
+    src.mkdir()
+    dest.mkdir()
+    log = FakeLogWriter(src / "server_001.log")
+    log.write(LINES[0])
+    follow_once(src, dest, [])
+    log.write(LINES[1] + LINES[2])
+    follow_once(src, dest, [])
+
+    events = str(dest / parser_log.EVENTS_FOLDER)
+    assert log_events.load_events(events, 'chat').num_rows == 3
+    # The followed parts never overwrite the batch part, and a batch run replaces all of them
+    log_events.write_events(str(src / "server_001.log"), events)
+    assert sorted(event['line_number'] for event in log_events.load_events(events, 'chat').to_pylist()) == [1, 2, 3]
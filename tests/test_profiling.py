@@ -0,0 +1,54 @@
+import argparse
+import json
+import pytest
+import profiling
+
+
+@pytest.fixture
+def parser(monkeypatch):
+    monkeypatch.setattr(profiling, 'enabled', False)
+    monkeypatch.setattr(profiling, 'stages', {})
+    monkeypatch.setattr(profiling, '_start', None)
+    # The report is written when the test process exits otherwise
+    exits = []
+    monkeypatch.setattr(profiling.atexit, 'register', lambda function, *args: exits.append((function, args)))
+
+    parser = argparse.ArgumentParser()
+    profiling.add_arguments(parser)
+    parser.exits = exits
+    return parser
+
+
+def run_stage():
+    with profiling.stage('load'):
+        profiling.count(10)
+
+
+def test_disabled_by_default(parser):
+    profiling.start(parser.parse_args([]))
+    run_stage()
+    assert not profiling.enabled and profiling.stages == {} and parser.exits == []
+
+
+def test_summary_without_report(parser, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    profiling.start(parser.parse_args(['--profile_summary']))
+    run_stage()
+
+    [(function, args)] = parser.exits
+    function(*args)
+    output = capsys.readouterr().out
+    assert output.splitlines()[1].split()[:2] == ['load', '1']
+    assert 'Wrote profile' not in output
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_report_and_summary(parser, tmp_path, capsys):
+    path = tmp_path / 'profiles' / 'run.json'
+    profiling.start(parser.parse_args(['--profile', str(path), '--profile_summary']))
+    run_stage()
+
+    [(function, args)] = parser.exits
+    function(*args)
+    assert 'load' in capsys.readouterr().out
+    assert json.loads(path.read_text())['stages']['load']['rows'] == 10
@@ -0,0 +1,33 @@
+import pandas as pd
+import rounds
+
+
+def events(**ticks):
+    return [(name, pd.DataFrame({'tick': values})) for name, values in ticks.items()]
+
+
+def test_assign_phases_with_sides():
+    demo_events = events(round_start=[10, 50], round_freeze_end=[20, 60], round_end=[40, 80])
+    # al switches from T to CT during the post-round of round 1, and starts round 2 as CT
+    ticks = pd.DataFrame({
+        'tick': [5, 10, 25, 45, 50, 65, 85],
+        'name': 'al',
+        'team_num': [2, 2, 2, 3, 3, 3, 3],
+    })
+    ticks = rounds.assign_phases(ticks, demo_events)
+
+    assert ticks['round'].tolist() == [0, 1, 1, 1, 2, 2, 2]
+    assert ticks['phase'].tolist() == ['warmup', 'freeze', 'live', 'post', 'freeze', 'live', 'post']
+    assert ticks['side'].tolist() == ['T', 'T', 'T', 'T', 'CT', 'CT', 'CT']
+
+
+def test_assign_sides_per_player():
+    ticks = pd.DataFrame({
+        'tick': [1, 1, 2, 2],
+        'name': ['al', 'bob', 'al', 'bob'],
+        'round': 1,
+        'team_num': [3, 2, 2, 0],
+    })
+    assert rounds.assign_sides(ticks)['side'].tolist() == ['CT', 'T', 'CT', 'T']
+    # Spectators have no side
+    assert rounds.assign_sides(ticks.drop(columns='round'))['side'].fillna('-').tolist() == ['CT', 'T', 'T', '-']
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+import sampling
+import synthetic
+
+
+@pytest.mark.parametrize('sizes, total, expected', [
+    ([10, 10, 10], 9, [3, 3, 3]),
+    ([2, 10, 10], 12, [2, 5, 5]),
+    ([2, 10, 10], 13, [2, 6, 5]),
+    ([1, 2, 3], 100, [1, 2, 3]),
+    ([5, 0, 5], 4, [2, 0, 2]),
+    ([4, 4], 0, [0, 0]),
+])
+def test_allocate(sizes, total, expected):
+    assert sampling.allocate(np.array(sizes), total).tolist() == expected
+
+
+def test_allocate_properties():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        sizes = rng.integers(0, 50, rng.integers(1, 12))
+        total = int(rng.integers(0, sizes.sum() + 10))
+        counts = sampling.allocate(sizes, total)
+
+        assert counts.sum() == min(total, sizes.sum())
+        assert (counts >= 0).all() and (counts <= sizes).all()
+        # As even as possible: strata that are not taken whole differ by at most one draw
+        partial = counts[counts < sizes]
+        assert len(partial) == 0 or partial.max() - partial.min() <= 1
+        # Strata taken whole are never larger than the others' share, plus the draw of the remainder
+        assert len(partial) == 0 or (counts[counts == sizes] <= partial.min() + 1).all()
+
+
+@pytest.fixture(scope='module')
+def ticks():
+    ticks = synthetic.generate_ticks(30_000, ticks_per_match=600, seed=1)
+    return ticks.assign(round=ticks['total_rounds_played'])
+
+
+def test_stratified_sample_sizes(ticks):
+    sample = sampling.stratified_sample(ticks, 500)
+
+    rows = ticks.groupby(['name', 'map']).size()
+    sampled = sample.groupby(['name', 'map']).size().reindex(rows.index, fill_value=0)
+    pd.testing.assert_series_equal(sampled, np.minimum(rows, 500), check_names=False)
+
+    # Rows keep their order, and every match of a player on a map gets the same share of the draws
+    assert sample.index.is_monotonic_increasing
+    for _, group in sample.groupby(['name', 'map']):
+        per_match = group.groupby('match').size()
+        available = ticks[ticks['name'] == group['name'].iloc[0]].groupby('match').size()[per_match.index]
+        partial = per_match[per_match < available]
+        assert len(partial) == 0 or partial.max() - partial.min() <= 1
+
+
+def test_stratified_sample_is_deterministic(ticks):
+    sample = sampling.stratified_sample(ticks, 300, seed=4)
+    pd.testing.assert_frame_equal(sample, sampling.stratified_sample(ticks, 300, seed=4))
+    # Shuffled input gives the same rows
+    shuffled = ticks.sample(frac=1, random_state=0)
+    pd.testing.assert_frame_equal(sampling.stratified_sample(shuffled, 300, seed=4).sort_index(), sample)
+    assert not sampling.stratified_sample(ticks, 300, seed=5).index.equals(sample.index)
+
+    # The draws of a player don't depend on the other players in the frame
+    player = ticks['name'].iloc[0]
+    alone = sampling.stratified_sample(ticks[ticks['name'] == player], 300, seed=4)
+    pd.testing.assert_frame_equal(alone, sample[sample['name'] == player])
+
+
+def test_stratified_sample_of_no_ticks(ticks):
+    assert sampling.stratified_sample(ticks.iloc[:0], 100).empty
@@ -0,0 +1,39 @@
+import threading
+import time
+import scrape_util
+
+
+def download(folder, name, delay):
+    # Writes the file under Chrome's partial name first, and renames it once the download is done
+    time.sleep(delay)
+    partial = folder / (name + ".crdownload")
+    partial.write_bytes(b"demo" * 1000)
+    time.sleep(delay)
+    with open(partial, "ab") as file:
+        file.write(b"rest")
+    partial.rename(folder / name)
+
+
+def test_monitor_detects_renamed_download(tmp_path):
+    for index in range(200):
+        (tmp_path / f"old_{index}.dem").write_bytes(b"old")
+    # A download left over from an earlier run is not waited for
+    (tmp_path / "stale.dem.crdownload").write_bytes(b"stale")
+    known_files = scrape_util.list_files(tmp_path)
+
+    thread = threading.Thread(target=download, args=(tmp_path, "new.dem", 0.2))
+    thread.start()
+    found = scrape_util.monitor_folder_for_changes(str(tmp_path), known_files, timeout=10, poll_interval=0.1)
+    thread.join()
+
+    assert found == [str(tmp_path / "new.dem")]
+    assert (tmp_path / "new.dem").stat().st_size == 4004
+
+
+def test_monitor_without_new_files_times_out(tmp_path):
+    (tmp_path / "old.dem").write_bytes(b"old")
+    known_files = scrape_util.list_files(tmp_path)
+
+    start = time.time()
+    assert scrape_util.monitor_folder_for_changes(str(tmp_path), known_files, timeout=0.5, poll_interval=0.1) == []
+    assert time.time() - start < 5
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+import downsampling
+import spectral
+
+
+def sinusoid_ticks(frequencies, seconds=20, amplitude=2.0, gap_at=None):
+    # Aim oscillating at `frequencies` (Hz) per prop, sampled at the demo tickrate
+    tick = np.arange(seconds * downsampling.TICKRATE)
+    if gap_at is not None:
+        tick = np.where(tick >= gap_at, tick + 10, tick)
+    time = tick / downsampling.TICKRATE
+    return pd.DataFrame({
+        'tick': tick,
+        'name': 'al',
+        'yaw': (amplitude * np.sin(2 * np.pi * frequencies[0] * time)) % 360,
+        'pitch': amplitude * np.sin(2 * np.pi * frequencies[1] * time),
+    })
+
+
+@pytest.mark.parametrize('frequency, band', [(1, 'drift'), (4, 'tracking'), (9, 'micro_correction'), (20, 'tremor')])
+def test_sinusoid_lands_in_band(frequency, band):
+    powers, starts = spectral.window_band_powers(sinusoid_ticks([frequency, frequency]))
+    assert len(starts) == (20 * downsampling.TICKRATE - spectral.window_size - 1) // spectral.hop + 1
+
+    fractions = spectral.band_fractions(powers.mean(axis=0))[0].reshape(len(spectral.spectral_props), len(spectral.bands))
+    # Yaw wraps around 0/360, which must not add power outside the band
+    assert (fractions.argmax(axis=1) == list(spectral.bands).index(band)).all()
+    assert (fractions.max(axis=1) > 0.9).all()
+
+
+def test_windows_skip_gaps():
+    tick = sinusoid_ticks([4, 4], seconds=6, gap_at=200)['tick'].to_numpy()
+    starts = spectral.window_starts(tick)
+    assert len(starts) > 0
+    assert all(tick[start + spectral.window_size] - tick[start] == spectral.window_size for start in starts)
+
+
+def test_spectral_similarity():
+    spectra = spectral.compute_spectra(pd.concat([
+        sinusoid_ticks([4, 4]),
+        sinusoid_ticks([4, 4], amplitude=5).assign(name='bob'),
+        sinusoid_ticks([20, 1]).assign(name='cy'),
+    ]))
+    vectors = spectral.player_vectors(spectra.assign(map='de_mirage', match='m'))
+
+    # The same frequencies at another amplitude are the same aim, other frequencies share no band
+    assert spectral.compute_spectral_similarity(vectors['al'], vectors['bob']) == pytest.approx(1, abs=1e-3)
+    assert spectral.compute_spectral_similarity(vectors['al'], vectors['cy']) < 0.1
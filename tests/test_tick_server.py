@@ -0,0 +1,88 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+import pytest
+import cache
+import synthetic
+import tick_server
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('demos')
+    # Module scoped, so the function scoped monkeypatch fixture can't be used
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(cache, 'cache_dir', str(folder / 'cache'))
+        ticks = synthetic.generate_ticks(20_000, ticks_per_match=1000, list_props=False, seed=0)
+        synthetic.write_parsed_demos(ticks, str(folder), tick_server.server_props)
+        tick_server.load_store(str(folder))
+
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), tick_server.QueryHandler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        yield f"http://127.0.0.1:{httpd.server_address[1]}"
+        httpd.shutdown()
+        httpd.server_close()
+
+    for state in [tick_server.store, tick_server._new_profiles, tick_server._occupancy, tick_server._fractions]:
+        state.clear()
+
+
+def get(server, path):
+    try:
+        with urllib.request.urlopen(server + path) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+@pytest.mark.parametrize('path, parameter', [
+    ('/similarity', 'player'),
+    ('/heatmap?map=de_mirage', 'player'),
+    ('/heatmap?player=ZywOo', 'map'),
+    ('/fractions', 'fields'),
+])
+def test_missing_parameters_are_bad_requests(server, path, parameter):
+    status, body = get(server, path)
+    assert status == 400
+    assert body['error'] == f"Missing required parameter '{parameter}' for {path.split('?')[0].strip('/')}"
+
+
+def test_unknown_player_is_not_found(server):
+    status, body = get(server, '/similarity?player=nobody')
+    assert status == 404
+    assert body['error'] == 'nobody not found'
+
+
+def test_fraction_table_is_cached(server):
+    first = tick_server.fraction_table(['ducking'], True, ['side'], ['ZywOo', 'flameZ'])
+    assert tick_server.fraction_table(['ducking'], True, ['side'], ['flameZ', 'ZywOo']) is first
+    assert tick_server.fraction_table(['ducking'], False, ['side'], ['flameZ', 'ZywOo']) is not first
+    assert set(first['name']) == {'ZywOo', 'flameZ'}
+    assert set(first['side']) <= {'T', 'CT'}
+
+    status, body = get(server, '/fractions?fields=ducking&velocity_bands=true&split=side&players=flameZ,ZywOo')
+    assert status == 200
+    assert len(body['table']) == len(first)
+
+
+def test_unexpected_errors_are_internal_errors(server, monkeypatch):
+    def handle_query(endpoint, params):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(tick_server, 'handle_query', handle_query)
+
+    status, body = get(server, '/status')
+    assert status == 500
+    assert 'boom' in body['error']
+
+
+def test_concurrent_queries_share_one_table(server):
+    path = '/fractions?fields=is_airborne&split=side'
+    with ThreadPoolExecutor(8) as pool:
+        answers = list(pool.map(lambda _: get(server, path), range(16)))
+
+    assert all(status == 200 for status, _ in answers)
+    assert all(body == answers[0][1] for _, body in answers)
+    assert sum(key[0] == ('is_airborne',) for key in tick_server._fractions) == 1
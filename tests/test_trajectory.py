@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+import trajectory
+
+
+def random_paths(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.normal(0, 50, (count, trajectory.path_length, 2)), axis=1)
+
+
+def reference_dtw(query, candidate):
+    # Textbook DTW with the same band and mean over the matched points
+    n, window = trajectory.path_length, trajectory.warp_window
+    costs = np.full((n + 1, n + 1), np.inf)
+    costs[0, 0] = 0
+    for i in range(1, n + 1):
+        for j in range(max(1, i - window), min(n, i + window) + 1):
+            costs[i, j] = np.linalg.norm(query[i - 1] - candidate[j - 1]) + min(costs[i - 1, j], costs[i, j - 1], costs[i - 1, j - 1])
+    return costs[n, n] / n
+
+
+def test_dtw_matches_reference():
+    paths = random_paths(5)
+    distances = trajectory.dtw_distances(paths[0], paths)
+    assert distances[0] == 0
+    np.testing.assert_allclose(distances, [reference_dtw(paths[0], path) for path in paths])
+
+
+def test_lb_keogh_is_a_lower_bound():
+    paths = random_paths(200, seed=1)
+    for query in paths[:5]:
+        assert np.all(trajectory.lb_keogh(query, paths) <= trajectory.dtw_distances(query, paths) + 1e-9)
+
+
+def test_early_abandon_keeps_the_distances_below_the_threshold():
+    paths = random_paths(100, seed=2)
+    exact = trajectory.dtw_distances(paths[0], paths[1:])
+    threshold = np.median(exact)
+
+    abandoned = trajectory.dtw_distances(paths[0], paths[1:], threshold)
+    kept = exact <= threshold
+    np.testing.assert_allclose(abandoned[kept], exact[kept])
+    assert np.all(np.isinf(abandoned[~kept]) | (abandoned[~kept] == exact[~kept]))
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 256])
+def test_pruned_search_finds_the_nearest_path(monkeypatch, batch_size):
+    monkeypatch.setattr(trajectory, 'batch_size', batch_size)
+    paths = random_paths(300, seed=3)
+    for query in random_paths(5, seed=4):
+        assert trajectory.nearest_distance(query, paths) == pytest.approx(trajectory.dtw_distances(query, paths).min())
+
+
+def test_round_paths_resample_each_round():
+    ticks = pd.DataFrame({
+        'match': 'm1',
+        'round': [1] * 5 + [2] * 3,
+        'name': 'ZywOo',
+        'tick': [0, 1, 2, 3, 4, 10, 11, 12],
+        'X': [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 5.0, 5.0],
+        'Y': [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 2.0, 4.0],
+    })
+    paths = trajectory.round_paths(ticks.iloc[::-1])
+
+    assert paths.shape == (2, trajectory.path_length, 2)
+    np.testing.assert_allclose(paths[0, :, 0], np.linspace(0, 4, trajectory.path_length))
+    np.testing.assert_allclose(paths[1, :, 1], np.linspace(0, 4, trajectory.path_length))
+    assert trajectory.round_paths(ticks.iloc[:0]).shape == (0, trajectory.path_length, 2)
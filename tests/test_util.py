@@ -0,0 +1,81 @@
+import json
+import os
+import pytest
+import util
+
+
+def write_demo(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(content)
+    return str(path)
+
+
+def write_store(demo_file, content_hash):
+    os.makedirs(demo_file + util.PARSED_DEMO_SUFFIX)
+    with open(demo_file + util.PARSED_DEMO_SUFFIX + '/info.json', 'w') as file:
+        json.dump({'hash': content_hash}, file)
+
+
+def test_duplicates_in_folder(tmp_path):
+    first = write_demo(tmp_path / 'a' / 'match.dem', b'demo one')
+    write_demo(tmp_path / 'b' / 'copy.dem', b'demo one')
+    other = write_demo(tmp_path / 'b' / 'other.dem', b'demo two')
+
+    duplicates = []
+    found = util.find_demo_files(str(tmp_path), duplicates=duplicates)
+
+    assert [demo_file for _, demo_file in found] == [os.path.normpath(first), os.path.normpath(other)]
+    assert [(duplicate['match'], duplicate['duplicate_of']) for duplicate in duplicates] == [('b_copy.dem', 'a_match.dem')]
+    assert duplicates[0]['hash'] == util.demo_hash(first)
+
+
+def test_exclude_hashes(tmp_path):
+    write_demo(tmp_path / 'new' / 'match.dem', b'demo one')
+    kept = write_demo(tmp_path / 'known' / 'other.dem', b'demo two')
+    write_demo(tmp_path / 'known' / 'copy.dem', b'demo one')
+
+    duplicates = []
+    new_hashes = util.find_demo_hashes(str(tmp_path / 'new'))
+    found = util.find_demo_files(str(tmp_path / 'known'), exclude_hashes=new_hashes, duplicates=duplicates)
+
+    assert [demo_file for _, demo_file in found] == [os.path.normpath(kept)]
+    assert [(duplicate['match'], duplicate['duplicate_of']) for duplicate in duplicates] == [('known_copy.dem', 'excluded')]
+
+
+def test_parsed_store_without_dem(tmp_path):
+    demo_file = write_demo(tmp_path / 'a' / 'match.dem', b'demo one')
+    content_hash = util.demo_hash(demo_file)
+    write_store(demo_file, content_hash)
+    os.remove(demo_file)
+    copy = write_demo(tmp_path / 'b' / 'copy.dem', b'demo one')
+    write_store(str(tmp_path / 'b' / 'gone.dem'), None)
+
+    duplicates = []
+    found = util.find_demo_files(str(tmp_path), duplicates=duplicates)
+
+    # The deleted demo keeps its identity through its store, a store without a hash is always kept
+    assert [name for name, _ in found] == ['a_match.dem', 'b_gone.dem']
+    assert [duplicate['demo_file'] for duplicate in duplicates] == [os.path.normpath(copy)]
+
+
+def test_demo_hash_reuses_stored_hash(tmp_path):
+    demo_file = write_demo(tmp_path / 'match.dem', b'demo one')
+    write_store(demo_file, 'stored')
+    assert util.demo_hash(demo_file) == 'stored'
+
+
+def test_write_dedup_report(tmp_path):
+    path = str(tmp_path / 'figures' / 'dedup_report.csv')
+    util.write_dedup_report([{'match': 'b_copy.dem', 'demo_file': 'b/copy.dem', 'duplicate_of': 'a_match.dem', 'hash': 'h'}], path)
+    with open(path) as file:
+        assert file.read().splitlines() == ['match,demo_file,duplicate_of,hash', 'b_copy.dem,b/copy.dem,a_match.dem,h']
+
+
+def test_watch_folder_reports_changes_before_first_next(tmp_path):
+    pytest.importorskip('inotify_simple')
+    watcher = util.watch_folder(str(tmp_path), poll_interval=0.1)
+    # Written after the watch was created but before it was first read, like lines appended during a full scan
+    (tmp_path / 'server_001.log').write_text('line\n')
+    assert str(tmp_path / 'server_001.log') in next(watcher)
+    watcher.close()
@@ -0,0 +1,242 @@
+import json
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+from argparse import Namespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+import numpy as np
+import pandas as pd
+import util
+import merge_demo_files as merger
+import downsampling
+import boxplots
+import heatmaps
+import kernels
+import player_similarity
+
+# Props kept in memory, covering the similarity, boolean fraction and heatmap queries
+server_props = ['X', 'Y', 'Z', 'velocity', 'pitch', 'yaw', 'ducking', 'is_airborne', 'duck_amount', 'team_num']
+
+# Loaded once at startup by `load_store`, and only read afterwards
+store = {}
+# Query caches, shared by the handler threads and only filled under their lock
+# Profiles of new demo folders per map, built on their first similarity query
+_new_profiles = {}
+_new_profiles_lock = threading.Lock()
+# Occupancy grids per (player, map, min_vel), built on their first heatmap query
+_occupancy = {}
+_occupancy_lock = threading.Lock()
+# Summary tables per (fields, velocity_bands, split, players, map), built on their first fractions query
+_fractions = {}
+_fractions_lock = threading.Lock()
+
+
+def build_profiles(ticks: pd.DataFrame) -> dict:
+    """
+    Location sketches per (match, player), see `player_similarity.accumulate_location_sketches`.
+    Keeping them per match lets a query leave out any set of matches without touching the ticks.
+    """
+    profiles = {}
+    for (match, map_name), match_ticks in ticks.groupby(['match', 'map'], sort=False):
+        sketches = {}
+        player_similarity.accumulate_location_sketches(sketches, match_ticks)
+        for player, sketch in sketches.items():
+            profiles[(match, player)] = (map_name, sketch)
+    return profiles
+
+
+def load_store(folder: str, limit: int = None, live_only: bool = False, downsample: str = None):
+    """
+    Loads the demos in `folder` into memory: the merged ticks, partitioned by map, and the player profiles.
+    """
+    start = perf_counter()
+    ticks, _ = merger.merge_demo_files(folder, server_props, limit=limit, annotate_rounds=True, live_only=live_only, downsample=downsample)
+    demo_files = util.find_demo_files(folder, limit=limit)
+
+    store.update({
+        'folder': folder,
+        'ticks': ticks,
+        'partitions': {map_name: map_ticks for map_name, map_ticks in ticks.groupby('map', sort=False)},
+        'profiles': build_profiles(ticks),
+        'hashes': {name: util.demo_hash(demo_file) for name, demo_file in demo_files},
+        'live_only': live_only,
+        'downsample': downsample,
+    })
+    print(f"Loaded {len(ticks)} ticks of {ticks['match'].nunique()} matches in {perf_counter() - start:.1f}s")
+
+
+def get_new_profiles(new_folder: str, map_name: str = None) -> tuple[dict, set]:
+    """
+    Location sketches per player of the demos in `new_folder`, and their content hashes. Built once per folder and map.
+    """
+    key = (new_folder, map_name)
+    with _new_profiles_lock:
+        if key not in _new_profiles:
+            sketches, _ = player_similarity.build_location_sketches(new_folder, map_name, live_only=store['live_only'], downsample=store['downsample'])
+            _new_profiles[key] = (sketches, util.find_demo_hashes(new_folder))
+        return _new_profiles[key]
+
+
+def sum_sketches(map_name: str = None, exclude_matches: set = (), player: str = None) -> dict:
+    sketches = {}
+    for (match, profile_player), (profile_map, sketch) in store['profiles'].items():
+        if match in exclude_matches or (map_name and profile_map != map_name) or (player and profile_player != player):
+            continue
+        if profile_player in sketches:
+            sketches[profile_player] = (sketches[profile_player][0] + sketch[0], sketches[profile_player][1] + sketch[1])
+        else:
+            sketches[profile_player] = sketch
+    return sketches
+
+
+def rank_players(player: str, map_name: str = None, new_folder: str = None) -> list:
+    """
+    Ranks the players in the store by location similarity to `player`, from the demos in `new_folder`,
+    or from the store itself when no new folder is given. Matches present in both are only used as new demos.
+    """
+    if new_folder:
+        new_sketches, new_hashes = get_new_profiles(new_folder, map_name)
+        exclude_matches = {match for match, content_hash in store['hashes'].items() if content_hash in new_hashes}
+        new_sketch = new_sketches.get(player)
+    else:
+        exclude_matches = set()
+        new_sketch = sum_sketches(map_name, player=player).get(player)
+
+    if new_sketch is None:
+        raise LookupError(f"{player} not found")
+
+    known_sketches = sum_sketches(map_name, exclude_matches)
+    similarities = [(known_player, player_similarity.compute_location_similarity_sketch(new_sketch, sketch)) for known_player, sketch in known_sketches.items()]
+    similarities.sort(key=lambda x: x[1], reverse=True)
+    return similarities
+
+
+def fraction_table(fields: list, velocity_bands: bool = False, split: list = (), players: list = None, map_name: str = None) -> pd.DataFrame:
+    """
+    Same table as `boxplots.compute_summary_table`, computed from the ticks in memory.
+    """
+    key = (tuple(fields), velocity_bands, tuple(split), tuple(sorted(players)) if players else None, map_name)
+    with _fractions_lock:
+        if key not in _fractions:
+            ticks = store['partitions'].get(map_name, store['ticks'].iloc[:0]) if map_name else store['ticks']
+            missing = [field for field in fields if field not in ticks.columns]
+            if missing:
+                raise ValueError(f"Fields {missing} are not loaded by the server, it loads {server_props}")
+
+            if players:
+                ticks = ticks[ticks['name'].isin(players)]
+            ticks, fields = boxplots.prepare_ticks(ticks, Namespace(fields=fields, velocity_bands=velocity_bands))
+            _fractions[key] = boxplots.compute_summary_table(ticks, fields, ['name', 'match'] + list(split))
+        return _fractions[key]
+
+
+def occupancy_grid(player: str, map_name: str, min_vel: float = None) -> np.ndarray:
+    key = (player, map_name, min_vel)
+    with _occupancy_lock:
+        if key not in _occupancy:
+            ticks = store['partitions'].get(map_name, store['ticks'].iloc[:0])
+            ticks = ticks[ticks['name'] == player]
+            if min_vel:
+                ticks = ticks[ticks['velocity'] > min_vel]
+            grids = {}
+            heatmaps.accumulate_occupancy(grids, ticks)
+            _occupancy[key] = grids.get((player, map_name))
+        grid = _occupancy[key]
+    if grid is None:
+        raise LookupError(f"{player} not found on {map_name}")
+    return grid
+
+
+def handle_query(endpoint: str, params: dict):
+    """
+    Answers a query from the parsed query string. List parameters are comma separated.
+    """
+    def as_list(name):
+        return [value for value in params.get(name, '').split(',') if value]
+
+    def required(name):
+        # Missing parameters are a bad request, not a missing player or map
+        if not params.get(name):
+            raise ValueError(f"Missing required parameter '{name}' for {endpoint}")
+        return params[name]
+
+    if endpoint == 'status':
+        ticks = store['ticks']
+        return {'folder': store['folder'], 'rows': len(ticks), 'matches': ticks['match'].nunique(), 'maps': list(store['partitions']), 'players': sorted(ticks['name'].unique().tolist())}
+    if endpoint == 'similarity':
+        return {'rankings': rank_players(required('player'), params.get('map'), params.get('new_folder'))}
+    if endpoint == 'fractions':
+        required('fields')
+        table = fraction_table(as_list('fields'), params.get('velocity_bands') == 'true', as_list('split'), as_list('players') or None, params.get('map'))
+        return {'table': json.loads(table.to_json(orient='records'))}
+    if endpoint == 'heatmap':
+        return {'edges': kernels.location_edges.tolist(), 'counts': occupancy_grid(required('player'), required('map'), float(params.get('min_vel', 0))).tolist()}
+    raise LookupError(f"Unknown endpoint {endpoint}")
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            status, body = 200, handle_query(url.path.strip('/'), params)
+        except LookupError as e:
+            status, body = 404, {'error': str(e)}
+        except (ValueError, TypeError) as e:
+            status, body = 400, {'error': str(e)}
+        except Exception as e:
+            # Any other failure is a bug of the server, the client still gets a JSON answer instead of a dropped connection
+            print(f"Error: {self.path} failed: {e!r}")
+            status, body = 500, {'error': f"Internal error: {e!r}"}
+
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def query(server: str, endpoint: str, **params) -> dict:
+    """
+    Client side of the server: sends a query and returns the decoded answer. List parameters are sent comma separated.
+    """
+    params = {name: ','.join(value) if isinstance(value, (list, tuple)) else str(value).lower() if isinstance(value, bool) else value
+              for name, value in params.items() if value is not None}
+    url = f"{server.rstrip('/')}/{endpoint}?{urllib.parse.urlencode(params)}"
+    try:
+        with urllib.request.urlopen(url) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"{endpoint} query failed: {json.load(e).get('error', e.reason)}") from None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep the ticks of a demo folder in memory, and answer similarity, boolean fraction and heatmap queries over local HTTP')
+    parser.add_argument('folder', type=util.dir_path, help='Path to the folder containing .dem files')
+    parser.add_argument('--limit', type=int, default=None, help='Limit the number of demo files to load')
+    parser.add_argument('--live_only', action='store_true', help='Only keep ticks where a round is being played')
+    parser.add_argument('--downsample', type=downsampling.downsample_spec, default=None, help=f'Ticks to keep, {downsampling.usage}. Defaults to every tick')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on, only local by default')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    args = parser.parse_args()
+
+    load_store(args.folder, args.limit, args.live_only, args.downsample)
+
+    server = ThreadingHTTPServer((args.host, args.port), QueryHandler)
+    print(f"Serving {args.folder} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
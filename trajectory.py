@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import profiling
+
+# Points every round path is resampled to, so paths of rounds with different lengths can be compared
+path_length = 64
+# Sakoe-Chiba band of the warping, in resampled points. Also the width of the LB_Keogh envelope
+warp_window = 6
+# Candidates compared with the exact DTW at once
+batch_size = 256
+# Mean distance between matched points, in world units, at which two paths are considered completely different
+max_distance = 1200
+
+
+def round_paths(ticks: pd.DataFrame) -> np.ndarray:
+    """
+    Resamples the (X, Y) path of every (match, round, player) in `ticks` to `path_length` points,
+    by linear interpolation over the ticks of the round. Only live ticks are used if the ticks have a phase.
+
+    :param ticks: Ticks with 'match', 'round', 'name', 'tick', 'X' and 'Y' columns, see `rounds.assign_phases`
+    :return: Array of shape (paths, path_length, 2)
+    """
+    if 'phase' in ticks.columns:
+        ticks = ticks[ticks['phase'] == 'live']
+    ticks = ticks.sort_values(['match', 'round', 'name', 'tick'], kind='stable')
+    if ticks.empty:
+        return np.empty((0, path_length, 2))
+
+    keys = ticks[['match', 'round', 'name']]
+    is_start = (keys != keys.shift()).any(axis=1).to_numpy()
+    starts = np.flatnonzero(is_start)
+    lengths = np.diff(np.append(starts, len(ticks)))
+
+    # Fractional row of every resampled point, interpolated between the two rows around it
+    position = starts[:, None] + np.linspace(0, 1, path_length)[None, :] * (lengths - 1)[:, None]
+    lower = np.floor(position).astype('int64')
+    upper = np.minimum(lower + 1, (starts + lengths - 1)[:, None])
+    fraction = (position - lower)[..., None]
+
+    points = ticks[['X', 'Y']].to_numpy(dtype='float64')
+    return points[lower] * (1 - fraction) + points[upper] * fraction
+
+
+def lb_keogh(query: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """
+    LB_Keogh lower bound of the DTW distance between `query` and every path in `candidates`: the distance of every
+    candidate point to the envelope of the query points it can be warped to. Never larger than `dtw_distances`.
+    """
+    padded = np.pad(query, ((warp_window, warp_window), (0, 0)), mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * warp_window + 1, axis=0)
+    upper, lower = windows.max(axis=-1), windows.min(axis=-1)
+
+    excess = np.maximum(candidates - upper, 0) + np.maximum(lower - candidates, 0)
+    return np.sqrt((excess ** 2).sum(axis=-1)).sum(axis=-1) / path_length
+
+
+def dtw_distances(query: np.ndarray, candidates: np.ndarray, abandon_above: float = np.inf) -> np.ndarray:
+    """
+    DTW distance between `query` and every path in `candidates`, within the `warp_window` band, computed for all
+    candidates at once one row of the cost matrix at a time. Candidates whose cheapest partial warping path already
+    costs more than `abandon_above` are abandoned, and get an infinite distance.
+
+    :return: Mean distance between the matched points of every candidate
+    """
+    distances = np.full(len(candidates), np.inf)
+    active = np.arange(len(candidates))
+    previous = None
+    for i in range(path_length):
+        first, last = max(0, i - warp_window), min(path_length, i + warp_window + 1)
+        cost = np.sqrt(((candidates[active, first:last] - query[i]) ** 2).sum(axis=-1))
+
+        row = np.full((len(active), path_length), np.inf)
+        for j in range(first, last):
+            best = np.full(len(active), np.inf) if i > 0 or j > 0 else np.zeros(len(active))
+            if previous is not None:
+                best = np.minimum(best, previous[:, j])
+                if j > 0:
+                    best = np.minimum(best, previous[:, j - 1])
+            if j > first:
+                best = np.minimum(best, row[:, j - 1])
+            row[:, j] = cost[:, j - first] + best
+
+        # Every warping path crosses this row, so its cheapest cell bounds the final cost
+        keep = row.min(axis=1) <= abandon_above * path_length
+        active, previous = active[keep], row[keep]
+        if len(active) == 0:
+            return distances
+
+    distances[active] = previous[:, -1] / path_length
+    return distances
+
+
+def nearest_distance(query: np.ndarray, candidates: np.ndarray) -> float:
+    """
+    Distance from `query` to its nearest neighbour in `candidates`. Candidates are compared in order of their lower
+    bound, and stop being compared once the lower bound of the rest exceeds the best distance found.
+    """
+    bounds = lb_keogh(query, candidates)
+    order = np.argsort(bounds)
+    best = np.inf
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        batch = batch[bounds[batch] < best]
+        if len(batch) == 0:
+            break
+        best = min(best, dtw_distances(query, candidates[batch], best).min())
+    return best
+
+
+def round_distances(new_features: pd.DataFrame, known_features: pd.DataFrame) -> np.ndarray:
+    """
+    Distance from every round path of the new player to the most similar round path of the known player.
+
+    :param new_features: Ticks with round annotations, see `round_paths`
+    :param known_features: Ticks with round annotations, see `round_paths`
+    :return: One distance per round of the new player, empty if either player has no rounds
+    """
+    with profiling.stage('trajectory'):
+        new_paths = round_paths(new_features)
+        known_paths = round_paths(known_features)
+        profiling.count(len(new_paths) * len(known_paths))
+        if len(new_paths) == 0 or len(known_paths) == 0:
+            return np.empty(0)
+        return np.array([nearest_distance(path, known_paths) for path in new_paths])
+
+
+def distance_similarity(distance):
+    return 1 - np.minimum(distance / max_distance, 1.0)
+
+
+def compute_trajectory_similarity(new_features: pd.DataFrame, known_features: pd.DataFrame) -> float:
+    """
+    Compares how two players move through their rounds: every round path of the new player is matched to the most
+    similar round path of the known player with dynamic time warping, and the mean distance is normalized.
+    """
+    distances = round_distances(new_features, known_features)
+    if len(distances) == 0:
+        return 0
+    return distance_similarity(distances.mean())
@@ -1,15 +1,18 @@
-import hashlib
 import os
-import pickle
+import json
+import hashlib
 from typing import List
 import pandas as pd
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from time import sleep
-from demoparser2 import DemoParser
 import argparse
-from tqdm import tqdm
 import numpy as np
+import cache
+import profiling
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
 
 def get_files_with_extension(path, extension) -> List[str]:
     if not extension.startswith('.'):
@@ -25,61 +28,132 @@ def get_files_with_extension(path, extension) -> List[str]:
 
 
 
-def wait_for_after_content(driver, element_locator, expected_content, timeout=10):
-    # Wait for the element to be present in the DOM
-    element = WebDriverWait(driver, timeout).until(
-        EC.presence_of_element_located(element_locator)
-    )
-    
-    # Wait until the ::after content matches the expected value
-    WebDriverWait(driver, timeout).until(
-        lambda driver: driver.execute_script("""
-            var element = arguments[0];
-            var styles = window.getComputedStyle(element, '::after');
-            return styles.getPropertyValue('content') === arguments[1];
-        """, element, expected_content)
-    )
-
-def monitor_folder_for_changes(folder_path):
-    # Ensure the folder exists
-    if not os.path.exists(folder_path):
-        print("Folder not found")
-        return
-
-    # Dictionary to store the file size for each file in the folder
-    file_sizes = {}
-
-    # Initialize the file_sizes dictionary with the current sizes of files
-    for file_name in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, file_name)
-        if os.path.isfile(file_path):  # Only monitor files, not subdirectories
-            file_sizes[file_path] = os.path.getsize(file_path)
-
-    # Monitor files in the folder
-    while True:
-        all_files_stable = True  # Flag to track if all files have stabilized
-        for file_path in file_sizes.keys():
-            if not os.path.exists(file_path):
-                continue
-            size1 = os.path.getsize(file_path)
-            sleep(1)
-            if not os.path.exists(file_path):
-                continue
-            size2 = os.path.getsize(file_path)
-
-            # If the size of the file has not changed, it's considered stable
-            if size1 != size2:
-                all_files_stable = False
-
-        # Exit the loop when all files are stable
-        if all_files_stable:
-            break
+def watch_folder(folder_path, poll_interval: float = 0.5):
+    """
+    Yields whenever the contents of `folder_path` may have changed, and at least every `poll_interval` seconds.
+    Uses inotify when inotify_simple is installed, and falls back to polling otherwise.
+    The watch is installed by this call, not by the first `next`, so changes made in between are reported too.
 
+    :return: Generator of the changed file paths, or None when the changes are unknown (polling)
+    """
+    if INotify is None:
+        return _poll_folder(poll_interval)
+
+    inotify = INotify()
+    inotify.add_watch(folder_path, flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO)
+    return _read_folder_events(inotify, folder_path, poll_interval)
+
+def _poll_folder(poll_interval: float):
+    while True:
+        sleep(poll_interval)
+        yield None
+
+def _read_folder_events(inotify, folder_path, poll_interval: float):
+    with inotify:
+        while True:
+            events = inotify.read(timeout=int(poll_interval * 1000))
+            yield [os.path.join(folder_path, event.name) for event in events]
+
+# Suffix of the folder a demo is parsed into, next to its .dem file
+PARSED_DEMO_SUFFIX = '.parsed'
+
+def get_match_name(demo_file: str) -> str:
+    parent_folder_name = os.path.basename(os.path.dirname(demo_file))
+    name = os.path.basename(demo_file)
+    return f"{parent_folder_name}_{name}"
+
+# Bytes read from each end of a .dem file for its content hash
+HASH_CHUNK_BYTES = 1024 * 1024
+
+DEDUP_REPORT_FILE = './figures/dedup_report.csv'
+
+def demo_hash(demo_file: str) -> str:
+    """
+    Fast content hash of a demo: its size and the first and last HASH_CHUNK_BYTES, which contain the header and the
+    final tick, so copies of the same demo under other names or folders get the same hash.
+    Parsed demos use the hash recorded in their parsed store instead of reading the .dem again, which also identifies
+    demos whose .dem file was deleted. Returns None for a deleted demo whose store has no hash.
+    """
+    info_file = demo_file + PARSED_DEMO_SUFFIX + '/info.json'
+    if os.path.isfile(info_file):
+        with open(info_file, 'r') as file:
+            content_hash = json.load(file).get('hash')
+        if content_hash is not None or not os.path.isfile(demo_file):
+            return content_hash
+    elif not os.path.isfile(demo_file):
+        return None
+
+    size = os.path.getsize(demo_file)
+    digest = hashlib.blake2b(str(size).encode('utf-8'), digest_size=16)
+    with open(demo_file, 'rb') as file:
+        digest.update(file.read(HASH_CHUNK_BYTES))
+        if size > HASH_CHUNK_BYTES:
+            file.seek(max(size - HASH_CHUNK_BYTES, HASH_CHUNK_BYTES))
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def write_dedup_report(duplicates: List[dict], path: str = DEDUP_REPORT_FILE):
+    """
+    Writes the duplicates collected by `find_demo_files` during a run, once, from the entry point of the run.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.DataFrame(duplicates, columns=['match', 'demo_file', 'duplicate_of', 'hash']).to_csv(path, index=False)
+    if duplicates:
+        print(f"Skipped {len(duplicates)} duplicate demos, see {path}")
+
+def find_demo_files(folder_path, limit: int = None, exclude_hashes: set = None, duplicates: List[dict] = None) -> List[tuple[str, str]]:
+    """
+    Finds all demos in a folder, as (match name, .dem path) tuples.
+    Demos that were parsed into a `.dem.parsed` store and whose .dem file was deleted afterwards are included as well.
+
+    Demos with the same content hash are only returned once, see `demo_hash`, so nothing is parsed or counted twice.
+
+    :param exclude_hashes: Hashes of demos to skip as well, e.g. from `find_demo_hashes` on another folder
+    :param duplicates: List the skipped duplicates are appended to, for `write_dedup_report`
+    """
+    demo_files = []
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith('.dem'):
+                demo_files.append(os.path.normpath(os.path.join(root, file)))
+        for dir in dirs:
+            if dir.endswith('.dem' + PARSED_DEMO_SUFFIX) and dir[:-len(PARSED_DEMO_SUFFIX)] not in files:
+                demo_files.append(os.path.normpath(os.path.join(root, dir[:-len(PARSED_DEMO_SUFFIX)])))
+
+    seen = {content_hash: 'excluded' for content_hash in exclude_hashes} if exclude_hashes else {}
+    unique_files = []
+    for demo_file in demo_files:
+        content_hash = demo_hash(demo_file)
+        name = get_match_name(demo_file)
+        if content_hash is not None and content_hash in seen:
+            if duplicates is not None:
+                duplicates.append({'match': name, 'demo_file': demo_file, 'duplicate_of': seen[content_hash], 'hash': content_hash})
+            continue
+        if content_hash is not None:
+            seen[content_hash] = name
+        unique_files.append(demo_file)
+
+    skipped = len(demo_files) - len(unique_files)
+    print(f"Found {len(unique_files)} demo files" + (f", skipped {skipped} duplicates" if skipped else ""))
+
+    if limit:
+        unique_files = unique_files[:limit]
+
+    return [(get_match_name(demo_file), demo_file) for demo_file in unique_files]
+
+def find_demo_hashes(folder_path, limit: int = None, duplicates: List[dict] = None) -> set:
+    """
+    Content hashes of the demos `find_demo_files` returns for a folder.
+    """
+    return {demo_hash(demo_file) for _, demo_file in find_demo_files(folder_path, limit=limit, duplicates=duplicates)} - {None}
+
+def parse_demos_from_folder(folder_path, limit: int = None) -> List[tuple[str, 'DemoParser']]:
+    from demoparser2 import DemoParser
+    from tqdm import tqdm
 
-def parse_demos_from_folder(folder_path, limit: int = None) -> List[tuple[str, DemoParser]]:
     # Find all .dem files in the folder
-    demo_files = get_files_with_extension(folder_path, '.dem')
-    print(f"Found {len(demo_files)} demo files")
+    demo_files = [(name, demo_file) for name, demo_file in find_demo_files(folder_path) if os.path.isfile(demo_file)]
 
     parsers = []
 
@@ -87,13 +161,11 @@ def parse_demos_from_folder(folder_path, limit: int = None) -> List[tuple[str, D
     if limit and limit < total:
         total = limit
         
-    for demo_file in tqdm(demo_files, desc="Parsing demo files", total=total):
+    for name, demo_file in tqdm(demo_files, desc="Parsing demo files", total=total):
         if limit and len(parsers) >= limit:
             break
         
-        parent_folder_name = os.path.basename(os.path.dirname(demo_file))
-        name = os.path.basename(demo_file)
-        parsers.append((f"{parent_folder_name}_{name}", DemoParser(demo_file)))
+        parsers.append((name, DemoParser(demo_file)))
 
     
     return parsers
@@ -121,22 +193,26 @@ def dir_path(path):
         raise argparse.ArgumentTypeError(f"{path} is not a valid directory")
     
 def split_list_columns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.dropna().copy()  # Drop None/NaN rows and avoid modifying original DataFrame
+    from tqdm import tqdm
 
-    for col in tqdm(df.columns, desc="Splitting columns", total=len(df.columns)):
-        valid_rows = df[col].notna()
-        if valid_rows.any():  # Ensure there are valid rows to process
-            first_valid = df.loc[valid_rows, col].iloc[0]
+    with profiling.stage('split_list_columns'):
+        profiling.count(len(df))
+        df = df.dropna().copy()  # Drop None/NaN rows and avoid modifying original DataFrame
+
+        for col in tqdm(df.columns, desc="Splitting columns", total=len(df.columns)):
+            valid_rows = df[col].notna()
+            if valid_rows.any():  # Ensure there are valid rows to process
+                first_valid = df.loc[valid_rows, col].iloc[0]
             
-            if isinstance(first_valid, (list, np.ndarray)) and len(first_valid) in [2, 3]:
-                # Convert list column to DataFrame and assign directly
-                expanded_df = pd.DataFrame(df.loc[valid_rows, col].to_list(), index=df.index[valid_rows])
-                expanded_df.columns = [f"{col}_X", f"{col}_Y"] if len(first_valid) == 2 else [f"{col}_X", f"{col}_Y", f"{col}_Z"]
+                if isinstance(first_valid, (list, np.ndarray)) and len(first_valid) in [2, 3]:
+                    # Convert list column to DataFrame and assign directly
+                    expanded_df = pd.DataFrame(df.loc[valid_rows, col].to_list(), index=df.index[valid_rows])
+                    expanded_df.columns = [f"{col}_X", f"{col}_Y"] if len(first_valid) == 2 else [f"{col}_X", f"{col}_Y", f"{col}_Z"]
 
-                df = df.drop(columns=[col])  # Drop original column
-                df = df.join(expanded_df)  # Join expanded columns back
+                    df = df.drop(columns=[col])  # Drop original column
+                    df = df.join(expanded_df)  # Join expanded columns back
         
-    return df
+        return df
 
 # def split_list_columns(df: pd.DataFrame) -> pd.DataFrame:
 #     for col in tqdm(df.columns, desc="Splitting columns", total=len(df.columns)):
@@ -155,19 +231,8 @@ def split_list_columns(df: pd.DataFrame) -> pd.DataFrame:
 #             df = df.drop(columns=[col])
 #     return df
 
-def store_cache(data, args):
-    input_hash = hashlib.sha1((str(args)).encode('utf-8')).hexdigest()
-    stored_name = f'./cache/{input_hash}.pkl'
-    print(f"Storing to cache {input_hash}, with args {str(args)}")
-
-    os.makedirs('./cache', exist_ok=True)
-    pickle.dump(data, open(stored_name, 'wb'))
+def store_cache(data, args, files: List[str] = ()):
+    cache.store(data, args, files)
 
-def load_cache(args):
-    input_hash = hashlib.sha1((str(args)).encode('utf-8')).hexdigest()
-    stored_name = f'./cache/{input_hash}.pkl'
-    if os.path.exists(stored_name):
-        print(f"Found stored data in cache {input_hash}, for args {str(args)}")
-        return pickle.load(open(stored_name, 'rb'))
-    
-    return None
\ No newline at end of file
+def load_cache(args, files: List[str] = ()):
+    return cache.load(args, files)